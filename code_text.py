@@ -1,477 +1,913 @@
-
-from PyQt5.QtGui import (QPainter,
-                         QSyntaxHighlighter,
-                         QColor,
-                         QTextCharFormat,
-                         QTextBlockFormat,
-                         QTextCursor,
-                         QTextFormat,
-                         QTextBlock,
-                         )
-from PyQt5.QtCore import (Qt,
-                          QSize,
-                          QRect,
-                          QRegExp,
-                          QPoint,
-                          )
-from PyQt5.QtWidgets import (QPlainTextEdit,
-                             QTextEdit,
-                             QWidget,
-                             QApplication,
-                             )
-
-
-class DefaultHighlighter(QSyntaxHighlighter):
-
-    def highlightBlock(self, text):
-        pass
-
-
-class BrainfuckHighlighter(QSyntaxHighlighter):
-
-    def __init__(self, document):
-        super().__init__(document)
-
-        # Default rules
-        rules = [
-            (r'[\[\]]+', 'loop'),
-            (r'[<>]+', 'pointer'),
-            (r'[+-]+', 'cell'),
-            (r'[.,]+', 'io'),
-            (r'[^<>\-+,.\[\]]+', 'comment')
-        ]
-        self.rules = [(QRegExp(reg), rule) for reg, rule in rules]
-
-        self.set_default_rule_formats()
-        self.set_formats()
-
-    def set_default_rule_formats(self):
-        """Set the default formatting for all the rules."""
-        self.rule_formats = {
-            'loop': QTextCharFormat(),
-            'pointer': QTextCharFormat(),
-            'cell': QTextCharFormat(),
-            'io': QTextCharFormat(),
-            'comment': QTextCharFormat()
-        }
-        self.rule_formats['loop'].setForeground(QColor('red'))
-        self.rule_formats['pointer'].setForeground(QColor('purple'))
-        self.rule_formats['cell'].setForeground(QColor('green'))
-        self.rule_formats['io'].setForeground(QColor('blue'))
-        self.rule_formats['comment'].setForeground(QColor('grey'))
-
-        # for format_ in self.rule_formats.values():
-        #     format_.setBackground(QColor(Qt.white))
-
-    def set_formats(self):
-        """Set the format for each regexp and rehighlight the document.
-        This method should be called whenever the default formatting changes,
-        otherwise, the text won't be updated."""
-        self.formats = [(reg, self.rule_formats[rule]) for reg, rule in self.rules]
-        self.rehighlight()
-
-    def highlightBlock(self, text):
-        """Signal called by default when text is changed. `text` is the text on the
-        current line."""
-        for regexp, format_ in self.formats:
-            index = regexp.indexIn(text)
-            while index >= 0:
-                length = regexp.matchedLength()
-                self.setFormat(index, length, format_)
-                index = regexp.indexIn(text, index + length)
-
-
-class LineNumberArea(QWidget):
-    def __init__(self, text):
-        super().__init__(text)
-        self.text = text
-
-    def sizeHint(self):
-        return QSize(self.text.line_number_area_width(), 0)
-
-    def paintEvent(self, event):
-        self.text.line_number_paint(event)
-
-
-class LineNumberText(QPlainTextEdit):
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-        self.can_undo = False
-
-        self.init_widgets()
-
-    def init_widgets(self):
-
-        self.setLineWrapMode(self.NoWrap)
-
-        self.line_number_area = LineNumberArea(self)
-
-        self.current_line_colour = QColor(Qt.gray).lighter(150)
-        # self.current_block_format = QTextBlockFormat()
-        # self.current_block_format.setBackground(self.current_line_colour)
-        # self.current_block_format.setProperty(QTextFormat.FullWidthSelection, True)
-
-        self.last_block_infos = []
-
-        self.blockCountChanged.connect(self.update_line_number_area_width)
-        self.updateRequest.connect(self.update_line_number_area)
-        self.cursorPositionChanged.connect(self.highlight_current_line)
-
-    def line_number_area_width(self, line=None):
-        """Calculates the spacing required for `line`. If `line` is None,
-        it defaults to the last line in the text."""
-        if line is None:
-            line = self.blockCount()
-
-        # Minimum spacing of 3 chars
-        digits = max(3, len(str(line)))
-
-        space = 3 + self.fontMetrics().averageCharWidth() * digits
-
-        return space
-
-    def update_line_number_area_width(self, lines=None):
-        """Called when the number of lines (blocks) change. `lines` if the total
-        number of lines if called by the signal; otherwise, `lines` may be None."""
-        self.setViewportMargins(self.line_number_area_width(lines), 0, 0, 0)
-
-    def update_line_number_area(self, rect, dy):
-        """Update the current line numbers."""
-        if dy:
-            self.line_number_area.scroll(0, dy)
-        else:
-            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
-
-    def resizeEvent(self, event):
-        """Event called when widget is resized (eg. user dragged the screen).
-        Resize the line numbers spacing."""
-        super().resizeEvent(event)
-
-        contents_rect = self.contentsRect()  # Whole area of whole widget
-        line_number_rect = QRect(contents_rect.left(), contents_rect.top(), self.line_number_area_width(), contents_rect.height())
-        self.line_number_area.setGeometry(line_number_rect)
-        self.update_line_number_area_width()
-
-    def line_number_paint(self, event):
-        """Paint the line numbers on the lines currently in view of the screen."""
-        painter = QPainter(self.line_number_area)
-        painter.fillRect(event.rect(), Qt.lightGray)
-
-        block = self.firstVisibleBlock()
-        block_number = block.blockNumber()
-
-        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
-        bottom = top + self.blockBoundingRect(block).height()
-
-        while block.isValid() and top <= event.rect().bottom():
-            if block.isVisible() and bottom >= event.rect().top():
-                line_number = str(block_number + 1)
-                painter.setPen(Qt.black)
-                painter.drawText(0, top, self.line_number_area.width() - 3, self.fontMetrics().height(), Qt.AlignRight, line_number)
-
-            block = block.next()
-            top = bottom
-            bottom += self.blockBoundingRect(block).height()
-            block_number += 1
-
-    def setFont(self, font):
-        """Set the default font. Resize the line numbers spacing."""
-        super().setFont(font)
-
-        self.update_line_number_area_width()
-
-    def highlight_current_line(self):
-        if self.isReadOnly():
-            return
-
-        extra_selections = []
-
-        selection = QTextEdit.ExtraSelection()
-        selection.cursor = self.textCursor()
-        if selection.cursor.hasSelection():
-            selection.cursor.clearSelection()
-        else:
-            selection.format.setBackground(self.current_line_colour)
-            selection.format.setProperty(QTextFormat.FullWidthSelection, True)
-        extra_selections.append(selection)
-
-        self.setExtraSelections(extra_selections)
-
-        # If I want to expand this to multicursor support, I can create a list of previous
-        # block infos instead.
-
-        # print(self.can_undo)
-
-        # textcursor = self.textCursor()
-        # textcursor.beginEditBlock()
-        # for prev_block, prev_format in self.last_block_infos:
-        #     textcursor.setPosition(prev_block.position())
-        #     textcursor.setBlockFormat(prev_format)
-
-        # self.last_block_infos = []
-        # textcursor.setPosition(self.textCursor().position(), QTextCursor.MoveAnchor)
-        # self.last_block_infos.append((textcursor.block(), textcursor.block().blockFormat()))
-        # textcursor.setBlockFormat(self.current_block_format)
-
-        # textcursor.endEditBlock()
-        # self.textCursor().joinPreviousEditBlock()
-
-    # def focusInEvent(self, event):
-    #     print('LineNumberText.focusInEvent')
-    #     super().focusInEvent(event)
-    #     self.highlight_current_line()
-
-    # def focusOutEvent(self, event):
-    #     print('LineNumberText.focusOutEvent')
-    #     super().focusOutEvent(event)
-    #     self.setExtraSelections([])
-
-    def setReadOnly(self, value):
-        super().setReadOnly(value)
-        if value:
-            self.setExtraSelections([])
-        else:
-            self.highlight_current_line()
-
-
-class CodeText(LineNumberText):
-
-    #############
-
-    # NOTE!:
-    # QPlainTextEdit::setExtraSelections
-    # It can be used to: mark text - for breakpoint!
-
-    # Cursor.setCharFormat can be used set set the format
-    # to simulate multicursor.
-
-    # QPlainTextEdit.cursorForPosition(pos)
-    # can be used to set breakpoint to mouse event
-    # can be bound to QWidget.mousePressEvent(event)
-    # where event is a QMouseEvent
-
-    #############
-
-    HIGHLIGHTER_TYPES = {
-        '.b': BrainfuckHighlighter,
-    }
-
-    def __init__(self, texteditor):
-        super().__init__(texteditor)
-        self.texteditor = texteditor
-
-        self.indentation = '    '
-        self.breakpoints = {}
-        self.breakpoint_background = QColor(Qt.yellow)
-
-        self.highlighter = DefaultHighlighter(self.document())
-
-    def focusInEvent(self, event):
-        super().focusInEvent(event)
-        self.texteditor.editor_window.editor_focus_in()
-
-    # def mousePressEvent(self, event):
-    #     super().mousePressEvent(event)
-    #     if event.button() == Qt.RightButton:
-    #         print('right button')
-    #         print(self.document().characterAt(self.cursorForPosition(event.pos()).position()))
-
-    def mousePressEvent(self, event):
-        button = event.button()
-        modifiers = QApplication.keyboardModifiers()
-
-        if button == Qt.LeftButton and modifiers == Qt.ControlModifier:
-            # print('Add multicursor', event.pos(), event.localPos(), (event.x(), event.y()), self.document().characterAt(self.cursorForPosition(QPoint(0, 0)).position()))
-            self.add_multicursor(event.pos())
-        else:
-            super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        buttons = event.buttons()
-        modifiers = QApplication.keyboardModifiers()
-
-        if buttons == Qt.LeftButton and modifiers == Qt.ControlModifier:
-            print('move multicursor')
-            # self.add_
-        else:
-            super().mousePressEvent(event)
-
-    def add_multicursor(self, pos):
-        # print(self.contentOffset().x(), self.contentOffset().y())
-        # text_cursor = self.cursorForPosition(pos)
-        # text_cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-        # f = QTextCharFormat()
-        # f.setBackground(QColor(Qt.green))
-        # text_cursor.setCharFormat(f)
-
-        # text_cursor = self.cursorForPosition(pos)
-        # selection = QTextEdit.ExtraSelection()
-        # selection.cursor = text_cursor
-
-        # self.setExtraSelections([selection])
-        pass
-
-    def keyPressEvent(self, event):
-        key = event.key()
-        # modifiers = QApplication.keyboardModifiers()
-
-        # if key == Qt.Key_Q and modifiers == Qt.ControlModifier:
-        #     self.set_breakpoint()
-
-        special_key = True
-        if key == Qt.Key_Tab:
-            # Indent tab
-            self.add_tab()
-        elif key == Qt.Key_Backtab:
-            # Unindent tab
-            self.remove_tab()
-        elif key == Qt.Key_Return:
-            # Insert required spaces
-            self.return_key()
-        elif key == Qt.Key_Backspace:
-            # Delete requred spaces
-            self.backspace()
-        elif key == Qt.Key_Space:
-            # Inserts an edit separator
-            # This is a bit hacky though. Probably refactor this.
-            cursor = self.textCursor()
-            cursor.beginEditBlock()
-            super().keyPressEvent(event)
-            cursor.endEditBlock()
-        else:
-            special_key = False
-
-        if special_key:
-            self.ensureCursorVisible()
-        else:
-            super().keyPressEvent(event)
-
-    def set_breakpoint(self):
-
-        print('set breakpoint')
-
-        selection_start, selection_end = self.get_selection_index()
-
-        if selection_start == selection_end:
-            selection_end += 1
-
-        # bps = []
-        # extra_selection = QTextEdit.ExtraSelection()
-        # # print(type(extra_selection.cursor))
-        # # print(type(extra_selection.format))
-        # cursor = self.textCursor()
-        # cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-        # # cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor, 3)
-        # extra_selection.format.setBackground(self.breakpoint_background)
-        # extra_selection.format.setAnchor(True)
-        # extra_selection.cursor = cursor
-        # bps.append(extra_selection)
-
-        # cursor = self.textCursor()
-        # for pos in range(selection_start, selection_end):
-        #     print(pos)
-        #     cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-        #     if pos in self.breakpoints:
-        #         self.breakpoints.pop(pos)
-        #     else:
-        #         extra_selection = QTextEdit.ExtraSelection()
-        #         extra_selection.format.setBackground(self.breakpoint_background)
-        #         extra_selection.cursor = cursor
-        #         self.breakpoints[pos] = extra_selection
-        #     cursor.clearSelection()
-
-        # self.setExtraSelections(self.breakpoints.values())
-
-        cursor = self.textCursor()
-        if cursor.hasSelection():
-            fmt = QTextCharFormat()
-            fmt.setBackground(Qt.green)
-            cursor.setCharFormat(fmt)
-
-    def add_tab(self):
-        selection_start, selection_end = self.get_selection_index()
-        if selection_start == selection_end:
-            self.insertPlainText(self.indentation)
-            return
-
-        start_block = self.document().findBlock(selection_start)
-        end_block = self.document().findBlock(selection_end)
-        start, end = start_block.blockNumber(), end_block.blockNumber()
-        cursor = self.textCursor()
-
-        cursor.beginEditBlock()
-        cursor.setPosition(start_block.position())
-        for line in range(start, end + 1):
-            cursor.insertText(self.indentation)
-            cursor.movePosition(QTextCursor.NextBlock)
-        cursor.endEditBlock()
-
-    def remove_tab(self):
-        selection_start, selection_end = self.get_selection_index()
-        start_block = self.document().findBlock(selection_start)
-        end_block = self.document().findBlock(selection_end)
-        end = end_block.blockNumber()
-        cursor = self.textCursor()
-
-        cursor.beginEditBlock()
-        block = start_block
-        while 0 <= block.blockNumber() <= end:
-            spaces = self.search_spaces(block)
-            if spaces > 0:
-                to_delete = spaces % 4 or 4
-                cursor.setPosition(block.position())
-                cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor, to_delete)
-                cursor.removeSelectedText()
-            block = block.next()
-        cursor.endEditBlock()
-
-    def return_key(self):
-        selection_start, selection_end = self.get_selection_index()
-        cursor = self.textCursor()
-
-        cursor.beginEditBlock()
-        if selection_start != selection_end:
-            cursor.removeSelectedText()
-
-        curr_block = cursor.block()
-        spaces = self.search_spaces(curr_block)
-        cursor.insertText('\n' + ' ' * spaces)
-
-        cursor.endEditBlock()
-
-    def backspace(self):
-        selection_start, selection_end = self.get_selection_index()
-        cursor = self.textCursor()
-        # If there is a selection, then just delete that selection.
-        # If cursor is at the start of a line, then just delete that line.
-        if selection_start != selection_end or cursor.atBlockStart():
-            # QTextCursor.deletePreviousChar() deletes any selected text if there is any
-            cursor.deletePreviousChar()
-            return
-
-        block = cursor.block()
-        spaces = self.search_spaces(block)
-        if spaces == cursor.positionInBlock():
-            to_delete = spaces % 4 or 4
-            cursor.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, to_delete)
-            cursor.removeSelectedText()
-        else:
-            cursor.deletePreviousChar()
-
-    def search_spaces(self, block):
-        """Returns the number of spaces at the start of `block`."""
-        text = block.text()
-        return len(text) - len(text.lstrip(' '))
-
-    def get_selection_index(self):
-        cursor = self.textCursor()
-        return cursor.selectionStart(), cursor.selectionEnd()
-
-    def set_extension(self, extension):
-        highlighter_type = self.HIGHLIGHTER_TYPES.get(extension, DefaultHighlighter)
-        if type(self.highlighter) is highlighter_type:
-            return
-
-        self.highlighter = highlighter_type(self.document())
+import math
+import re
+from bisect import bisect_left
+
+
+from PyQt5.QtGui import (QPainter,
+                         QSyntaxHighlighter,
+                         QColor,
+                         QTextCharFormat,
+                         QTextBlockFormat,
+                         QTextCursor,
+                         QTextFormat,
+                         QTextBlock,
+                         QTextBlockUserData,
+                         )
+from PyQt5.QtCore import (Qt,
+                          QEvent,
+                          QSize,
+                          QRect,
+                          QPoint,
+                          QTimer,
+                          )
+from PyQt5.QtWidgets import (QPlainTextEdit,
+                             QTextEdit,
+                             QToolTip,
+                             QWidget,
+                             QApplication,
+                             )
+
+from interpreter import ErrorTypes, ProgramSyntaxError
+
+
+class DefaultHighlighter(QSyntaxHighlighter):
+
+    def __init__(self, document, editor=None):
+        super().__init__(document)
+
+    def highlightBlock(self, text):
+        pass
+
+
+class ViewportHighlighter(QSyntaxHighlighter):
+    """Highlighter that only highlights the blocks that are near the viewport of `editor`.
+    Other blocks are marked as deferred, and are highlighted when they are scrolled into view.
+    Subclasses should implement `highlight_text` instead of `highlightBlock`."""
+
+    HIGHLIGHTED = 0
+    DEFERRED = 1
+
+    # Number of blocks either side of the viewport that are highlighted too
+    MARGIN = 20
+
+    def __init__(self, document, editor=None):
+        super().__init__(document)
+        self.editor = editor
+        if editor is not None:
+            editor.updateRequest.connect(self.highlight_visible)
+
+    def highlightBlock(self, text):
+        if self.editor is not None and not self._is_near_viewport(self.currentBlock()):
+            self.setCurrentBlockState(self.DEFERRED)
+            return
+        self.setCurrentBlockState(self.HIGHLIGHTED)
+        self.highlight_text(text)
+
+    def highlight_text(self, text):
+        pass
+
+    def highlight_visible(self, *args):
+        """Highlight the deferred blocks that are near the viewport."""
+        if self.document() is None:
+            return
+        first, last = self._viewport_range()
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            if block.userState() == self.DEFERRED:
+                self.rehighlightBlock(block)
+            block = block.next()
+
+    def _viewport_range(self):
+        """Return the first and last block numbers that should be highlighted."""
+        editor = self.editor
+        first = editor.firstVisibleBlock().blockNumber()
+        lines = editor.viewport().height() // max(1, editor.fontMetrics().lineSpacing())
+        return max(0, first - self.MARGIN), first + lines + self.MARGIN
+
+    def _is_near_viewport(self, block):
+        first, last = self._viewport_range()
+        return first <= block.blockNumber() <= last
+
+
+class CharacterClasses(dict):
+    """Lookup table from a character to its class for `str.translate`. Characters
+    that aren't in the table are given `default`, and are added to the table."""
+
+    def __init__(self, classes, default):
+        super().__init__((ord(char), class_) for char, class_ in classes.items())
+        self.default = default
+
+    def __missing__(self, key):
+        self[key] = self.default
+        return self.default
+
+
+class BrainfuckHighlighter(ViewportHighlighter):
+
+    CLASSES = CharacterClasses({
+        '[': 'l', ']': 'l',
+        '<': 'p', '>': 'p',
+        '+': 'c', '-': 'c',
+        '.': 'i', ',': 'i',
+    }, default='#')
+    CLASS_RULES = {
+        'l': 'loop',
+        'p': 'pointer',
+        'c': 'cell',
+        'i': 'io',
+        '#': 'comment',
+    }
+    # Matches a run of characters of the same class
+    RUNS = re.compile(r'(.)\1*', re.DOTALL)
+
+    def __init__(self, document, editor=None):
+        super().__init__(document, editor)
+
+        self.set_default_rule_formats()
+        self.set_formats()
+
+    def set_default_rule_formats(self):
+        """Set the default formatting for all the rules."""
+        self.rule_formats = {
+            'loop': QTextCharFormat(),
+            'pointer': QTextCharFormat(),
+            'cell': QTextCharFormat(),
+            'io': QTextCharFormat(),
+            'comment': QTextCharFormat()
+        }
+        self.rule_formats['loop'].setForeground(QColor('red'))
+        self.rule_formats['pointer'].setForeground(QColor('purple'))
+        self.rule_formats['cell'].setForeground(QColor('green'))
+        self.rule_formats['io'].setForeground(QColor('blue'))
+        self.rule_formats['comment'].setForeground(QColor('grey'))
+
+        # for format_ in self.rule_formats.values():
+        #     format_.setBackground(QColor(Qt.white))
+
+    def set_formats(self):
+        """Set the format for each class and rehighlight the document.
+        This method should be called whenever the default formatting changes,
+        otherwise, the text won't be updated."""
+        self.formats = {class_: self.rule_formats[rule] for class_, rule in self.CLASS_RULES.items()}
+        self.rehighlight()
+
+    def highlight_text(self, text):
+        """Classify every character of `text` in one pass, then set the format of each
+        run of characters with the same class at once."""
+        formats = self.formats
+        for match in self.RUNS.finditer(text.translate(self.CLASSES)):
+            start, end = match.span()
+            self.setFormat(start, end - start, formats[match.group(1)])
+
+
+class BracketData(QTextBlockUserData):
+    """Brackets of a single block, stored as the block's user data.
+
+    Attributes:
+        text -- Text of the block when it was scanned.
+        brackets -- List of (offset, bracket) in the block.
+        net -- Change in depth over the whole block.
+        min_depth -- Lowest depth reached scanning forwards from the start, relative to the start.
+        min_reverse_depth -- Lowest depth reached scanning backwards from the end, where
+                             ']' opens and '[' closes."""
+
+    BRACKETS = re.compile(r'[\[\]]')
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+        self.brackets = [(match.start(), match.group()) for match in self.BRACKETS.finditer(text)]
+
+        depth = min_depth = 0
+        for offset, bracket in self.brackets:
+            depth += 1 if bracket == '[' else -1
+            min_depth = min(min_depth, depth)
+        self.net = depth
+        self.min_depth = min_depth
+        # Scanning backwards to a point gives the forwards depth at that point minus `net`
+        self.min_reverse_depth = min_depth - depth
+
+        # Qt positions count UTF-16 code units, which only differ from the
+        # string index if there are characters outside the BMP
+        self.wide = len(text.encode('utf-16-le')) != 2 * len(text)
+
+    def qt_offset(self, offset):
+        """Convert a string index in the block to a position relative to the block."""
+        if not self.wide:
+            return offset
+        return len(self.text[:offset].encode('utf-16-le')) // 2
+
+    def string_offset(self, qt_offset):
+        """Convert a position relative to the block to a string index in the block."""
+        if not self.wide:
+            return qt_offset
+        return len(self.text.encode('utf-16-le')[:2 * qt_offset].decode('utf-16-le', 'ignore'))
+
+
+class BracketIndex:
+    """Index of the brackets in `document`, kept up to date as the document changes.
+
+    Each block stores its own brackets in a `BracketData`, which is only rescanned
+    when the block changes. Finding the match of a bracket skips over whole blocks
+    using their depths, and the full bracket table is only built when it is asked for."""
+
+    def __init__(self, document):
+        self.document = document
+        self._table = None
+
+        block = document.begin()
+        while block.isValid():
+            self._scan_block(block)
+            block = block.next()
+
+        document.contentsChange.connect(self.contents_changed)
+
+    def detach(self):
+        self.document.contentsChange.disconnect(self.contents_changed)
+
+    def contents_changed(self, position, removed, added):
+        """Rescan the blocks between `position` and `position + added`."""
+        if removed or added:
+            # Removing whole blocks can leave the text of the rescanned blocks the same,
+            # and any edit moves the indices of the brackets after it
+            self._table = None
+        block = self.document.findBlock(position)
+        last = self.document.findBlock(position + added)
+        while block.isValid():
+            self._scan_block(block)
+            if block == last:
+                break
+            block = block.next()
+
+    def _scan_block(self, block):
+        text = block.text()
+        data = block.userData()
+        if isinstance(data, BracketData) and data.text == text:
+            # Only the formatting has changed
+            return
+        block.setUserData(BracketData(text))
+        self._table = None
+
+    def match(self, position):
+        """Return the position of the bracket matching the bracket at `position`.
+        Return None if there isn't a bracket at `position`, or it is unmatched."""
+        block = self.document.findBlock(position)
+        data = block.userData()
+        if not isinstance(data, BracketData):
+            return None
+        offset = data.string_offset(position - block.position())
+        index = next((i for i, (o, bracket) in enumerate(data.brackets) if o == offset), None)
+        if index is None:
+            return None
+
+        if data.brackets[index][1] == '[':
+            brackets, step, opening = data.brackets[index:], 1, '['
+        else:
+            brackets, step, opening = data.brackets[index::-1], -1, ']'
+
+        depth = 0
+        while True:
+            for offset, bracket in brackets:
+                depth += 1 if bracket == opening else -1
+                if depth == 0:
+                    return block.position() + data.qt_offset(offset)
+
+            # Skip the blocks that the match can't be in
+            while True:
+                block = block.next() if step == 1 else block.previous()
+                if not block.isValid():
+                    return None
+                data = block.userData()
+                lowest = data.min_depth if step == 1 else data.min_reverse_depth
+                if depth + lowest <= 0:
+                    break
+                depth += data.net * step
+            brackets = data.brackets if step == 1 else data.brackets[::-1]
+
+    def table(self):
+        """Return (brackets, unmatched). `brackets` maps the string index of each matched
+        bracket in the document's plain text to the index of its match, like
+        `BFInterpreter.match_brackets`. `unmatched` is a list of (string index, document
+        position, bracket) of each unmatched bracket, closing brackets first."""
+        if self._table is not None:
+            return self._table
+
+        brackets = {}
+        unmatched = []
+        stack = []
+        index = 0
+        block = self.document.begin()
+        while block.isValid():
+            data = block.userData()
+            for offset, bracket in data.brackets:
+                if bracket == '[':
+                    stack.append((index + offset, block, data, offset))
+                elif stack:
+                    match = stack.pop()[0]
+                    brackets[match] = index + offset
+                    brackets[index + offset] = match
+                else:
+                    unmatched.append((index + offset, block.position() + data.qt_offset(offset), bracket))
+            index += len(data.text) + 1
+            block = block.next()
+        for match, block, data, offset in stack:
+            unmatched.append((match, block.position() + data.qt_offset(offset), '['))
+
+        self._table = brackets, unmatched
+        return self._table
+
+    def bracket_table(self):
+        """Return the bracket table of the whole document. Raise `ProgramSyntaxError`
+        for the same unmatched bracket that `BFInterpreter.match_brackets` would."""
+        brackets, unmatched = self.table()
+        if unmatched:
+            index, position, bracket = unmatched[0]
+            if bracket == ']':
+                raise ProgramSyntaxError(ErrorTypes.UNMATCHED_CLOSE_PAREN, index)
+            raise ProgramSyntaxError(ErrorTypes.UNMATCHED_OPEN_PAREN, unmatched[-1][0])
+        return brackets
+
+
+class LineNumberArea(QWidget):
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+
+    def sizeHint(self):
+        return QSize(self.text.line_number_area_width(), 0)
+
+    def paintEvent(self, event):
+        self.text.line_number_paint(event)
+
+
+class LineNumberText(QPlainTextEdit):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.can_undo = False
+
+        self.init_widgets()
+
+    def init_widgets(self):
+
+        self.setLineWrapMode(self.NoWrap)
+
+        self.line_number_area = LineNumberArea(self)
+
+        self.current_line_colour = QColor(Qt.gray).lighter(150)
+        # self.current_block_format = QTextBlockFormat()
+        # self.current_block_format.setBackground(self.current_line_colour)
+        # self.current_block_format.setProperty(QTextFormat.FullWidthSelection, True)
+
+        self.last_block_infos = []
+
+        # Extra selections, drawn on top of the text
+        self.current_line_selections = []
+        self.overlays = {}
+
+        self.blockCountChanged.connect(self.update_line_number_area_width)
+        self.updateRequest.connect(self.update_line_number_area)
+        self.cursorPositionChanged.connect(self.highlight_current_line)
+
+    def line_number_area_width(self, line=None):
+        """Calculates the spacing required for `line`. If `line` is None,
+        it defaults to the last line in the text."""
+        if line is None:
+            line = self.blockCount()
+
+        # Minimum spacing of 3 chars
+        digits = max(3, len(str(line)))
+
+        space = 3 + self.fontMetrics().averageCharWidth() * digits
+
+        return space
+
+    def update_line_number_area_width(self, lines=None):
+        """Called when the number of lines (blocks) change. `lines` if the total
+        number of lines if called by the signal; otherwise, `lines` may be None."""
+        self.setViewportMargins(self.line_number_area_width(lines), 0, 0, 0)
+
+    def update_line_number_area(self, rect, dy):
+        """Update the current line numbers."""
+        if dy:
+            self.line_number_area.scroll(0, dy)
+        else:
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+
+    def resizeEvent(self, event):
+        """Event called when widget is resized (eg. user dragged the screen).
+        Resize the line numbers spacing."""
+        super().resizeEvent(event)
+
+        contents_rect = self.contentsRect()  # Whole area of whole widget
+        line_number_rect = QRect(contents_rect.left(), contents_rect.top(), self.line_number_area_width(), contents_rect.height())
+        self.line_number_area.setGeometry(line_number_rect)
+        self.update_line_number_area_width()
+
+    def line_number_paint(self, event):
+        """Paint the line numbers on the lines currently in view of the screen."""
+        painter = QPainter(self.line_number_area)
+        painter.fillRect(event.rect(), Qt.lightGray)
+
+        block = self.firstVisibleBlock()
+        block_number = block.blockNumber()
+
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        bottom = top + self.blockBoundingRect(block).height()
+
+        while block.isValid() and top <= event.rect().bottom():
+            if block.isVisible() and bottom >= event.rect().top():
+                line_number = str(block_number + 1)
+                painter.setPen(Qt.black)
+                painter.drawText(0, top, self.line_number_area.width() - 3, self.fontMetrics().height(), Qt.AlignRight, line_number)
+
+            block = block.next()
+            top = bottom
+            bottom += self.blockBoundingRect(block).height()
+            block_number += 1
+
+    def setFont(self, font):
+        """Set the default font. Resize the line numbers spacing."""
+        super().setFont(font)
+
+        self.update_line_number_area_width()
+
+    def highlight_current_line(self):
+        if self.isReadOnly():
+            return
+
+        selection = QTextEdit.ExtraSelection()
+        selection.cursor = self.textCursor()
+        if selection.cursor.hasSelection():
+            selection.cursor.clearSelection()
+        else:
+            selection.format.setBackground(self.current_line_colour)
+            selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+        self.current_line_selections = [selection]
+
+        self.update_extra_selections()
+
+    def set_overlay(self, name, selections, under=False):
+        """Set the extra selections of the overlay `name` to `selections`. Overlays
+        are painted over the text without changing the document, so they are cheap
+        to change and don't affect the undo stack. If `under` is True, then the overlay
+        is painted under the other overlays."""
+        if selections:
+            self.overlays.pop(name, None)
+            if under:
+                self.overlays = {name: selections, **self.overlays}
+            else:
+                self.overlays[name] = selections
+        elif self.overlays.pop(name, None) is None:
+            return
+        self.update_extra_selections()
+
+    def update_extra_selections(self):
+        """Set the extra selections to the current line highlighting followed by each overlay."""
+        extra_selections = list(self.current_line_selections)
+        for selections in self.overlays.values():
+            extra_selections.extend(selections)
+        self.setExtraSelections(extra_selections)
+
+        # If I want to expand this to multicursor support, I can create a list of previous
+        # block infos instead.
+
+        # print(self.can_undo)
+
+        # textcursor = self.textCursor()
+        # textcursor.beginEditBlock()
+        # for prev_block, prev_format in self.last_block_infos:
+        #     textcursor.setPosition(prev_block.position())
+        #     textcursor.setBlockFormat(prev_format)
+
+        # self.last_block_infos = []
+        # textcursor.setPosition(self.textCursor().position(), QTextCursor.MoveAnchor)
+        # self.last_block_infos.append((textcursor.block(), textcursor.block().blockFormat()))
+        # textcursor.setBlockFormat(self.current_block_format)
+
+        # textcursor.endEditBlock()
+        # self.textCursor().joinPreviousEditBlock()
+
+    # def focusInEvent(self, event):
+    #     print('LineNumberText.focusInEvent')
+    #     super().focusInEvent(event)
+    #     self.highlight_current_line()
+
+    # def focusOutEvent(self, event):
+    #     print('LineNumberText.focusOutEvent')
+    #     super().focusOutEvent(event)
+    #     self.setExtraSelections([])
+
+    def setReadOnly(self, value):
+        super().setReadOnly(value)
+        if value:
+            self.current_line_selections = []
+            self.update_extra_selections()
+        else:
+            self.highlight_current_line()
+
+
+class CodeText(LineNumberText):
+
+    #############
+
+    # NOTE!:
+    # QPlainTextEdit::setExtraSelections
+    # It can be used to: mark text - for breakpoint!
+
+    # Cursor.setCharFormat can be used set set the format
+    # to simulate multicursor.
+
+    # QPlainTextEdit.cursorForPosition(pos)
+    # can be used to set breakpoint to mouse event
+    # can be bound to QWidget.mousePressEvent(event)
+    # where event is a QMouseEvent
+
+    #############
+
+    HIGHLIGHTER_TYPES = {
+        '.b': BrainfuckHighlighter,
+    }
+    # Extensions of the languages that have brackets that must match
+    BRACKET_EXTENSIONS = {'.b'}
+    # Time to wait after an edit before looking for unmatched brackets, in milliseconds
+    BRACKET_DIAGNOSTICS_DELAY = 100
+    # Number of different colours of the execution count heatmap
+    HEATMAP_LEVELS = 12
+
+    def __init__(self, texteditor):
+        super().__init__(texteditor)
+        self.texteditor = texteditor
+
+        self.indentation = '    '
+        self.breakpoints = {}
+        self.breakpoint_background = QColor(Qt.yellow)
+
+        self.highlighter = DefaultHighlighter(self.document())
+
+        self.bracket_index = None
+        self.bracket_match_format = QTextCharFormat()
+        self.bracket_match_format.setBackground(QColor(Qt.cyan).lighter(160))
+        self.unmatched_bracket_format = QTextCharFormat()
+        self.unmatched_bracket_format.setUnderlineStyle(QTextCharFormat.WaveUnderline)
+        self.unmatched_bracket_format.setUnderlineColor(QColor(Qt.red))
+
+        self.bracket_timer = QTimer(self)
+        self.bracket_timer.setSingleShot(True)
+        self.bracket_timer.setInterval(self.BRACKET_DIAGNOSTICS_DELAY)
+        self.bracket_timer.timeout.connect(self.update_bracket_diagnostics)
+        self.document().contentsChanged.connect(self.bracket_timer.start)
+        self.cursorPositionChanged.connect(self.highlight_matching_bracket)
+
+        # Number of times each character was run, shown by `set_heatmap`
+        self.heatmap_counts = None
+        self.heatmap_total = 0
+        self.heatmap_positions = None  # See `_qt_positions`
+        self.heatmap_formats = []
+        for level in range(self.HEATMAP_LEVELS):
+            fraction = level / (self.HEATMAP_LEVELS - 1)
+            format_ = QTextCharFormat()
+            # From pale yellow for the least run to red for the most run
+            format_.setBackground(QColor.fromHsvF((1 - fraction) / 6, 0.2 + 0.6 * fraction, 1))
+            self.heatmap_formats.append(format_)
+        # Not contentsChanged, which the highlighters also emit when they rehighlight
+        self.document().contentsChange.connect(self.heatmap_text_changed)
+
+    def focusInEvent(self, event):
+        super().focusInEvent(event)
+        self.texteditor.editor_window.editor_focus_in()
+
+    # def mousePressEvent(self, event):
+    #     super().mousePressEvent(event)
+    #     if event.button() == Qt.RightButton:
+    #         print('right button')
+    #         print(self.document().characterAt(self.cursorForPosition(event.pos()).position()))
+
+    def mousePressEvent(self, event):
+        button = event.button()
+        modifiers = QApplication.keyboardModifiers()
+
+        if button == Qt.LeftButton and modifiers == Qt.ControlModifier:
+            # print('Add multicursor', event.pos(), event.localPos(), (event.x(), event.y()), self.document().characterAt(self.cursorForPosition(QPoint(0, 0)).position()))
+            self.add_multicursor(event.pos())
+        else:
+            super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        buttons = event.buttons()
+        modifiers = QApplication.keyboardModifiers()
+
+        if buttons == Qt.LeftButton and modifiers == Qt.ControlModifier:
+            print('move multicursor')
+            # self.add_
+        else:
+            super().mousePressEvent(event)
+
+    def add_multicursor(self, pos):
+        # print(self.contentOffset().x(), self.contentOffset().y())
+        # text_cursor = self.cursorForPosition(pos)
+        # text_cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
+        # f = QTextCharFormat()
+        # f.setBackground(QColor(Qt.green))
+        # text_cursor.setCharFormat(f)
+
+        # text_cursor = self.cursorForPosition(pos)
+        # selection = QTextEdit.ExtraSelection()
+        # selection.cursor = text_cursor
+
+        # self.setExtraSelections([selection])
+        pass
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        # modifiers = QApplication.keyboardModifiers()
+
+        # if key == Qt.Key_Q and modifiers == Qt.ControlModifier:
+        #     self.set_breakpoint()
+
+        special_key = True
+        if key == Qt.Key_Tab:
+            # Indent tab
+            self.add_tab()
+        elif key == Qt.Key_Backtab:
+            # Unindent tab
+            self.remove_tab()
+        elif key == Qt.Key_Return:
+            # Insert required spaces
+            self.return_key()
+        elif key == Qt.Key_Backspace:
+            # Delete requred spaces
+            self.backspace()
+        elif key == Qt.Key_Space:
+            # Inserts an edit separator
+            # This is a bit hacky though. Probably refactor this.
+            cursor = self.textCursor()
+            cursor.beginEditBlock()
+            super().keyPressEvent(event)
+            cursor.endEditBlock()
+        else:
+            special_key = False
+
+        if special_key:
+            self.ensureCursorVisible()
+        else:
+            super().keyPressEvent(event)
+
+    def set_breakpoint(self):
+
+        print('set breakpoint')
+
+        selection_start, selection_end = self.get_selection_index()
+
+        if selection_start == selection_end:
+            selection_end += 1
+
+        # bps = []
+        # extra_selection = QTextEdit.ExtraSelection()
+        # # print(type(extra_selection.cursor))
+        # # print(type(extra_selection.format))
+        # cursor = self.textCursor()
+        # cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
+        # # cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor, 3)
+        # extra_selection.format.setBackground(self.breakpoint_background)
+        # extra_selection.format.setAnchor(True)
+        # extra_selection.cursor = cursor
+        # bps.append(extra_selection)
+
+        # cursor = self.textCursor()
+        # for pos in range(selection_start, selection_end):
+        #     print(pos)
+        #     cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
+        #     if pos in self.breakpoints:
+        #         self.breakpoints.pop(pos)
+        #     else:
+        #         extra_selection = QTextEdit.ExtraSelection()
+        #         extra_selection.format.setBackground(self.breakpoint_background)
+        #         extra_selection.cursor = cursor
+        #         self.breakpoints[pos] = extra_selection
+        #     cursor.clearSelection()
+
+        # self.setExtraSelections(self.breakpoints.values())
+
+        cursor = self.textCursor()
+        if cursor.hasSelection():
+            fmt = QTextCharFormat()
+            fmt.setBackground(Qt.green)
+            cursor.setCharFormat(fmt)
+
+    def add_tab(self):
+        selection_start, selection_end = self.get_selection_index()
+        if selection_start == selection_end:
+            self.insertPlainText(self.indentation)
+            return
+
+        start_block = self.document().findBlock(selection_start)
+        end_block = self.document().findBlock(selection_end)
+        start, end = start_block.blockNumber(), end_block.blockNumber()
+        cursor = self.textCursor()
+
+        cursor.beginEditBlock()
+        cursor.setPosition(start_block.position())
+        for line in range(start, end + 1):
+            cursor.insertText(self.indentation)
+            cursor.movePosition(QTextCursor.NextBlock)
+        cursor.endEditBlock()
+
+    def remove_tab(self):
+        selection_start, selection_end = self.get_selection_index()
+        start_block = self.document().findBlock(selection_start)
+        end_block = self.document().findBlock(selection_end)
+        end = end_block.blockNumber()
+        cursor = self.textCursor()
+
+        cursor.beginEditBlock()
+        block = start_block
+        while 0 <= block.blockNumber() <= end:
+            spaces = self.search_spaces(block)
+            if spaces > 0:
+                to_delete = spaces % 4 or 4
+                cursor.setPosition(block.position())
+                cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor, to_delete)
+                cursor.removeSelectedText()
+            block = block.next()
+        cursor.endEditBlock()
+
+    def return_key(self):
+        selection_start, selection_end = self.get_selection_index()
+        cursor = self.textCursor()
+
+        cursor.beginEditBlock()
+        if selection_start != selection_end:
+            cursor.removeSelectedText()
+
+        curr_block = cursor.block()
+        spaces = self.search_spaces(curr_block)
+        cursor.insertText('\n' + ' ' * spaces)
+
+        cursor.endEditBlock()
+
+    def backspace(self):
+        selection_start, selection_end = self.get_selection_index()
+        cursor = self.textCursor()
+        # If there is a selection, then just delete that selection.
+        # If cursor is at the start of a line, then just delete that line.
+        if selection_start != selection_end or cursor.atBlockStart():
+            # QTextCursor.deletePreviousChar() deletes any selected text if there is any
+            cursor.deletePreviousChar()
+            return
+
+        block = cursor.block()
+        spaces = self.search_spaces(block)
+        if spaces == cursor.positionInBlock():
+            to_delete = spaces % 4 or 4
+            cursor.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, to_delete)
+            cursor.removeSelectedText()
+        else:
+            cursor.deletePreviousChar()
+
+    def search_spaces(self, block):
+        """Returns the number of spaces at the start of `block`."""
+        text = block.text()
+        return len(text) - len(text.lstrip(' '))
+
+    def get_selection_index(self):
+        cursor = self.textCursor()
+        return cursor.selectionStart(), cursor.selectionEnd()
+
+    def set_extension(self, extension):
+        self.set_bracket_index(extension in self.BRACKET_EXTENSIONS)
+
+        highlighter_type = self.HIGHLIGHTER_TYPES.get(extension, DefaultHighlighter)
+        if type(self.highlighter) is highlighter_type:
+            return
+
+        self.highlighter.setDocument(None)
+        self.highlighter = highlighter_type(self.document(), self)
+
+    def set_bracket_index(self, enabled):
+        """Start or stop keeping a `BracketIndex` of the document."""
+        if enabled == (self.bracket_index is not None):
+            return
+        if enabled:
+            self.bracket_index = BracketIndex(self.document())
+        else:
+            self.bracket_index.detach()
+            self.bracket_index = None
+        self.highlight_matching_bracket()
+        self.update_bracket_diagnostics()
+
+    def bracket_table(self):
+        """Return the bracket table of the code, as `BFInterpreter.match_brackets` would,
+        without scanning the whole text. Return None if brackets aren't being indexed."""
+        if self.bracket_index is None:
+            return None
+        return self.bracket_index.bracket_table()
+
+    def highlight_matching_bracket(self):
+        """If the cursor is next to a bracket, highlight it and its match."""
+        selections = []
+        if self.bracket_index is not None:
+            document = self.document()
+            position = self.textCursor().position()
+            for bracket_position in (position, position - 1):
+                if document.characterAt(bracket_position) in ('[', ']'):
+                    match = self.bracket_index.match(bracket_position)
+                    if match is not None:
+                        selections = [self._bracket_selection(bracket_position, self.bracket_match_format),
+                                      self._bracket_selection(match, self.bracket_match_format)]
+                    break
+        self.set_overlay('bracket_match', selections)
+
+    def update_bracket_diagnostics(self):
+        """Underline all of the unmatched brackets."""
+        selections = []
+        if self.bracket_index is not None:
+            brackets, unmatched = self.bracket_index.table()
+            selections = [self._bracket_selection(position, self.unmatched_bracket_format)
+                          for index, position, bracket in unmatched]
+        self.set_overlay('unmatched_brackets', selections)
+
+    def set_heatmap(self, counts):
+        """Colour the background of each character by `counts`, the number of times that
+        each character of the text has been run, on a log scale. The heatmap is removed
+        when the text is changed."""
+        self.heatmap_counts = counts
+        self.heatmap_total = sum(counts)
+        most = max(counts, default=0)
+        scale = (self.HEATMAP_LEVELS - 1) / math.log(most) if most > 1 else 0
+        qt_positions = self.heatmap_positions = self._qt_positions(self.toPlainText())
+
+        selections = []
+        start = 0
+        for index in range(1, len(counts) + 1):
+            # Runs of characters with the same count share a selection
+            if index < len(counts) and counts[index] == counts[start]:
+                continue
+            count = counts[start]
+            if count:
+                format_ = self.heatmap_formats[round(math.log(count) * scale)]
+                selection = QTextEdit.ExtraSelection()
+                selection.cursor = QTextCursor(self.document())
+                selection.cursor.setPosition(qt_positions[start] if qt_positions else start)
+                selection.cursor.setPosition(qt_positions[index] if qt_positions else index,
+                                             QTextCursor.KeepAnchor)
+                selection.format = format_
+                selections.append(selection)
+            start = index
+        self.set_overlay('heatmap', selections, under=True)
+
+    def heatmap_text_changed(self, position, removed, added):
+        if removed or added:
+            self.clear_heatmap()
+
+    def clear_heatmap(self):
+        if self.heatmap_counts is not None:
+            self.heatmap_counts = None
+            self.set_overlay('heatmap', [])
+
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip and self.heatmap_counts is not None:
+            index = self._index_at(event.pos())
+            if index is not None and self.heatmap_counts[index]:
+                count = self.heatmap_counts[index]
+                QToolTip.showText(event.globalPos(), f'Run {count:,} time{"s" if count != 1 else ""}, '
+                                  f'{count / self.heatmap_total:.2%} of the instructions')
+            else:
+                QToolTip.hideText()
+            return True
+        return super().viewportEvent(event)
+
+    def _index_at(self, pos):
+        """Return the index in the text of the character under the viewport point `pos`,
+        or None if there isn't one."""
+        cursor = self.cursorForPosition(pos)
+        if self.cursorRect(cursor).left() > pos.x():
+            if cursor.positionInBlock() == 0:
+                return None
+            cursor.movePosition(QTextCursor.Left)
+        if cursor.atBlockEnd():
+            return None
+        position = cursor.position()
+        if self.heatmap_positions is not None:
+            position = bisect_left(self.heatmap_positions, position)
+        return position if position < len(self.heatmap_counts) else None
+
+    @staticmethod
+    def _qt_positions(text):
+        """Return the document position of each index of `text` and its end, or None if
+        they are the same. They differ after characters that Qt stores as surrogate pairs."""
+        if text.isascii() or not any(ord(char) > 0xFFFF for char in text):
+            return None
+        positions = [0]
+        for char in text:
+            positions.append(positions[-1] + (2 if ord(char) > 0xFFFF else 1))
+        return positions
+
+    def _bracket_selection(self, position, format_):
+        selection = QTextEdit.ExtraSelection()
+        selection.cursor = QTextCursor(self.document())
+        selection.cursor.setPosition(position)
+        selection.cursor.setPosition(position + 1, QTextCursor.KeepAnchor)
+        selection.format = format_
+        return selection
@@ -1,194 +1,552 @@
-
-import collections
-
-from PyQt5.QtCore import (Qt,
-                          QSize,
-                          QThread,
-                          QTimer,
-                          QObject,
-                          pyqtSignal,
-                          )
-from PyQt5.QtGui import (QTextCursor,
-                         QBrush,
-                         )
-from PyQt5.QtWidgets import (QPlainTextEdit,
-                             QWidget,
-                             QVBoxLayout,
-                             QStatusBar,
-                             QTableWidget,
-                             QHBoxLayout,
-                             QPushButton,
-                             QGridLayout,
-                             QTableWidgetItem,
-                             QHeaderView,
-                             QSplitter,
-                             QFrame,
-                             )
-
-from interpreter import FastBrainfuckInterpreter, BFInterpreter, ErrorTypes, ProgramError, ProgramRuntimeError, ProgramSyntaxError, InterpreterError
-from utility_widgets import WorkerThread
-from input_text import InputTextEdit
-
-
-class IOObject(QObject):
-    input_ = pyqtSignal()
-    output = pyqtSignal(str)
-
-
-class CodeRunner(QWidget):
-
-    INTERPRETER_TYPES = {
-        '.b': FastBrainfuckInterpreter,
-    }
-
-    new_input_signal = pyqtSignal()
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-        self.interpreter_type = None
-
-        self.init_widgets()
-
-    def init_widgets(self):
-
-        # FIXME:
-        #   Text changes back to the original font when
-        #   the CodeRunner (self) if dragged out of the docking area.
-
-        self.new_input_signal.connect(self.ask_new_input)
-
-        self.buffer_timer = QTimer(self)
-        self.buffer_timer.timeout.connect(self.add_from_buffer)
-        self.buffer_timer.setInterval(10)
-
-        self.output_text = QPlainTextEdit(self)
-        self.output_text.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.output_text.setMaximumBlockCount(1000)
-        self.output_text.setReadOnly(True)
-
-        self.input_text = InputTextEdit(self)
-        self.input_text.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.input_text.setMaximumBlockCount(1000)
-
-        splitter = QSplitter(Qt.Horizontal)
-        splitter.addWidget(self.output_text)
-        splitter.addWidget(self.input_text)
-
-        self.statusbar = QStatusBar(self)
-
-        layout = QVBoxLayout()
-        layout.addWidget(splitter)
-        layout.addWidget(self.statusbar)
-        self.setLayout(layout)
-
-        self.thread = WorkerThread()
-        # self.thread.progress.connect(self.add_output)
-        # self.thread.progress.connect(self.buffer_output)
-        self.thread.error.connect(self.program_error)
-        # self.thread.finished.connect(self.run_finished)
-
-        self.statusbar.showMessage('Ready')
-
-    def set_extension(self, extension):
-        self.interpreter_type = self.INTERPRETER_TYPES.get(extension)
-        self.input_text.set_extension(extension)
-
-    def run_code(self, code):
-        if self.thread.isRunning():
-            self.waiting_for_input = False
-            return
-
-        if self.interpreter_type is None:
-            self.add_output('Invalid file extension')
-            return
-
-        self.cleanup()
-        self.output_text.clear()
-        self.input_text.restart()
-        self.statusbar.showMessage('Running')
-        try:
-            interpreter = self.interpreter_type(code, input_func=self.next_input,
-                                                output_func=lambda char: self.output_buffer.append(char))
-            # output_func=self.buffer_output)
-            # interpreter = self.interpreter_type(code, input_func=self.io_object.input_.emit,
-            #                                     output_func=self.io_object.output.emit)
-        except ProgramError as error:
-            self.program_error(error)
-            # self.run_finished()
-        else:
-            # New output added to the right (append to right, pop from left)
-            self.output_buffer = collections.deque()
-
-            self.thread.func = interpreter.run
-            self.buffer_timer.start()
-            self.thread.start()
-            # self.thread.start(priority=QThread.IdlePriority)
-
-    def add_output(self, text):
-        self.output_text.moveCursor(QTextCursor.End)
-        self.output_text.insertPlainText(text)
-        self.output_text.ensureCursorVisible()
-
-    def run_finished(self):
-        """Should only be called when execution has been ended and there is nothing left in the output buffer."""
-        self.add_output('\nFinished.')
-        self.statusbar.showMessage('Ready')
-        self.buffer_timer.stop()
-
-    def program_error(self, error):
-        if not isinstance(error, InterpreterError):
-            raise error
-
-        error_type = error.error
-        message = error.message
-        if message is None:
-            if error_type is ErrorTypes.UNMATCHED_OPEN_PAREN:
-                message = 'Unmatched opening parentheses'
-            elif error_type is ErrorTypes.UNMATCHED_CLOSE_PAREN:
-                message = 'Unmatched closing parentheses'
-            elif error_type is ErrorTypes.INVALID_TAPE_CELL:
-                message = 'Tape pointer out of bounds'
-            else:
-                raise error
-
-        error_text = f'\nError: {message}{f" at {error.location}" if error.location is not None else ""}'
-        # self.add_output(error_text)
-        self.buffer_output(error_text)
-
-    def cleanup(self):
-        print('closeEvent')
-        print(self.thread.isFinished())
-        # self.thread.quit()
-        self.thread.terminate()
-        print(self.thread.isFinished())
-
-    def buffer_output(self, chars):
-        self.output_buffer.append(chars)
-
-    def add_from_buffer(self):
-        if self.output_buffer:
-            length = min(100, len(self.output_buffer))
-            text = ''.join(self.output_buffer.popleft() for _ in range(length))
-            self.add_output(text)
-        else:
-            if self.thread.isFinished():
-                self.run_finished()
-
-    def next_input(self):
-        input_ = self.input_text.next_()
-        print('in next_input:', repr(input_))
-
-        if input_ is None:
-            while self.output_buffer:
-                pass
-            self.new_input_signal.emit()
-            self.waiting_for_input = True
-            while self.waiting_for_input:
-                pass
-            return self.next_input()
-
-        return input_
-
-    def ask_new_input(self):
-        self.statusbar.showMessage('Waiting for input. Press Ctrl+B.')
+
+import collections
+import functools
+import time
+
+from PyQt5.QtCore import (Qt,
+                          QSize,
+                          QThread,
+                          QTimer,
+                          QObject,
+                          pyqtSignal,
+                          pyqtSlot,
+                          )
+from PyQt5.QtGui import (QTextCursor,
+                         QBrush,
+                         )
+from PyQt5.QtWidgets import (QApplication,
+                             QPlainTextEdit,
+                             QWidget,
+                             QVBoxLayout,
+                             QStatusBar,
+                             QTableWidget,
+                             QHBoxLayout,
+                             QPushButton,
+                             QGridLayout,
+                             QTableWidgetItem,
+                             QHeaderView,
+                             QSplitter,
+                             QFrame,
+                             )
+
+from interpreter import FastBrainfuckInterpreter, BFInterpreter, ErrorTypes, NoInputError, ProgramError, ProgramRuntimeError, ProgramSyntaxError, InterpreterError, ResourceLimitError, RunLimits, SourceMap
+from program_cache import ProgramCache
+from result_cache import ResultCache
+from tape import LeftEdge
+from utility_widgets import WorkerThread
+from input_text import InputTextEdit
+
+
+class IOObject(QObject):
+    input_ = pyqtSignal()
+    output = pyqtSignal(str)
+
+
+class CompileWorker(QObject):
+    """Compiles code on its own thread, so that it is ready before it is run.
+
+    Requests are made with `compile_requested`, and the result is emitted with
+    `compiled` as (request id, code, program, error). Requests that are older than
+    `latest_request` by the time they are reached are skipped."""
+
+    compile_requested = pyqtSignal(int, str, object)
+    compiled = pyqtSignal(int, str, object, object)
+
+    def __init__(self):
+        super().__init__()
+
+        # Only ever written to by the GUI thread
+        self.latest_request = 0
+
+        self.compile_requested.connect(self.compile)
+
+    @pyqtSlot(int, str, object)
+    def compile(self, request_id, code, compile_func):
+        """Compile `code` with `compile_func(code)`."""
+        if request_id < self.latest_request:
+            return
+
+        program = error = None
+        try:
+            program = compile_func(code)
+        except ProgramError as e:
+            error = e
+        self.compiled.emit(request_id, code, program, error)
+
+
+class CodeRunner(QWidget):
+
+    INTERPRETER_TYPES = {
+        '.b': FastBrainfuckInterpreter,
+    }
+
+    # Stop runaway programs before they use up all of the memory
+    RUN_LIMITS = RunLimits(max_cells=10_000_000)
+    # Whether programs can use cells left of the first one
+    LEFT_EDGE = LeftEdge.ERROR
+    # Width of the cells in bits, or None for unbounded cells
+    CELL_BITS = 8
+    # Run Brainfuck with the NumPy tape, which runs clear, copy and scan loops in bulk
+    USE_NUMPY = False
+    # Compiled programs, shared between all the code runners. Give it a directory
+    # to keep the programs between sessions.
+    PROGRAM_CACHE = ProgramCache()
+    # Results of previous runs, shared between all the code runners. Only used once enabled.
+    RESULT_CACHE = ResultCache()
+    # Milliseconds between updates of the counters in the status bar while running
+    TELEMETRY_INTERVAL = 500
+    # Count how many times each character of the code is run, for `execution_counts`
+    COUNT_EXECUTIONS = False
+
+    new_input_signal = pyqtSignal()
+    # Emitted when a run with COUNT_EXECUTIONS ends, as (code, list of the number of
+    # times each character of the code was run)
+    execution_counts = pyqtSignal(str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.interpreter_type = None
+
+        # The latest code that has been compiled in the background and its result
+        self.compile_request = 0
+        self.compiled_code = None
+        self.compiled_program = None
+        self.compile_error = None
+
+        # State of the current run, for storing its result
+        self.interpreter = None
+        self.result_key = None
+        self.consumed_input = []
+        self.run_error = None
+        self.source_map = None
+        self.run_code_text = None
+        self.waiting_for_input = False
+        # Set by `stop_run` to make the worker stop waiting for input or output
+        self.stopping = False
+        # Whether the run ended by itself, rather than being stopped, so its result can be stored
+        self.run_complete = False
+
+        # Telemetry of the current run. The counters are read from the interpreter by
+        # the GUI thread, so the worker doesn't do anything extra.
+        self.run_start = None
+        self.run_end = None
+        self.input_wait = 0  # Seconds spent waiting for input
+        self.last_sample = None  # (time, instruction count) of the last update
+        # Instruction count at the start, which isn't 0 if the program was run ahead when compiling
+        self.start_instructions = 0
+
+        self.init_widgets()
+
+    def init_widgets(self):
+
+        # FIXME:
+        #   Text changes back to the original font when
+        #   the CodeRunner (self) if dragged out of the docking area.
+
+        self.new_input_signal.connect(self.ask_new_input)
+
+        self.buffer_timer = QTimer(self)
+        self.buffer_timer.timeout.connect(self.add_from_buffer)
+        self.buffer_timer.setInterval(10)
+
+        self.telemetry_timer = QTimer(self)
+        self.telemetry_timer.timeout.connect(self.update_telemetry)
+        self.telemetry_timer.setInterval(self.TELEMETRY_INTERVAL)
+
+        self.output_text = QPlainTextEdit(self)
+        self.output_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.output_text.setMaximumBlockCount(1000)
+        self.output_text.setReadOnly(True)
+
+        self.input_text = InputTextEdit(self)
+        self.input_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.input_text.setMaximumBlockCount(1000)
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(self.output_text)
+        splitter.addWidget(self.input_text)
+
+        self.statusbar = QStatusBar(self)
+
+        layout = QVBoxLayout()
+        layout.addWidget(splitter)
+        layout.addWidget(self.statusbar)
+        self.setLayout(layout)
+
+        self.thread = WorkerThread()
+        # self.thread.progress.connect(self.add_output)
+        # self.thread.progress.connect(self.buffer_output)
+        self.thread.error.connect(self.program_error)
+        # self.thread.finished.connect(self.run_finished)
+
+        self.statusbar.showMessage('Ready')
+
+        self.compile_worker = CompileWorker()
+        self.compile_worker.compiled.connect(self.compile_finished)
+        self.compile_thread = QThread()
+        self.compile_worker.moveToThread(self.compile_thread)
+        self.compile_thread.start()
+        QApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def set_extension(self, extension):
+        self.interpreter_type = self.INTERPRETER_TYPES.get(extension)
+        self.input_text.set_extension(extension)
+        self.compiled_code = None
+
+    def compile_code(self, code, brackets=None):
+        """Compile `code` in the background, so that it can be run straight away.
+        `brackets` is an optional bracket table of `code`, such as the editor's."""
+        if self.interpreter_type is None or code == self.compiled_code:
+            return
+
+        self.compile_request += 1
+        self.compile_worker.latest_request = self.compile_request
+        self.compile_worker.compile_requested.emit(self.compile_request, code,
+                                                   self.compile_func(brackets=brackets))
+
+    def compile_func(self, run_ahead=True, brackets=None):
+        """Return a function that compiles code for `self.interpreter_type` through
+        `PROGRAM_CACHE`. If `run_ahead` is False, then the program's prefix isn't run
+        when compiling, which can take much longer than the rest of the compile.
+        `brackets` is an optional bracket table of the code, such as the editor's."""
+        compile_func = self.interpreter_type.compile
+        if not run_ahead:
+            compile_func = functools.partial(compile_func, prefix_budget=0)
+        return functools.partial(self.PROGRAM_CACHE.compile, compile_func=compile_func, brackets=brackets)
+
+    def engine(self):
+        """Return the interpreter class to run the code with."""
+        if (self.USE_NUMPY and self.interpreter_type is FastBrainfuckInterpreter
+                and self.CELL_BITS == 8 and self.LEFT_EDGE is LeftEdge.ERROR):
+            try:
+                # Imported here, as NumPy is optional and slow to import
+                from numpy_interpreter import NumpyBrainfuckInterpreter
+            except ImportError:
+                pass
+            else:
+                return NumpyBrainfuckInterpreter
+        return self.interpreter_type
+
+    def compile_finished(self, request_id, code, program, error):
+        """Called when the worker has finished compiling. Keep the result if it is
+        for the latest request, and show any syntax error."""
+        if request_id != self.compile_request:
+            return
+
+        self.compiled_code = code
+        self.compiled_program = program
+        self.compile_error = error
+        if not self.thread.isRunning():
+            if error is None:
+                self.statusbar.showMessage('Ready')
+            else:
+                self.statusbar.showMessage(f'Syntax error: {self.error_text(error, SourceMap(code))}')
+
+    def shutdown(self):
+        """Stop the compile thread."""
+        self.compile_thread.quit()
+        self.compile_thread.wait()
+
+    def run_code(self, code, brackets=None):
+        if self.thread.isRunning():
+            self.waiting_for_input = False
+            return
+
+        if self.interpreter_type is None:
+            self.add_output('Invalid file extension')
+            return
+
+        self.cleanup()
+        self.output_text.clear()
+        self.input_text.restart()
+
+        self.interpreter = None
+        self.consumed_input = []
+        self.run_error = None
+        self.result_key = None
+        self.source_map = SourceMap(code)
+        self.run_code_text = code
+        if self.RESULT_CACHE.enabled:
+            self.result_key = self.RESULT_CACHE.program_key(code, self.engine(), self.result_options())
+            result = self.RESULT_CACHE.get(self.result_key, self.read_input)
+            if result is not None:
+                self.show_result(result)
+                return
+
+        self.statusbar.showMessage('Running')
+        try:
+            # Use the program compiled in the background if the code hasn't changed since
+            if code == self.compiled_code:
+                if self.compile_error is not None:
+                    raise self.compile_error
+                program = self.compiled_program
+            else:
+                # Compiled on the GUI thread, so don't run ahead
+                program = self.compile_func(run_ahead=False, brackets=brackets)(code)
+            interpreter = self.engine()(code, input_func=self.next_input,
+                                        output_func=lambda char: self.output_buffer.append(char),
+                                        limits=self.RUN_LIMITS, program=program, left_edge=self.LEFT_EDGE,
+                                        cell_bits=self.CELL_BITS, count_blocks=self.COUNT_EXECUTIONS)
+            # output_func=self.buffer_output)
+            # interpreter = self.interpreter_type(code, input_func=self.io_object.input_.emit,
+            #                                     output_func=self.io_object.output.emit)
+        except ProgramError as error:
+            # The run never started, so there is no output buffer to add the error to
+            self.add_output(f'Error: {self.error_text(error, self.source_map)}')
+            self.statusbar.showMessage('Ready')
+            # self.run_finished()
+        else:
+            # New output added to the right (append to right, pop from left)
+            self.output_buffer = collections.deque()
+
+            self.interpreter = interpreter
+            self.run_start = time.perf_counter()
+            self.run_end = None
+            self.run_complete = False
+            self.input_wait = 0
+            self.start_instructions = interpreter.instruction_count
+            self.last_sample = (self.run_start, interpreter.instruction_count)
+            self.thread.func = functools.partial(self.run_interpreter, interpreter)
+            self.buffer_timer.start()
+            self.telemetry_timer.start()
+            self.thread.start()
+            # self.thread.start(priority=QThread.IdlePriority)
+
+    def run_interpreter(self, interpreter):
+        """Run `interpreter` on the worker thread, recording when and how it ends."""
+        try:
+            output = interpreter.run()
+        except ProgramError:
+            self.run_complete = True
+            raise
+        finally:
+            self.run_end = time.perf_counter()
+        self.run_complete = not self.stopping
+        return output
+
+    def sample_counters(self):
+        """Return a dict of the counters of the current run: 'instructions', 'output'
+        (characters), 'cells', 'time' (seconds since it started) and 'input_wait'."""
+        interpreter = self.interpreter
+        end = self.run_end if self.run_end is not None else time.perf_counter()
+        return {
+            'instructions': interpreter.instruction_count,
+            'output': len(interpreter.output),
+            'cells': len(interpreter.tape),
+            'time': end - self.run_start,
+            'input_wait': self.input_wait,
+        }
+
+    def update_telemetry(self):
+        """Show the counters of the current run, and the instructions per second since
+        the last update, in the status bar."""
+        if self.interpreter is None or self.run_end is not None:
+            return
+
+        counters = self.sample_counters()
+        now = time.perf_counter()
+        last_time, last_instructions = self.last_sample
+        rate = (counters['instructions'] - last_instructions) / max(now - last_time, 1e-9)
+        self.last_sample = (now, counters['instructions'])
+
+        state = 'Waiting for input (Ctrl+B)' if self.waiting_for_input else 'Running'
+        message = (f'{state} {counters["time"]:.1f}s: {self.format_counters(counters)}, '
+                   f'{self.format_count(rate)} instructions/s')
+        if self.output_buffer:
+            message += f', {len(self.output_buffer):,} outputs waiting to be shown'
+        self.statusbar.showMessage(message)
+
+    def run_summary(self):
+        """Return the status bar summary of the run that has just ended."""
+        counters = self.sample_counters()
+        compute_time = max(counters['time'] - counters['input_wait'], 1e-9)
+        rate = (counters['instructions'] - self.start_instructions) / compute_time
+        summary = (f'{"Stopped" if self.run_error is not None else "Finished"} in {counters["time"]:.2f}s: '
+                   f'{self.format_counters(counters)}, {self.format_count(rate)} instructions/s')
+        if counters['input_wait'] >= 0.05:
+            summary += f', {counters["input_wait"]:.2f}s waiting for input'
+        display_lag = time.perf_counter() - self.run_end if self.run_end is not None else 0
+        if display_lag >= 0.1:
+            summary += f', output shown {display_lag:.2f}s after the end'
+        return summary
+
+    @staticmethod
+    def format_counters(counters):
+        return (f'{counters["instructions"]:,} instructions, {counters["output"]:,} output chars, '
+                f'{counters["cells"]:,} cells')
+
+    @staticmethod
+    def format_count(number):
+        """Return `number` rounded with a k, M or G suffix, such as '4.35M'."""
+        for suffix, size in (('G', 1e9), ('M', 1e6), ('k', 1e3)):
+            if number >= size:
+                return f'{number / size:.3g}{suffix}'
+        return f'{number:.0f}'
+
+    def add_output(self, text):
+        self.output_text.moveCursor(QTextCursor.End)
+        self.output_text.insertPlainText(text)
+        self.output_text.ensureCursorVisible()
+
+    def run_finished(self):
+        """Should only be called when execution has been ended and there is nothing left in the output buffer."""
+        self.add_output('\nFinished.')
+        self.buffer_timer.stop()
+        self.telemetry_timer.stop()
+        if self.interpreter is not None and self.run_start is not None:
+            self.statusbar.showMessage(self.run_summary())
+        else:
+            self.statusbar.showMessage('Ready')
+        self.store_result()
+        if self.interpreter is not None and self.interpreter.block_counts is not None:
+            self.execution_counts.emit(self.run_code_text, self.interpreter.source_counts(self.run_code_text))
+
+    def result_options(self):
+        """Return the options, other than the code and input, that change the result of a run."""
+        return self.RUN_LIMITS.max_instructions, self.RUN_LIMITS.max_cells, self.LEFT_EDGE.name, self.CELL_BITS
+
+    def read_input(self, count):
+        """Return up to the first `count` decoded characters of the input, without consuming them."""
+        text = self.input_text.toPlainText()
+        decoder = self.input_text.decoder
+        chars = []
+        position = 0
+        while len(chars) < count:
+            char, length = decoder.decode_next(text[position:])
+            if char is None:
+                break
+            chars.append(char)
+            position += length
+        return ''.join(chars)
+
+    def store_result(self):
+        """Store the result of the run that has just ended in `RESULT_CACHE`."""
+        interpreter = self.interpreter
+        if self.result_key is None or interpreter is None or not self.run_complete:
+            return
+
+        if isinstance(self.run_error, ResourceLimitError):
+            counters = self.run_error.counters
+        else:
+            counters = {
+                'instructions': interpreter.instruction_count,
+                'time': time.perf_counter() - interpreter.start_time,
+                'cells': len(interpreter.tape),
+            }
+        self.RESULT_CACHE.put(self.result_key, ''.join(self.consumed_input), ''.join(interpreter.output),
+                              self.run_error, counters)
+        self.result_key = None
+
+    def show_result(self, result):
+        """Show `result`, a `RunResult` from a previous run, as if the code had just been run."""
+        self.add_output(result.output)
+        if result.error is not None:
+            self.add_output(f'\nError: {self.error_text(result.error, self.source_map)}')
+        self.add_output('\nFinished.')
+        self.statusbar.showMessage(f'Ready (result of a previous run, {result.counters["instructions"]} instructions)')
+
+    def program_error(self, error):
+        if not isinstance(error, InterpreterError):
+            raise error
+        if isinstance(error, NoInputError):
+            # Only raised when waiting for input is stopped by `stop_run`
+            return
+
+        self.run_error = error
+        # self.add_output(error_text)
+        self.buffer_output(f'\nError: {self.error_text(error, self.source_map)}')
+
+    def error_text(self, error, source_map=None):
+        """Return the text describing `error`. If the `SourceMap` of the code is given,
+        then the location is given as a line and column."""
+        error_type = error.error
+        message = error.message
+        if message is None:
+            if error_type is ErrorTypes.UNMATCHED_OPEN_PAREN:
+                message = 'Unmatched opening parentheses'
+            elif error_type is ErrorTypes.UNMATCHED_CLOSE_PAREN:
+                message = 'Unmatched closing parentheses'
+            elif error_type is ErrorTypes.INVALID_TAPE_CELL:
+                message = 'Tape pointer out of bounds'
+            elif error_type is ErrorTypes.INSTRUCTION_LIMIT_EXCEEDED:
+                message = 'Instruction limit exceeded'
+            elif error_type is ErrorTypes.TIME_LIMIT_EXCEEDED:
+                message = 'Time limit exceeded'
+            elif error_type is ErrorTypes.MEMORY_LIMIT_EXCEEDED:
+                message = 'Memory limit exceeded'
+            else:
+                raise error
+
+        error_text = message
+        if error.location is not None:
+            location = source_map.describe(error.location) if source_map is not None else error.location
+            error_text += f' at {location}'
+        if isinstance(error, ResourceLimitError):
+            counters = error.counters
+            error_text += (f' ({counters["instructions"]} instructions, {counters["time"]:.2f}s, '
+                           f'{counters["cells"]} cells)')
+        return error_text
+
+    def cleanup(self):
+        print('closeEvent')
+        print(self.thread.isFinished())
+        # self.thread.quit()
+        self.buffer_timer.stop()
+        self.telemetry_timer.stop()
+        # A terminated run's output is incomplete, so it mustn't be stored
+        self.result_key = None
+        self.thread.terminate()
+        print(self.thread.isFinished())
+
+    def stop_run(self):
+        """Stop the current run and wait for the worker thread to end. Unlike `cleanup`,
+        the thread isn't terminated, so it is safe to call while Python code is running."""
+        self.stopping = True
+        self.waiting_for_input = False
+        interpreter = self.interpreter
+        # The run may not have started yet, in which case it would clear the stop
+        while True:
+            if interpreter is not None:
+                interpreter.stop()
+            if self.thread.wait(50):
+                break
+        self.buffer_timer.stop()
+        self.telemetry_timer.stop()
+        self.result_key = None
+        self.stopping = False
+
+    def buffer_output(self, chars):
+        self.output_buffer.append(chars)
+
+    def add_from_buffer(self):
+        if self.output_buffer:
+            length = min(100, len(self.output_buffer))
+            text = ''.join(self.output_buffer.popleft() for _ in range(length))
+            self.add_output(text)
+        else:
+            if self.thread.isFinished():
+                self.run_finished()
+
+    def next_input(self):
+        input_ = self.input_text.next_()
+        print('in next_input:', repr(input_))
+
+        if input_ is None:
+            while self.output_buffer and not self.stopping:
+                pass
+            if self.stopping:
+                raise NoInputError
+            self.new_input_signal.emit()
+            wait_start = time.perf_counter()
+            self.waiting_for_input = True
+            while self.waiting_for_input:
+                pass
+            self.input_wait += time.perf_counter() - wait_start
+            return self.next_input()
+
+        self.consumed_input.append(input_)
+        return input_
+
+    def ask_new_input(self):
+        self.statusbar.showMessage('Waiting for input. Press Ctrl+B.')
@@ -0,0 +1,234 @@
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_right
+from collections import namedtuple
+
+
+# File layout:
+#   MAGIC
+#   snapshot, records, snapshot, records, ...
+#   index of (instruction count, offset) of every snapshot
+#   footer
+# A snapshot is a SNAPSHOT header followed by the tape and the output written since
+# the previous snapshot. Each record is the state after a single step.
+MAGIC = b'BFTRACE1'
+# code pointer, tape pointer, value of the current cell, output length, input end
+RECORD = struct.Struct('<iIBII')
+# instruction count, code pointer, tape pointer, tape length, output length,
+# output chunk length, input start, input end
+SNAPSHOT = struct.Struct('<QiIIIIII')
+# instruction count, offset
+INDEX_ENTRY = struct.Struct('<QQ')
+# index offset, snapshot count, step count, magic
+FOOTER = struct.Struct('<QQQ8s')
+
+
+TraceState = namedtuple('TraceState', [
+    'instruction_count',
+    'code_pointer',
+    'tape_pointer',
+    'tape',  # bytearray of the tape
+    'output',
+    'input_range',  # (start, end) of the last consumed input
+])
+
+
+class TraceWriter:
+    """Records the execution of a `BFInterpreter` to a binary file.
+
+    Call `record` after every step. Only the first execution of each step is
+    recorded, so stepping back and forwards again doesn't change the trace.
+    A full snapshot of the state is written every `snapshot_interval` steps,
+    so that any step can be found without replaying the whole trace.
+    Call `close` to write the index, or `discard` to delete the file."""
+
+    SNAPSHOT_INTERVAL = 100_000
+    # Size that the buffer of records can grow to before it is written
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, interpreter, input_range=(0, 0), snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.file = open(path, 'wb')
+        self.buffer = bytearray(MAGIC)
+        self.size = len(MAGIC)
+
+        self.index = []
+        self.step_count = interpreter.instruction_count
+        self.block_steps = 0
+        self.input_range = tuple(input_range)
+        self.snapshot_output_length = 0
+
+        self._write_snapshot(interpreter)
+
+    @classmethod
+    def temporary(cls, interpreter, input_range=(0, 0)):
+        """Record to a new file in the temporary directory."""
+        fd, path = tempfile.mkstemp(prefix='bftrace-', suffix='.trace')
+        os.close(fd)
+        return cls(path, interpreter, input_range)
+
+    def record(self, interpreter, input_end):
+        """Record the step that `interpreter` has just executed. `input_end` is the
+        index in the input text that has been consumed up to."""
+        if interpreter.instruction_count <= self.step_count:
+            return
+
+        tape_pointer = interpreter.tape_pointer
+        self.buffer += RECORD.pack(interpreter.code_pointer, tape_pointer, interpreter.tape[tape_pointer],
+                                   len(interpreter.output), input_end)
+        self.size += RECORD.size
+        if input_end != self.input_range[1]:
+            self.input_range = (self.input_range[1], input_end)
+        self.step_count += 1
+        self.block_steps += 1
+
+        if self.block_steps >= self.snapshot_interval:
+            self._write_snapshot(interpreter)
+        if len(self.buffer) >= self.BUFFER_SIZE:
+            self.flush()
+
+    def _write_snapshot(self, interpreter):
+        output = interpreter.output
+        tape = bytes(interpreter.tape)
+        chunk = output[self.snapshot_output_length:].encode('latin-1')
+
+        self.index.append((self.step_count, self.size))
+        header = SNAPSHOT.pack(self.step_count, interpreter.code_pointer, interpreter.tape_pointer,
+                               len(tape), len(output), len(chunk), *self.input_range)
+        self.buffer += header
+        self.buffer += tape
+        self.buffer += chunk
+        self.size += len(header) + len(tape) + len(chunk)
+
+        self.snapshot_output_length = len(output)
+        self.block_steps = 0
+
+    def truncate(self, step_count):
+        """Delete the steps after the first `step_count`, so that they are recorded
+        again when they are next executed. Any `TraceReader` of the file must be
+        closed first."""
+        if step_count >= self.step_count:
+            return
+        self.flush()
+        reader = TraceReader(self.path, self.index, self.step_count)
+        try:
+            state = reader.state_at(step_count)
+            snapshot = bisect_right(reader.snapshot_steps, step_count) - 1
+            count, offset = self.index[snapshot]
+            header = SNAPSHOT.unpack_from(reader.data, offset)
+        finally:
+            reader.close()
+
+        self.size = offset + SNAPSHOT.size + header[3] + header[5] + (step_count - count) * RECORD.size
+        self.file.seek(self.size)
+        self.file.truncate()
+        del self.index[snapshot + 1:]
+        self.step_count = step_count
+        self.block_steps = step_count - count
+        self.input_range = state.input_range
+        self.snapshot_output_length = header[4]
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def reader(self):
+        """Return a `TraceReader` of everything that has been recorded so far."""
+        self.flush()
+        return TraceReader(self.path, list(self.index), self.step_count)
+
+    def close(self):
+        """Write the index and close the file. It can then be opened with `TraceReader`."""
+        if self.file.closed:
+            return
+        for entry in self.index:
+            self.buffer += INDEX_ENTRY.pack(*entry)
+        self.buffer += FOOTER.pack(self.size, len(self.index), self.step_count, MAGIC)
+        self.flush()
+        self.file.close()
+
+    def discard(self):
+        """Close and delete the file."""
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class TraceReader:
+    """Random access to a trace recorded by `TraceWriter`. The file is memory mapped,
+    so only the parts that are needed are ever read.
+
+    `index` and `step_count` are only given for a trace that is still being recorded,
+    otherwise they are read from the end of the file."""
+
+    def __init__(self, path, index=None, step_count=None):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise TraceError(f'{path} is not a trace file')
+
+        if index is None:
+            index, step_count = self._read_index()
+        self.index = index
+        self.snapshot_steps = [count for count, offset in index]
+        self.step_count = step_count
+
+    def __len__(self):
+        return self.step_count
+
+    def _read_index(self):
+        index_offset, snapshot_count, step_count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC:
+            raise TraceError('The trace has no index. It was not closed properly.')
+        index = [INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+                 for i in range(snapshot_count)]
+        return index, step_count
+
+    def state_at(self, instruction_count):
+        """Return the `TraceState` after `instruction_count` steps, by loading the
+        nearest snapshot before it and replaying the records from there."""
+        if not 0 <= instruction_count <= self.step_count:
+            raise IndexError('instruction count out of range')
+
+        snapshot = bisect_right(self.snapshot_steps, instruction_count) - 1
+        output = bytearray()
+        for i in range(snapshot + 1):
+            offset = self.index[i][1]
+            header = SNAPSHOT.unpack_from(self.data, offset)
+            chunk_start = offset + SNAPSHOT.size + header[3]
+            output += self.data[chunk_start:chunk_start + header[5]]
+
+        (count, code_pointer, tape_pointer, tape_length, output_length,
+         chunk_length, input_start, input_end) = header
+        tape_start = offset + SNAPSHOT.size
+        tape = bytearray(self.data[tape_start:tape_start + tape_length])
+
+        records_start = chunk_start + chunk_length
+        records_end = records_start + (instruction_count - count) * RECORD.size
+        for code_pointer, tape_pointer, value, output_length, end in RECORD.iter_unpack(
+                self.data[records_start:records_end]):
+            if tape_pointer >= len(tape):
+                tape.extend(bytes(tape_pointer + 1 - len(tape)))
+            tape[tape_pointer] = value
+            if output_length != len(output):
+                output.append(value)
+            if end != input_end:
+                input_start, input_end = input_end, end
+
+        return TraceState(instruction_count, code_pointer, tape_pointer, tape,
+                          output.decode('latin-1'), (input_start, input_end))
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class TraceError(Exception):
+    pass
@@ -1,338 +1,1021 @@
-import enum
-import functools
-from collections import deque
-
-
-class ErrorTypes(enum.Enum):
-    UNMATCHED_CLOSE_PAREN = enum.auto()
-    UNMATCHED_OPEN_PAREN = enum.auto()
-    INVALID_TAPE_CELL = enum.auto()
-
-
-class BFInterpreter:
-    """Brainfuck interpreter."""
-
-    def __init__(self, code, input_func=input, output_func=print, undo_input_func=None, maxlen=1_000_000):
-        self.code = code
-        self.input_func = input_func
-        self.output_func = output_func
-        self.undo_input_func = undo_input_func
-        self.brackets = self.match_brackets(code)
-        self.tape = [0]
-        self.tape_pointer = 0
-        self.code_pointer = -1
-        self.output = ''
-        self.instruction_count = 0
-        self.past = deque(maxlen=maxlen)
-        self.commands = {
-            '[': self.open_loop,
-            ']': self.close_loop,
-            '>': self.increment_pointer,
-            '<': self.decrement_pointer,
-            '+': self.increment_cell,
-            '-': self.decrement_cell,
-            ',': self.accept_input,
-            '.': self.add_output
-        }
-
-    def step(self):
-        if self.code_pointer + 1 >= len(self.code):
-            raise ExecutionEndedError
-
-        self.past.append((self.code_pointer, self.tape_pointer,
-                          self.tape[self.tape_pointer], len(self.output)))
-
-        self.code_pointer += 1
-        try:
-            while self.current_instruction not in self.commands:
-                self.code_pointer += 1
-        except IndexError:
-            self.code_pointer = self.past.pop()[0]
-            raise ExecutionEndedError
-
-        code_pointer = self.code_pointer
-        self.instruction_count += 1
-
-        self.commands[self.current_instruction]()
-
-        return code_pointer
-
-    def run(self):
-        while True:
-            try:
-                self.step()
-            except ExecutionEndedError:
-                break
-        return self.output
-
-    def open_loop(self):
-        if self.current_cell == 0:
-            self.code_pointer = self.brackets[self.code_pointer]
-
-    def close_loop(self):
-        if self.current_cell != 0:
-            self.code_pointer = self.brackets[self.code_pointer]
-
-    def increment_pointer(self):
-        self.tape_pointer += 1
-        if self.tape_pointer >= len(self.tape):
-            self.tape.append(0)
-
-    def decrement_pointer(self):
-        self.tape_pointer -= 1
-        if self.tape_pointer < 0:
-            error_location = self.code_pointer
-            self.back()  # Reset back to was it was before
-            raise ProgramRuntimeError(
-                ErrorTypes.INVALID_TAPE_CELL, error_location)
-
-    def increment_cell(self):
-        self.tape[self.tape_pointer] = (self.tape[self.tape_pointer] + 1) % 256
-
-    def decrement_cell(self):
-        self.tape[self.tape_pointer] = (self.tape[self.tape_pointer] - 1) % 256
-
-    def accept_input(self):
-        input_ = self.input_func()
-        if input_:
-            self.tape[self.tape_pointer] = ord(input_) % 256
-        else:
-            self.code_pointer = self.past.pop()[0]
-            raise NoInputError
-
-    def add_output(self):
-        self.output += chr(self.current_cell)
-        if self.output_func:
-            self.output_func(self.output)
-
-    def back(self):
-        try:
-            prev_info = self.past.pop()
-        except IndexError:
-            raise NoPreviousExecutionError
-
-        undo_input = self.current_instruction == ','
-        if undo_input and self.undo_input_func is not None:
-            self.undo_input_func()
-
-        self.code_pointer, self.tape_pointer, tape_val, output_len = prev_info
-
-        if output_len != len(self.output):
-            self.output = self.output[:-1]
-            self.output_func(self.output)
-        self.tape[self.tape_pointer] = tape_val
-        self.instruction_count -= 1
-        return self.code_pointer
-
-    @property
-    def current_cell(self):
-        return self.tape[self.tape_pointer]
-
-    @property
-    def current_instruction(self):
-        return self.code[self.code_pointer]
-
-    @staticmethod
-    def match_brackets(code):
-        stack = deque()  # deque is faster than list
-        brackets = {}
-        for i, char in enumerate(code):
-            if char == '[':
-                stack.append(i)
-            elif char == ']':
-                try:
-                    match = stack.pop()
-                except IndexError:
-                    raise ProgramSyntaxError(
-                        ErrorTypes.UNMATCHED_CLOSE_PAREN, i)
-                brackets[match] = i
-                brackets[i] = match
-        if stack:
-            raise ProgramSyntaxError(
-                ErrorTypes.UNMATCHED_OPEN_PAREN, stack[-1])
-        return brackets
-
-
-class FastBrainfuckInterpreter:
-    def __init__(self, code, input_func=input, output_func=None):
-        self.commands, self.brackets = self._compile(code)
-        self.input_func = input_func
-        self.output_func = output_func
-        self.tape = [0] * 40000
-
-        self.reset()
-
-    def run(self):
-        self.running = True
-        while self.running:
-            # self.commands[self.command_pointer]()
-            # self.command_pointer += 1
-            self.step()
-        return ''.join(self.output)
-
-    def step(self):
-        self.commands[self.command_pointer]()
-        self.command_pointer += 1
-
-    def open_loop(self):
-        if self.current_cell == 0:
-            self.command_pointer = self.brackets[self.command_pointer]
-
-    def close_loop(self):
-        if self.current_cell != 0:
-            self.command_pointer = self.brackets[self.command_pointer]
-
-    def pointer_op(self, times):
-        self.tape_pointer += times
-        if self.tape_pointer < 0:
-            raise ProgramRuntimeError(ErrorTypes.INVALID_TAPE_CELL)
-
-    def cell_op(self, times):
-        self.tape[self.tape_pointer] = (
-            self.tape[self.tape_pointer] + times) % 256
-
-    def accept_input(self):
-        input_ = self.input_func()
-        print('input:', repr(input_))
-        self.tape[self.tape_pointer] = ord(input_) % 256
-
-    def add_output(self):
-        self.output.append(chr(self.current_cell))
-        if self.output_func:
-            self.output_func(chr(self.current_cell))
-
-    def stop(self):
-        self.running = False
-
-    def reset(self):
-        self.stop()
-        self.command_pointer = 0
-        self.tape_pointer = 0
-        self.output = []
-
-    @property
-    def current_cell(self):
-        return self.tape[self.tape_pointer]
-
-    def _compile(self, code):
-        command_funcs = {
-            '[': self.open_loop,
-            ']': self.close_loop,
-            '>': self.pointer_op,
-            '<': self.pointer_op,
-            '+': self.cell_op,
-            '-': self.cell_op,
-            ',': self.accept_input,
-            '.': self.add_output
-        }
-
-        pointer_ops = set('<>')
-        cell_ops = set('+-')
-
-        bracket_stack = []
-        brackets = {}
-        final_commands = []
-        code_len = len(code)
-        i = 0
-
-        while i < code_len:
-            char = code[i]
-            arg = None
-
-            if char == '[':
-                bracket_stack.append(len(final_commands))
-            elif char == ']':
-                try:
-                    match = bracket_stack.pop()
-                except IndexError:
-                    raise ProgramSyntaxError(
-                        ErrorTypes.UNMATCHED_CLOSE_PAREN, i)
-                current = len(final_commands)
-                brackets[match] = current
-                brackets[current] = match
-
-            if char in pointer_ops:
-                arg = 0
-                while i < code_len and code[i] in pointer_ops:
-                    arg += 1 if code[i] == '>' else -1
-                    i += 1
-            elif char in cell_ops:
-                arg = 0
-                while i < code_len and code[i] in cell_ops:
-                    arg += 1 if code[i] == '+' else -1
-                    i += 1
-            else:
-                i += 1
-
-            if char in command_funcs:
-                command = command_funcs[char]
-                if arg is None:
-                    final_commands.append(command)
-                else:
-                    final_commands.append(functools.partial(command, arg))
-
-        final_commands.append(self.stop)
-
-        if bracket_stack:
-            raise ProgramSyntaxError(
-                ErrorTypes.UNMATCHED_OPEN_PAREN)
-        return final_commands, brackets
-
-
-class InterpreterError(Exception):
-    """Base class for exceptions to do with an interpreter.
-
-    Attributes:
-        message -- Optional message describing error"""
-
-    def __init__(self, message=None):
-        self.message = message
-
-
-class ExecutionEndedError(InterpreterError):
-    """Error raised when program has ended but `Interpreter.step` is still called"""
-
-
-class NoPreviousExecutionError(InterpreterError):
-    """Error raised when `Interpreter.back` is called but it is the first instruction being processed"""
-
-
-class NoInputError(InterpreterError):
-    """Error raised when no input returned from `Interpreter.input_func`"""
-
-
-class ProgramError(InterpreterError):
-    """Error raised when there is something wrong with a program.
-
-    Attributes:
-        error -- Source of error (default to None).
-        location -- Location of error (default to None).
-        message -- Optional mesage (default to None)."""
-
-    def __init__(self, error=None, location=None, message=None):
-        super().__init__(message)
-        self.error = error
-        self.location = location
-
-
-class ProgramSyntaxError(ProgramError):
-    """Error raised when there is a syntax error with the source code of a program."""
-
-
-class ProgramRuntimeError(ProgramError):
-    """Error raised when there is a error while the program is running. (Does not include missing input.)"""
-
-
-if __name__ == '__main__':
-    # with open(r'programs\sample\hello_world.b') as file:
-    # with open(r'programs\mine\foo.b') as file:
-    with open(r'programs\sample\mandelbrot.b') as file:
-        prog = file.read()
-
-    # interpreter = BFInterpreter(prog, output_func=print)
-    # for i in range(100_000):
-    #     interpreter.step()
-
-    interpreter = FastBrainfuckInterpreter(prog, output_func=lambda x: print(x, end=''))
-    # interpreter = FastBrainfuckInterpreter(prog, output_func=print)
-    interpreter.run()
+import enum
+import functools
+import re
+import time
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+from tape import LeftEdge, PagedTape
+
+
+class ErrorTypes(enum.Enum):
+    UNMATCHED_CLOSE_PAREN = enum.auto()
+    UNMATCHED_OPEN_PAREN = enum.auto()
+    INVALID_TAPE_CELL = enum.auto()
+    INSTRUCTION_LIMIT_EXCEEDED = enum.auto()
+    TIME_LIMIT_EXCEEDED = enum.auto()
+    MEMORY_LIMIT_EXCEEDED = enum.auto()
+
+
+class RunLimits:
+    """Resource limits for a single run. A limit of None means that there is no limit.
+
+    The limits are only checked once per loop iteration (and when the tape grows),
+    so a program may run slightly past `max_instructions` before it is stopped.
+
+    Attributes:
+        max_instructions -- Maximum number of instructions to execute.
+        max_time -- Maximum wall time of the run in seconds.
+        max_cells -- Maximum number of tape cells."""
+
+    # Number of instructions executed between each check of the wall time
+    TIME_CHECK_INTERVAL = 10_000
+
+    def __init__(self, max_instructions=None, max_time=None, max_cells=None):
+        self.max_instructions = max_instructions
+        self.max_time = max_time
+        self.max_cells = max_cells
+
+    def next_check(self, instruction_count):
+        """Return the instruction count at which the limits should next be checked."""
+        next_check = float('inf')
+        if self.max_instructions is not None:
+            next_check = self.max_instructions
+        if self.max_time is not None:
+            next_check = min(next_check, instruction_count + self.TIME_CHECK_INTERVAL)
+        return next_check
+
+    def check(self, instruction_count, cells, start_time, location=None):
+        """Raise `ResourceLimitError` if any limit has been exceeded."""
+        elapsed = time.perf_counter() - start_time
+        if self.max_instructions is not None and instruction_count > self.max_instructions:
+            error_type = ErrorTypes.INSTRUCTION_LIMIT_EXCEEDED
+        elif self.max_time is not None and elapsed > self.max_time:
+            error_type = ErrorTypes.TIME_LIMIT_EXCEEDED
+        elif self.max_cells is not None and cells > self.max_cells:
+            error_type = ErrorTypes.MEMORY_LIMIT_EXCEEDED
+        else:
+            return
+
+        counters = {
+            'instructions': instruction_count,
+            'time': elapsed,
+            'cells': cells,
+        }
+        raise ResourceLimitError(error_type, location, counters=counters)
+
+    def allows(self, instruction_count, cells):
+        """Return whether `instruction_count` and `cells` are within the limits."""
+        return ((self.max_instructions is None or instruction_count <= self.max_instructions)
+                and (self.max_cells is None or cells <= self.max_cells))
+
+
+class ExecutionHooks:
+    """Callbacks that are called on events while a program runs, for tools such as
+    profilers and tracers. Each event is called with the interpreter, then the event's
+    arguments:
+
+        'loop_enter' -- (command) When a loop starts, at its opening bracket.
+        'loop_exit' -- (command) When a loop ends. `command` is its opening bracket.
+        'input' -- (value) After a cell is set to `value` from the input.
+        'output' -- (value) After the value of a cell is output.
+        'tape_growth' -- (cells) After the tape grows to `cells` cells.
+        'tick' -- (instruction_count) Every `tick_interval` instructions. Only called at
+                  the brackets, so may be a few instructions late.
+
+    `command` is the index of the command in the code for `BFInterpreter`, and in the
+    compiled program for `FastBrainfuckInterpreter`. `interpreter.source_index(command)`
+    is its index in the code for both. Loops that are skipped aren't
+    entered, so call neither 'loop_enter' nor 'loop_exit'.
+
+    The interpreters only use instrumented commands for the events that have callbacks,
+    so events without callbacks don't slow down the run. Callbacks should be subscribed
+    before the interpreter is created.
+
+    Attributes:
+        callbacks -- Dict mapping each event to the list of its callbacks.
+        tick_interval -- Number of instructions between 'tick' events."""
+
+    EVENTS = ('loop_enter', 'loop_exit', 'input', 'output', 'tape_growth', 'tick')
+
+    def __init__(self, tick_interval=1_000_000):
+        self.callbacks = {event: [] for event in self.EVENTS}
+        self.tick_interval = tick_interval
+
+    def subscribe(self, event, callback):
+        self.callbacks[event].append(callback)
+
+    def unsubscribe(self, event, callback):
+        self.callbacks[event].remove(callback)
+
+    def subscribed(self, *events):
+        """Return whether any of `events` have callbacks."""
+        return any(self.callbacks[event] for event in events)
+
+    def emit(self, event, interpreter, *args):
+        for callback in self.callbacks[event]:
+            callback(interpreter, *args)
+
+    def next_tick(self, instruction_count):
+        """Return the instruction count of the next 'tick' event after `instruction_count`."""
+        return (instruction_count // self.tick_interval + 1) * self.tick_interval
+
+
+class BFInterpreter:
+    """Brainfuck interpreter.
+
+    `brackets` is an optional bracket table of `code`, as returned by `match_brackets`,
+    so that the code doesn't have to be scanned again.
+
+    `hooks` is an optional `ExecutionHooks`. Its events are only called when stepping
+    forwards, so stepping back and then forwards again calls them again."""
+
+    def __init__(self, code, input_func=input, output_func=print, undo_input_func=None, maxlen=1_000_000,
+                 limits=None, brackets=None, hooks=None):
+        self.code = code
+        self.input_func = input_func
+        self.output_func = output_func
+        self.undo_input_func = undo_input_func
+        self.brackets = brackets if brackets is not None else self.match_brackets(code)
+        self.tape = [0]
+        self.tape_pointer = 0
+        self.code_pointer = -1
+        self.output = ''
+        self.instruction_count = 0
+        self.past = deque(maxlen=maxlen)
+        self.limits = limits if limits is not None else RunLimits()
+        self.start_time = time.perf_counter()
+        self.next_limit_check = self.limits.next_check(0)
+        self.commands = {
+            '[': self.open_loop,
+            ']': self.close_loop,
+            '>': self.increment_pointer,
+            '<': self.decrement_pointer,
+            '+': self.increment_cell,
+            '-': self.decrement_cell,
+            ',': self.accept_input,
+            '.': self.add_output
+        }
+        self.hooks = hooks
+        if hooks is not None:
+            self.next_tick = hooks.next_tick(0)
+            self.commands.update(self._hooked_commands(hooks))
+
+    def step(self):
+        if self.code_pointer + 1 >= len(self.code):
+            raise ExecutionEndedError
+
+        self.past.append((self.code_pointer, self.tape_pointer,
+                          self.tape[self.tape_pointer], len(self.output)))
+
+        self.code_pointer += 1
+        try:
+            while self.current_instruction not in self.commands:
+                self.code_pointer += 1
+        except IndexError:
+            self.code_pointer = self.past.pop()[0]
+            raise ExecutionEndedError
+
+        code_pointer = self.code_pointer
+        self.instruction_count += 1
+
+        self.commands[self.current_instruction]()
+
+        return code_pointer
+
+    def run(self):
+        while True:
+            try:
+                self.step()
+            except ExecutionEndedError:
+                break
+        return self.output
+
+    def open_loop(self):
+        if self.instruction_count >= self.next_limit_check:
+            self.check_limits()
+        if self.current_cell == 0:
+            self.code_pointer = self.brackets[self.code_pointer]
+
+    def close_loop(self):
+        if self.instruction_count >= self.next_limit_check:
+            self.check_limits()
+        if self.current_cell != 0:
+            self.code_pointer = self.brackets[self.code_pointer]
+
+    def increment_pointer(self):
+        self.tape_pointer += 1
+        if self.tape_pointer >= len(self.tape):
+            if self.limits.max_cells is not None and len(self.tape) >= self.limits.max_cells:
+                self.check_limits(cells=len(self.tape) + 1)
+            self.tape.append(0)
+            if self.hooks is not None:
+                self.hooks.emit('tape_growth', self, len(self.tape))
+
+    def decrement_pointer(self):
+        self.tape_pointer -= 1
+        if self.tape_pointer < 0:
+            error_location = self.code_pointer
+            self.back()  # Reset back to was it was before
+            raise ProgramRuntimeError(
+                ErrorTypes.INVALID_TAPE_CELL, error_location)
+
+    def increment_cell(self):
+        self.tape[self.tape_pointer] = (self.tape[self.tape_pointer] + 1) % 256
+
+    def decrement_cell(self):
+        self.tape[self.tape_pointer] = (self.tape[self.tape_pointer] - 1) % 256
+
+    def accept_input(self):
+        input_ = self.input_func()
+        if input_:
+            self.tape[self.tape_pointer] = ord(input_) % 256
+        else:
+            self.code_pointer = self.past.pop()[0]
+            self.instruction_count -= 1
+            raise NoInputError
+
+    def add_output(self):
+        self.output += chr(self.current_cell)
+        if self.output_func:
+            self.output_func(self.output)
+
+    def back(self):
+        try:
+            prev_info = self.past.pop()
+        except IndexError:
+            raise NoPreviousExecutionError
+
+        undo_input = self.current_instruction == ','
+        if undo_input and self.undo_input_func is not None:
+            self.undo_input_func()
+
+        self.code_pointer, self.tape_pointer, tape_val, output_len = prev_info
+
+        if output_len != len(self.output):
+            self.output = self.output[:-1]
+            self.output_func(self.output)
+        self.tape[self.tape_pointer] = tape_val
+        self.instruction_count -= 1
+        return self.code_pointer
+
+    def _hooked_commands(self, hooks):
+        """Return a dict of the instrumented commands for the events of `hooks` that
+        have callbacks."""
+        commands = {}
+        if hooks.subscribed('loop_enter', 'loop_exit', 'tick'):
+            commands['['] = self.open_loop_hooked
+            commands[']'] = self.close_loop_hooked
+        if hooks.subscribed('input'):
+            commands[','] = self.accept_input_hooked
+        if hooks.subscribed('output'):
+            commands['.'] = self.add_output_hooked
+        return commands
+
+    def open_loop_hooked(self):
+        code_pointer = self.code_pointer
+        self.open_loop()
+        if self.code_pointer == code_pointer:
+            self.hooks.emit('loop_enter', self, code_pointer)
+        if self.instruction_count >= self.next_tick:
+            self._tick()
+
+    def close_loop_hooked(self):
+        code_pointer = self.code_pointer
+        self.close_loop()
+        if self.code_pointer == code_pointer:
+            self.hooks.emit('loop_exit', self, self.brackets[code_pointer])
+        if self.instruction_count >= self.next_tick:
+            self._tick()
+
+    def accept_input_hooked(self):
+        self.accept_input()
+        self.hooks.emit('input', self, self.current_cell)
+
+    def add_output_hooked(self):
+        self.add_output()
+        self.hooks.emit('output', self, self.current_cell)
+
+    def _tick(self):
+        self.next_tick = self.hooks.next_tick(self.instruction_count)
+        self.hooks.emit('tick', self, self.instruction_count)
+
+    def restore(self, code_pointer, tape_pointer, tape, output, instruction_count):
+        """Jump straight to the given state, eg. one loaded from an execution trace.
+        The history is cleared, so it isn't possible to step back past this state."""
+        self.code_pointer = code_pointer
+        self.tape_pointer = tape_pointer
+        self.tape = list(tape)
+        self.output = output
+        self.instruction_count = instruction_count
+        self.past.clear()
+        if self.output_func:
+            self.output_func(self.output)
+
+    def check_limits(self, cells=None):
+        """Check `self.limits` against the current counters. If a limit has been
+        exceeded, reset back to before the current instruction and raise `ResourceLimitError`."""
+        if cells is None:
+            cells = len(self.tape)
+        error_location = self.code_pointer
+        try:
+            self.limits.check(self.instruction_count, cells, self.start_time, error_location)
+        except ResourceLimitError:
+            self.back()  # Reset back to was it was before
+            raise
+        self.next_limit_check = self.limits.next_check(self.instruction_count)
+
+    @property
+    def current_cell(self):
+        return self.tape[self.tape_pointer]
+
+    @property
+    def current_instruction(self):
+        return self.code[self.code_pointer]
+
+    def source_index(self, command):
+        """Return the index in the code of `command`, as given to `ExecutionHooks`."""
+        return command
+
+    def executed_count(self):
+        """Return the number of instructions that have been run, which is always
+        `self.instruction_count`."""
+        return self.instruction_count
+
+    @staticmethod
+    def match_brackets(code):
+        stack = deque()  # deque is faster than list
+        brackets = {}
+        for i, char in enumerate(code):
+            if char == '[':
+                stack.append(i)
+            elif char == ']':
+                try:
+                    match = stack.pop()
+                except IndexError:
+                    raise ProgramSyntaxError(
+                        ErrorTypes.UNMATCHED_CLOSE_PAREN, i)
+                brackets[match] = i
+                brackets[i] = match
+        if stack:
+            raise ProgramSyntaxError(
+                ErrorTypes.UNMATCHED_OPEN_PAREN, stack[-1])
+        return brackets
+
+
+class FastBrainfuckInterpreter:
+    """Brainfuck interpreter that compiles the code before running it.
+
+    `program` is an optional `CompiledProgram` of `code`, returned by `compile`,
+    so that the code doesn't have to be compiled again. If the program has a prefix,
+    then it starts from the end of the prefix, unless that would pass the limits.
+
+    Where the program's pointer offsets are known, the tape is allocated to fit them,
+    and the pointer ops that stay inside it aren't bounds checked.
+
+    The tape starts as a list. It is changed to a `PagedTape` when it would grow past
+    `PAGED_TAPE_CELLS`, or the pointer moves left of the first cell and `left_edge`
+    is `LeftEdge.EXTEND`.
+
+    `cell_bits` is the width of the cells, 8, 16 or 32, or None for unbounded cells.
+    Each width has its own cell op, so the width doesn't slow down the other widths.
+
+    `hooks` is an optional `ExecutionHooks`. Only the commands of the events that have
+    callbacks are bound to instrumented commands. When there are hooks, the prefix isn't
+    used, so that the events of the whole run are called.
+
+    If `count_blocks` is True, then the brackets also count the number of times that the
+    basic block after them is run, for `command_counts` and `source_counts`."""
+
+    TAPE_SIZE = 40000
+    PAGED_TAPE_CELLS = 1 << 20
+    # Typecode of the pages of a `PagedTape` for each cell width
+    PAGE_TYPECODES = {8: 'B', 16: 'H', 32: 'I', None: None}
+    # Maximum number of instructions to run ahead when compiling
+    PREFIX_BUDGET = 1_000_000
+
+    def __init__(self, code, input_func=input, output_func=None, limits=None, brackets=None, program=None,
+                 left_edge=LeftEdge.ERROR, cell_bits=8, hooks=None, count_blocks=False):
+        if program is None:
+            program = self.compile(code, brackets)
+        self.program = program
+        self.hooks = hooks
+        # Number of times the block after each bracket has been run, or None if not counting
+        self.block_counts = [] if count_blocks else None
+        self.input_func = input_func
+        self.output_func = output_func
+        self.limits = limits if limits is not None else RunLimits()
+        self.left_edge = left_edge
+        if cell_bits not in self.PAGE_TYPECODES:
+            raise ValueError(f'Invalid cell width: {cell_bits}')
+        self.cell_bits = cell_bits
+        self.cell_mask = (1 << cell_bits) - 1 if cell_bits is not None else None
+        self.tape_size = self._tape_size(program)
+        self.commands = self._bind(program)
+        self.brackets = program.brackets
+        self.positions = program.positions
+        self.block_costs = program.block_costs
+        self.start_cost = program.start_cost
+
+        self.reset()
+
+    def run(self):
+        self.running = True
+        self.start_time = time.perf_counter()
+        self.next_limit_check = self.limits.next_check(self.instruction_count)
+        if self.prefix_output:
+            if self.output_func:
+                self.output_func(self.prefix_output)
+            self.prefix_output = ''
+        while self.running:
+            # self.commands[self.command_pointer]()
+            # self.command_pointer += 1
+            self.step()
+        return ''.join(self.output)
+
+    def step(self):
+        self.commands[self.command_pointer]()
+        self.command_pointer += 1
+
+    def open_loop(self):
+        if self.current_cell == 0:
+            self.command_pointer = self.brackets[self.command_pointer]
+        self.instruction_count += self.block_costs[self.command_pointer]
+        if self.instruction_count >= self.next_limit_check:
+            self.check_limits()
+
+    def close_loop(self):
+        if self.current_cell != 0:
+            self.command_pointer = self.brackets[self.command_pointer]
+        self.instruction_count += self.block_costs[self.command_pointer]
+        if self.instruction_count >= self.next_limit_check:
+            self.check_limits()
+
+    def open_loop_hooked(self):
+        command_pointer = self.command_pointer
+        self.open_loop()
+        if self.command_pointer == command_pointer:
+            self.hooks.emit('loop_enter', self, command_pointer)
+        if self.instruction_count >= self.next_tick:
+            self._tick()
+
+    def close_loop_hooked(self):
+        command_pointer = self.command_pointer
+        self.close_loop()
+        if self.command_pointer == command_pointer:
+            self.hooks.emit('loop_exit', self, self.brackets[command_pointer])
+        if self.instruction_count >= self.next_tick:
+            self._tick()
+
+    def _tick(self):
+        self.next_tick = self.hooks.next_tick(self.instruction_count)
+        self.hooks.emit('tick', self, self.instruction_count)
+
+    def count_block(self, command):
+        """Run the bracket `command`, then count the block that it jumps to."""
+        command()
+        self.block_counts[self.command_pointer] += 1
+
+    def pointer_op(self, times):
+        self.tape_pointer += times
+        if not self.tape_start <= self.tape_pointer < self.tape_end:
+            self._grow_tape()
+
+    def move_pointer(self, times):
+        """`pointer_op` for moves that are known to stay inside the tape."""
+        self.tape_pointer += times
+
+    def _grow_tape(self):
+        """Called when `self.tape_pointer` is outside of `self.tape_start` to `self.tape_end`.
+        Extend a list tape to fit the pointer, doubling its size where `self.limits` allows,
+        or change it to a `PagedTape` if it would be too big. For a paged tape, allocate the
+        page that the pointer is on."""
+        tape_pointer = self.tape_pointer
+        if tape_pointer < 0 and self.left_edge is LeftEdge.ERROR:
+            raise ProgramRuntimeError(ErrorTypes.INVALID_TAPE_CELL, self.positions[self.command_pointer])
+
+        max_cells = self.limits.max_cells
+        if isinstance(self.tape, list):
+            size = max(tape_pointer + 1, len(self.tape) * 2)
+            if 0 <= tape_pointer and size <= self.PAGED_TAPE_CELLS:
+                if max_cells is not None:
+                    self.check_limits(cells=tape_pointer + 1)
+                    size = min(size, max_cells)
+                self.tape.extend([0] * (size - len(self.tape)))
+                self.tape_end = len(self.tape)
+                self._tape_grown()
+                return
+            self.tape = PagedTape(self.tape, self.PAGE_TYPECODES[self.cell_bits])
+
+        if not self.tape.has_page(tape_pointer):
+            if max_cells is not None:
+                self.check_limits(cells=len(self.tape) + PagedTape.PAGE_SIZE)
+            self.tape.page(tape_pointer)
+            self._tape_grown()
+        self.tape_start, self.tape_end = self.tape.page_range(tape_pointer)
+
+    def _tape_grown(self):
+        if self.hooks is not None:
+            self.hooks.emit('tape_growth', self, len(self.tape))
+
+    def check_limits(self, cells=None):
+        """Check `self.limits` against the current counters. Raise `ResourceLimitError`
+        if a limit has been exceeded."""
+        if cells is None:
+            cells = len(self.tape)
+        location = self.positions[self.command_pointer]
+        self.limits.check(self.instruction_count, cells, self.start_time, location)
+        self.next_limit_check = self.limits.next_check(self.instruction_count)
+
+    def cell_op(self, times):
+        self.tape[self.tape_pointer] = (
+            self.tape[self.tape_pointer] + times) & 0xFF
+
+    def cell_op_16(self, times):
+        self.tape[self.tape_pointer] = (
+            self.tape[self.tape_pointer] + times) & 0xFFFF
+
+    def cell_op_32(self, times):
+        self.tape[self.tape_pointer] = (
+            self.tape[self.tape_pointer] + times) & 0xFFFFFFFF
+
+    def cell_op_unbounded(self, times):
+        self.tape[self.tape_pointer] += times
+
+    def accept_input(self):
+        input_ = self.input_func()
+        value = ord(input_)
+        if self.cell_mask is not None:
+            value &= self.cell_mask
+        self.tape[self.tape_pointer] = value
+
+    def add_output(self):
+        # Wide cells can be past the last unicode character
+        char = chr(self.current_cell % 0x110000)
+        self.output.append(char)
+        if self.output_func:
+            self.output_func(char)
+
+    def accept_input_hooked(self):
+        self.accept_input()
+        self.hooks.emit('input', self, self.current_cell)
+
+    def add_output_hooked(self):
+        self.add_output()
+        self.hooks.emit('output', self, self.current_cell)
+
+    def stop(self):
+        self.running = False
+
+    def reset(self):
+        self.stop()
+        self.command_pointer = 0
+        self.tape_pointer = 0
+        self.tape = [0] * self.tape_size
+        self.output = []
+        # Instructions are counted a whole basic block at a time
+        self.instruction_count = self.start_cost
+        # Output of the prefix that hasn't been passed to `self.output_func` yet
+        self.prefix_output = ''
+
+        if self.hooks is not None:
+            self.next_tick = self.hooks.next_tick(self.instruction_count)
+        if self.block_counts is not None:
+            self.block_counts = [0] * len(self.program.ops)
+
+        # The prefix is run with 8 bit cells, and without hooks or block counts
+        prefix = self.program.prefix
+        if (prefix is not None and self.cell_bits == 8 and self.hooks is None and self.block_counts is None
+                and self.limits.allows(prefix.instruction_count, len(prefix.tape))):
+            self.command_pointer = prefix.command_pointer
+            self.tape_pointer = prefix.tape_pointer
+            self.tape[:len(prefix.tape)] = prefix.tape
+            self.output = list(prefix.output)
+            self.instruction_count = prefix.instruction_count
+            self.prefix_output = prefix.output
+        # Range of the tape that the pointer can move in without calling `_grow_tape`
+        self.tape_start = 0
+        self.tape_end = len(self.tape)
+
+    @property
+    def current_cell(self):
+        return self.tape[self.tape_pointer]
+
+    def source_index(self, command):
+        """Return the index in the code of `command`, as given to `ExecutionHooks`."""
+        return self.positions[command]
+
+    def executed_count(self):
+        """Return the number of instructions that have been run. `self.instruction_count`
+        counts each basic block when it starts, so this takes off the part of the current
+        block that hasn't been run yet. At a bracket, that is the block after it, and at
+        any other command, it is that command up to the end of its block."""
+        command = self.command_pointer
+        if command in self.brackets:
+            return self.instruction_count - self.block_costs[command]
+        if command == 0:
+            return self.instruction_count - self.start_cost
+        return self.instruction_count - self.block_costs[command - 1]
+
+    def command_counts(self):
+        """Return the number of times that each command of the program has been run,
+        from the block counts. The last block of a run that ended with an error is
+        counted as if it had been run to the end."""
+        counts = [0] * len(self.program.ops)
+        # The block before the first bracket is run once
+        count = 1
+        for command in range(len(counts)):
+            counts[command] = count
+            if command in self.brackets:
+                count = self.block_counts[command]
+        return counts
+
+    def source_counts(self, code):
+        """Return the number of times that each character of `code`, the code of the
+        program, has been run. Characters that aren't commands are 0."""
+        counts = [0] * len(code)
+        for command, count in enumerate(self.command_counts()):
+            if count:
+                start, end = self.program.span(command)
+                for index in range(start, end):
+                    if code[index] in '[]<>+-,.':
+                        counts[index] = count
+        return counts
+
+    def _tape_size(self, program):
+        """Return the initial size of the tape for `program`. If all of its pointer
+        offsets are known, then the tape fits exactly the cells that it can touch."""
+        size = self.TAPE_SIZE
+        if program.extent is not None:
+            if None in program.offsets:
+                size = max(size, program.extent[1] + 1)
+            else:
+                size = max(program.extent[1] + 1, 1)
+            if size > self.PAGED_TAPE_CELLS:
+                # Too big for a list tape, so leave it to grow into a paged tape
+                size = self.TAPE_SIZE
+        if self.limits.max_cells is not None:
+            size = min(size, self.limits.max_cells)
+        return size
+
+    def _bind(self, program):
+        """Return the list of commands of `program`, bound to this interpreter."""
+        cell_ops = {
+            8: self.cell_op,
+            16: self.cell_op_16,
+            32: self.cell_op_32,
+            None: self.cell_op_unbounded,
+        }
+        command_funcs = {
+            '[': self.open_loop,
+            ']': self.close_loop,
+            '>': self.pointer_op,
+            '+': cell_ops[self.cell_bits],
+            ',': self.accept_input,
+            '.': self.add_output,
+            None: self.stop,
+        }
+        hooks = self.hooks
+        if hooks is not None:
+            if hooks.subscribed('loop_enter', 'loop_exit', 'tick'):
+                command_funcs['['] = self.open_loop_hooked
+                command_funcs[']'] = self.close_loop_hooked
+            if hooks.subscribed('input'):
+                command_funcs[','] = self.accept_input_hooked
+            if hooks.subscribed('output'):
+                command_funcs['.'] = self.add_output_hooked
+        if self.block_counts is not None:
+            command_funcs['['] = functools.partial(self.count_block, command_funcs['['])
+            command_funcs[']'] = functools.partial(self.count_block, command_funcs[']'])
+
+        # Commands with the same function and arg can share the same partial
+        bound = {}
+        commands = []
+        for op, arg, offset in zip(program.ops, program.args, program.offsets):
+            func = command_funcs[op]
+            if op == '>' and offset is not None and 0 <= offset + arg < self.tape_size:
+                func = self.move_pointer
+            command = bound.get((func, arg))
+            if command is None:
+                command = func
+                if arg is not None:
+                    command = functools.partial(command, arg)
+                bound[func, arg] = command
+            commands.append(command)
+        return commands
+
+    @staticmethod
+    def compile(code, source_brackets=None, prefix_budget=PREFIX_BUDGET):
+        """Compile `code` into a `CompiledProgram`. If the bracket table of the source,
+        `source_brackets`, is given, then it is used to match the brackets.
+        The part of the program before its first input is run ahead for up to
+        `prefix_budget` instructions, see `evaluate_prefix`.
+        Doesn't depend on an interpreter, so it can be run on any thread."""
+        commands = set('[]<>+-,.')
+        pointer_ops = set('<>')
+        cell_ops = set('+-')
+
+        bracket_stack = []
+        # Command index of each opening bracket, by source index
+        open_commands = {}
+        brackets = {}
+        ops = []
+        args = []
+        # Source index, end source index and number of source instructions of each command
+        positions = []
+        ends = []
+        costs = []
+        code_len = len(code)
+        i = 0
+
+        while i < code_len:
+            char = code[i]
+            start = i
+            arg = None
+
+            if char == '[':
+                if source_brackets is None:
+                    bracket_stack.append(len(ops))
+                else:
+                    open_commands[i] = len(ops)
+            elif char == ']':
+                if source_brackets is not None:
+                    match = open_commands[source_brackets[i]]
+                else:
+                    try:
+                        match = bracket_stack.pop()
+                    except IndexError:
+                        raise ProgramSyntaxError(
+                            ErrorTypes.UNMATCHED_CLOSE_PAREN, i)
+                current = len(ops)
+                brackets[match] = current
+                brackets[current] = match
+
+            if char in pointer_ops:
+                arg = 0
+                while i < code_len and code[i] in pointer_ops:
+                    arg += 1 if code[i] == '>' else -1
+                    i += 1
+                char = '>'
+            elif char in cell_ops:
+                arg = 0
+                while i < code_len and code[i] in cell_ops:
+                    arg += 1 if code[i] == '+' else -1
+                    i += 1
+                char = '+'
+            else:
+                i += 1
+
+            if char in commands:
+                ops.append(char)
+                args.append(arg)
+                positions.append(start)
+                ends.append(i)
+                costs.append(i - start)
+
+        # Stop at the end
+        ops.append(None)
+        args.append(None)
+        positions.append(code_len)
+        ends.append(code_len)
+        costs.append(0)
+
+        if bracket_stack:
+            raise ProgramSyntaxError(
+                ErrorTypes.UNMATCHED_OPEN_PAREN, positions[bracket_stack[-1]])
+
+        # `block_costs[i]` is the number of source instructions from command i + 1 up to
+        # and including the next bracket. This is the basic block that will be executed
+        # after the bracket at i jumps to (or falls through to) i.
+        block_costs = [0] * len(ops)
+        cost = 0
+        for index in range(len(ops) - 1, -1, -1):
+            block_costs[index] = cost
+            cost = costs[index] + (0 if index in brackets else cost)
+
+        offsets, extent = FastBrainfuckInterpreter.analyse_pointer(ops, args, brackets)
+        program = CompiledProgram(ops, args, positions, brackets, block_costs, cost, offsets, extent, ends=ends)
+        if prefix_budget:
+            program = FastBrainfuckInterpreter.evaluate_prefix(program, prefix_budget)
+        return program
+
+    @classmethod
+    def evaluate_prefix(cls, program, budget=PREFIX_BUDGET):
+        """Run `program` up to its first input command, or for about `budget` instructions,
+        and return a copy of it with the state reached as its prefix. The whole program
+        is run if it never takes input. Returns `program` itself if there is nothing to
+        run ahead, or the prefix has a runtime error."""
+        def input_required():
+            raise NoInputError
+
+        interpreter = cls('', input_func=input_required, limits=RunLimits(max_instructions=budget),
+                          program=program)
+        try:
+            interpreter.run()
+        except NoInputError:
+            command_pointer = interpreter.command_pointer
+        except ResourceLimitError:
+            # Raised by a bracket, after it has jumped
+            command_pointer = interpreter.command_pointer + 1
+        except ProgramRuntimeError:
+            return program
+        else:
+            command_pointer = len(program.ops) - 1
+
+        # Paged tapes are for programs that use a lot of the tape, so aren't worth storing
+        if command_pointer == 0 or not isinstance(interpreter.tape, list):
+            return program
+
+        tape = interpreter.tape
+        length = interpreter.tape_pointer + 1
+        for index in range(len(tape) - 1, length - 1, -1):
+            if tape[index]:
+                length = index + 1
+                break
+        prefix = ProgramPrefix(command_pointer, interpreter.tape_pointer, bytes(tape[:length]),
+                               ''.join(interpreter.output), interpreter.instruction_count)
+        return program.replace(prefix=prefix)
+
+    @staticmethod
+    def analyse_pointer(ops, args, brackets):
+        """Return the pointer offset, from the start of the tape, before each of `ops`,
+        and the (min, max) of the known offsets, or None if none are known.
+
+        A loop is balanced if its body always moves the pointer back to where it started.
+        The offsets are known everywhere except inside and after unbalanced loops, where
+        they are None. If all of the offsets are known, then they are the only cells that
+        the program can touch."""
+        # Net pointer movement of the body of each loop by its opening bracket,
+        # or None if it depends on the tape
+        loop_moves = {}
+        moves = [0]
+        for index, op in enumerate(ops):
+            if op == '[':
+                moves.append(0)
+            elif op == ']':
+                move = moves.pop()
+                loop_moves[brackets[index]] = move
+                if move != 0:
+                    moves[-1] = None
+            elif op == '>' and moves[-1] is not None:
+                moves[-1] += args[index]
+
+        offsets = []
+        offset = 0
+        for index, op in enumerate(ops):
+            offsets.append(offset)
+            if op == '[' and loop_moves[index] != 0:
+                offset = None
+            elif op == '>' and offset is not None:
+                offset += args[index]
+
+        known = [offset for offset in offsets if offset is not None]
+        extent = (min(known), max(known)) if known else None
+        return offsets, extent
+
+
+class CompiledProgram:
+    """Brainfuck program compiled by `FastBrainfuckInterpreter.compile`. It only contains
+    plain data, so it can be shared between interpreters.
+
+    Attributes:
+        ops -- Op of each command. '>' and '+' are runs of pointer and cell ops with
+               their total in `args`. The last op is None, which stops the program.
+        args -- Argument of each command, or None.
+        positions -- Source index of each command.
+        ends -- Source index after the last source instruction of each command, so the
+                source of command i is from `positions[i]` to `ends[i]`.
+        brackets -- Dict mapping the index of each bracket command to its match.
+        block_costs -- Number of source instructions run after each bracket command
+                       up to and including the next bracket.
+        start_cost -- Number of source instructions up to and including the first bracket.
+        offsets -- Pointer offset before each command, or None where it isn't known.
+        extent -- (min, max) of the known offsets, or None.
+        prefix -- `ProgramPrefix` of the state that the program always reaches before
+                  its first input, or None."""
+
+    FIELDS = ('ops', 'args', 'positions', 'brackets', 'block_costs', 'start_cost', 'offsets', 'extent', 'prefix',
+              'ends')
+
+    def __init__(self, ops, args, positions, brackets, block_costs, start_cost, offsets=None, extent=None,
+                 prefix=None, ends=None):
+        self.ops = ops
+        self.args = args
+        self.positions = positions
+        self.brackets = brackets
+        self.block_costs = block_costs
+        self.start_cost = start_cost
+        self.offsets = offsets if offsets is not None else [None] * len(ops)
+        self.extent = tuple(extent) if extent is not None else None
+        self.prefix = ProgramPrefix(*prefix) if prefix is not None else None
+        self.ends = ends if ends is not None else [position + 1 for position in positions]
+
+    def span(self, command):
+        """Return the (start, end) source indices of `command`."""
+        return self.positions[command], self.ends[command]
+
+    def fields(self):
+        """Return the values of `FIELDS` as plain data."""
+        return tuple(tuple(value) if isinstance(value, tuple) else value
+                     for value in (getattr(self, name) for name in self.FIELDS))
+
+    def replace(self, **changes):
+        """Return a copy of the program with the fields in `changes` replaced."""
+        fields = dict(zip(self.FIELDS, self.fields()), **changes)
+        return CompiledProgram(**fields)
+
+
+class SourceMap:
+    """Finds the line and column of indices in `code`."""
+
+    def __init__(self, code):
+        self.line_starts = [0]
+        self.line_starts.extend(match.end() for match in re.finditer('\n', code))
+
+    def line_column(self, index):
+        """Return the (line, column) of `index`, both starting from 1."""
+        line = bisect_right(self.line_starts, index) - 1
+        return line + 1, index - self.line_starts[line] + 1
+
+    def describe(self, index):
+        """Return the location of `index` as text."""
+        return 'line {}, column {}'.format(*self.line_column(index))
+
+
+ProgramPrefix = namedtuple('ProgramPrefix', [
+    'command_pointer',  # Index of the command to continue from
+    'tape_pointer',
+    'tape',  # bytes of the tape, without the trailing zeros past the tape pointer
+    'output',
+    'instruction_count',
+])
+
+
+class InterpreterError(Exception):
+    """Base class for exceptions to do with an interpreter.
+
+    Attributes:
+        message -- Optional message describing error"""
+
+    def __init__(self, message=None):
+        self.message = message
+
+
+class ExecutionEndedError(InterpreterError):
+    """Error raised when program has ended but `Interpreter.step` is still called"""
+
+
+class NoPreviousExecutionError(InterpreterError):
+    """Error raised when `Interpreter.back` is called but it is the first instruction being processed"""
+
+
+class NoInputError(InterpreterError):
+    """Error raised when no input returned from `Interpreter.input_func`"""
+
+
+class ProgramError(InterpreterError):
+    """Error raised when there is something wrong with a program.
+
+    Attributes:
+        error -- Source of error (default to None).
+        location -- Location of error (default to None).
+        message -- Optional mesage (default to None)."""
+
+    def __init__(self, error=None, location=None, message=None):
+        super().__init__(message)
+        self.error = error
+        self.location = location
+
+
+class ProgramSyntaxError(ProgramError):
+    """Error raised when there is a syntax error with the source code of a program."""
+
+
+class ProgramRuntimeError(ProgramError):
+    """Error raised when there is a error while the program is running. (Does not include missing input.)"""
+
+
+class ResourceLimitError(ProgramRuntimeError):
+    """Error raised when a program exceeds one of its `RunLimits`.
+
+    Attributes:
+        counters -- Dict of the counters reached: 'instructions', 'time' and 'cells'."""
+
+    def __init__(self, error=None, location=None, message=None, counters=None):
+        super().__init__(error, location, message)
+        self.counters = counters if counters is not None else {}
+
+
+if __name__ == '__main__':
+    # with open(r'programs\sample\hello_world.b') as file:
+    # with open(r'programs\mine\foo.b') as file:
+    with open(r'programs\sample\mandelbrot.b') as file:
+        prog = file.read()
+
+    # interpreter = BFInterpreter(prog, output_func=print)
+    # for i in range(100_000):
+    #     interpreter.step()
+
+    interpreter = FastBrainfuckInterpreter(prog, output_func=lambda x: print(x, end=''))
+    # interpreter = FastBrainfuckInterpreter(prog, output_func=print)
+    interpreter.run()
@@ -0,0 +1,339 @@
+import functools
+import time
+
+import numpy as np
+
+from interpreter import (ErrorTypes, FastBrainfuckInterpreter, NoInputError, ProgramRuntimeError,
+                         ResourceLimitError, RunLimits)
+from result_cache import RunResult
+from tape import LeftEdge
+
+
+class NumpyBrainfuckInterpreter(FastBrainfuckInterpreter):
+    """`FastBrainfuckInterpreter` with a NumPy uint8 tape, that runs some loops as
+    a single vectorized operation instead of one command at a time:
+
+        Add loops, such as [-] and [->+>++<<], that only change cells and move the
+        pointer back to where they started, and step the first cell by one.
+        Scan loops, such as [>] and [<<], that move the pointer until it reaches a zero cell.
+
+    Single cell ops are slower than with a list tape, so this is for programs that clear,
+    copy or scan over large regions of the tape. Only supports 8 bit cells, and
+    `LeftEdge.ERROR`. Loops aren't run in bulk if `hooks` has loop or tick callbacks, or
+    blocks are being counted."""
+
+    # Number of cells that a scan loop checks first, before checking the rest of the tape
+    SCAN_CHUNK = 256
+
+    def __init__(self, code, input_func=input, output_func=None, limits=None, brackets=None, program=None,
+                 left_edge=LeftEdge.ERROR, cell_bits=8, hooks=None, count_blocks=False):
+        if cell_bits != 8 or left_edge is not LeftEdge.ERROR:
+            raise ValueError('The NumPy tape only supports 8 bit cells and LeftEdge.ERROR')
+        super().__init__(code, input_func, output_func, limits, brackets, program, left_edge, cell_bits, hooks,
+                         count_blocks)
+
+    def reset(self):
+        super().reset()
+        self.tape = np.array(self.tape, dtype=np.uint8)
+
+    @property
+    def current_cell(self):
+        return int(self.tape[self.tape_pointer])
+
+    def cell_op(self, times):
+        self.tape[self.tape_pointer] = (int(self.tape[self.tape_pointer]) + times) & 0xFF
+
+    def _grow_tape(self):
+        """Extend the tape to fit the pointer, doubling its size where `self.limits` allows."""
+        if self.tape_pointer < 0:
+            raise ProgramRuntimeError(ErrorTypes.INVALID_TAPE_CELL, self.positions[self.command_pointer])
+
+        size = max(self.tape_pointer + 1, len(self.tape) * 2)
+        max_cells = self.limits.max_cells
+        if max_cells is not None:
+            self.check_limits(cells=self.tape_pointer + 1)
+            size = min(size, max_cells)
+        self.tape = np.concatenate((self.tape, np.zeros(size - len(self.tape), dtype=np.uint8)))
+        self.tape_end = len(self.tape)
+        self._tape_grown()
+
+    def _bind(self, program):
+        commands = super()._bind(program)
+        if self.block_counts is not None or (self.hooks is not None
+                                             and self.hooks.subscribed('loop_enter', 'loop_exit', 'tick')):
+            return commands
+        for start, loop in self.find_bulk_loops(program).items():
+            if loop[0] == 'scan':
+                commands[start] = functools.partial(self.scan_loop, start, loop[1])
+            else:
+                commands[start] = functools.partial(self.add_loop, start, *loop[1:])
+        return commands
+
+    @staticmethod
+    def find_bulk_loops(program):
+        """Return a dict mapping the index of the opening bracket of each loop of `program`
+        that can be run in bulk to ('scan', stride), or ('add', step, offsets, factors, low, high),
+        where `step` is added to the first cell and `factors` are added to the cells
+        at `offsets` from it, each time around the loop. The pointer moves between
+        `low` and `high` from the first cell, including where nothing is changed."""
+        loops = {}
+        for start, end in program.brackets.items():
+            if end < start:
+                continue
+            body = range(start + 1, end)
+            if any(program.ops[index] not in ('>', '+') for index in body):
+                continue
+
+            if len(body) == 1 and program.ops[start + 1] == '>':
+                # A move with no net offset, like [<>], never reaches another cell
+                if program.args[start + 1] != 0:
+                    loops[start] = ('scan', program.args[start + 1])
+                continue
+
+            offset = low = high = 0
+            changes = {}
+            for index in body:
+                if program.ops[index] == '>':
+                    offset += program.args[index]
+                    low = min(low, offset)
+                    high = max(high, offset)
+                else:
+                    changes[offset] = changes.get(offset, 0) + program.args[index]
+            step = changes.pop(0, 0) & 0xFF
+            # Otherwise the number of times around the loop isn't just the first cell
+            if offset != 0 or step not in (1, 0xFF):
+                continue
+            offsets = sorted(offset for offset, change in changes.items() if change & 0xFF)
+            loops[start] = ('add', step, np.array(offsets, dtype=np.intp),
+                            np.array([changes[offset] & 0xFF for offset in offsets], dtype=np.uint8), low, high)
+        return loops
+
+    def _run_bulk(self, start, iterations):
+        """Return the instruction count after going around the loop at `start` `iterations`
+        times, or None if that would pass the instruction limit, so that the loop is run
+        normally and stops at the same place."""
+        end = self.brackets[start]
+        count = self.instruction_count + iterations * self.block_costs[start] + self.block_costs[end]
+        max_instructions = self.limits.max_instructions
+        if max_instructions is not None and count > max_instructions:
+            return None
+        return count
+
+    def _finish_bulk(self, start, count):
+        self.instruction_count = count
+        self.command_pointer = self.brackets[start]
+        if self.instruction_count >= self.next_limit_check:
+            self.check_limits()
+
+    def add_loop(self, start, step, offsets, factors, low, high):
+        """Run the add loop at `start` in one go."""
+        value = self.current_cell
+        iterations = value if step == 0xFF else -value & 0xFF
+        count = self._run_bulk(start, iterations)
+        pointer = self.tape_pointer
+        if count is None or (iterations and not 0 <= pointer + low <= pointer + high < len(self.tape)):
+            # Leave it to the normal loop to raise the error or grow the tape
+            self.open_loop()
+            return
+
+        if iterations and len(offsets):
+            self.tape[offsets + pointer] += factors * np.uint8(iterations)
+        self.tape[pointer] = 0
+        self._finish_bulk(start, count)
+
+    def scan_loop(self, start, stride):
+        """Run the scan loop at `start` in one go."""
+        pointer = self.tape_pointer
+        # Check the cells near the pointer first, as the zero is usually close
+        stop = pointer + stride * self.SCAN_CHUNK
+        zeros = np.flatnonzero(self.tape[pointer:stop if stop >= 0 else None:stride] == 0)
+        if not len(zeros):
+            zeros = np.flatnonzero(self.tape[pointer::stride] == 0)
+        count = self._run_bulk(start, int(zeros[0])) if len(zeros) else None
+        if count is None:
+            # The pointer leaves the tape, or the loop passes the instruction limit
+            self.open_loop()
+            return
+
+        self.tape_pointer = pointer + int(zeros[0]) * stride
+        self._finish_bulk(start, count)
+
+
+class BatchBrainfuckInterpreter:
+    """Runs the same Brainfuck program on many inputs at once, as lanes that are
+    stepped in lock-step with NumPy. Each lane has its own row of `tapes`, and its
+    own pointer, command pointer and input position.
+
+    Each step runs the command that the lanes with the lowest command pointer are
+    on, for all of those lanes at once. So lanes that take different branches at a
+    loop run separately until they are back on the same command.
+
+    Results are the same as running each input with `FastBrainfuckInterpreter`,
+    with 8 bit cells and `LeftEdge.ERROR`. A lane that reads past the end of its
+    input stops with `NoInputError`, unless `eof` is given, in which case the cell
+    is set to `eof`.
+
+    Attributes:
+        inputs -- List of the input of each lane."""
+
+    # Initial width of the tapes, if the program's pointer offsets aren't known
+    TAPE_SIZE = 256
+    # Number of steps between each check of the wall time
+    TIME_CHECK_INTERVAL = 1024
+
+    def __init__(self, code, inputs, limits=None, eof=None, program=None):
+        if program is None:
+            program = FastBrainfuckInterpreter.compile(code)
+        self.program = program
+        self.inputs = list(inputs)
+        self.limits = limits if limits is not None else RunLimits()
+        self.eof = eof
+
+    def run(self):
+        """Run every lane to the end, and return the list of the `RunResult` of each input."""
+        program = self.program
+        ops, args, brackets, block_costs = program.ops, program.args, program.brackets, program.block_costs
+        limits = self.limits
+        lane_count = len(self.inputs)
+        start_time = time.perf_counter()
+
+        width = self.TAPE_SIZE
+        if program.extent is not None:
+            width = max(width, program.extent[1] + 1)
+        prefix = program.prefix
+        if prefix is not None and not limits.allows(prefix.instruction_count, len(prefix.tape)):
+            prefix = None
+        if prefix is not None:
+            width = max(width, len(prefix.tape))
+        if limits.max_cells is not None:
+            width = min(width, limits.max_cells)
+
+        tapes = np.zeros((lane_count, width), dtype=np.uint8)
+        pointers = np.zeros(lane_count, dtype=np.int64)
+        command_pointers = np.zeros(lane_count, dtype=np.int64)
+        counts = np.full(lane_count, program.start_cost, dtype=np.int64)
+        prefix_output = b''
+        if prefix is not None:
+            tapes[:, :len(prefix.tape)] = np.frombuffer(prefix.tape, dtype=np.uint8)
+            pointers[:] = prefix.tape_pointer
+            command_pointers[:] = prefix.command_pointer
+            counts[:] = prefix.instruction_count
+            prefix_output = prefix.output.encode('latin-1')
+
+        input_lengths = np.array([len(input_) for input_ in self.inputs], dtype=np.int64)
+        input_codes = np.zeros((lane_count, int(input_lengths.max(initial=0)) + 1), dtype=np.int64)
+        for lane, input_ in enumerate(self.inputs):
+            input_codes[lane, :len(input_)] = [ord(char) for char in input_]
+        input_positions = np.zeros(lane_count, dtype=np.int64)
+
+        output = np.zeros((lane_count, 64), dtype=np.uint8)
+        output_lengths = np.zeros(lane_count, dtype=np.int64)
+
+        errors = [None] * lane_count
+        # Command pointer of lanes that have stopped
+        stopped = len(ops)
+
+        def limit_error(error_type, lane, location):
+            counters = {
+                'instructions': int(counts[lane]),
+                'time': time.perf_counter() - start_time,
+                'cells': width,
+            }
+            return ResourceLimitError(error_type, location, counters=counters)
+
+        steps = 0
+        while True:
+            command_pointer = int(command_pointers.min())
+            if command_pointer == stopped:
+                break
+            lanes = np.flatnonzero(command_pointers == command_pointer)
+            op = ops[command_pointer]
+            arg = args[command_pointer]
+            # Lanes that stop at this command
+            ended = []
+
+            if op == '+':
+                tapes[lanes, pointers[lanes]] += np.uint8(arg & 0xFF)
+            elif op == '>':
+                pointers[lanes] += arg
+                outside = lanes[(pointers[lanes] < 0) | (pointers[lanes] >= width)]
+                if len(outside):
+                    left = outside[pointers[outside] < 0]
+                    for lane in left:
+                        errors[lane] = ProgramRuntimeError(ErrorTypes.INVALID_TAPE_CELL,
+                                                           program.positions[command_pointer])
+                    right = outside[pointers[outside] >= 0]
+                    if limits.max_cells is not None:
+                        over = right[pointers[right] >= limits.max_cells]
+                        for lane in over:
+                            errors[lane] = limit_error(ErrorTypes.MEMORY_LIMIT_EXCEEDED, lane,
+                                                       program.positions[command_pointer])
+                        right = right[pointers[right] < limits.max_cells]
+                        ended.append(over)
+                    if len(right):
+                        new_width = max(int(pointers[right].max()) + 1, width * 2)
+                        if limits.max_cells is not None:
+                            new_width = min(new_width, limits.max_cells)
+                        tapes = np.concatenate((tapes, np.zeros((lane_count, new_width - width), dtype=np.uint8)),
+                                               axis=1)
+                        width = new_width
+                    ended.append(left)
+            elif op == '[' or op == ']':
+                cells = tapes[lanes, pointers[lanes]]
+                jump = lanes[cells == 0] if op == '[' else lanes[cells != 0]
+                stay = lanes[cells != 0] if op == '[' else lanes[cells == 0]
+                match = brackets[command_pointer]
+                command_pointers[jump] = match
+                counts[jump] += block_costs[match]
+                counts[stay] += block_costs[command_pointer]
+                if limits.max_instructions is not None:
+                    over = lanes[counts[lanes] > limits.max_instructions]
+                    for lane in over:
+                        errors[lane] = limit_error(ErrorTypes.INSTRUCTION_LIMIT_EXCEEDED, lane,
+                                                   program.positions[command_pointers[lane]])
+                    ended.append(over)
+            elif op == ',':
+                positions = input_positions[lanes]
+                has_input = positions < input_lengths[lanes]
+                reading = lanes[has_input]
+                tapes[reading, pointers[reading]] = input_codes[reading, positions[has_input]] & 0xFF
+                input_positions[reading] += 1
+                empty = lanes[~has_input]
+                if self.eof is not None:
+                    tapes[empty, pointers[empty]] = self.eof & 0xFF
+                else:
+                    for lane in empty:
+                        errors[lane] = NoInputError()
+                    ended.append(empty)
+            elif op == '.':
+                if int(output_lengths[lanes].max()) >= output.shape[1]:
+                    output = np.concatenate((output, np.zeros_like(output)), axis=1)
+                output[lanes, output_lengths[lanes]] = tapes[lanes, pointers[lanes]]
+                output_lengths[lanes] += 1
+            else:
+                ended.append(lanes)
+
+            command_pointers[lanes] += 1
+            for lanes in ended:
+                command_pointers[lanes] = stopped
+
+            steps += 1
+            if limits.max_time is not None and steps % self.TIME_CHECK_INTERVAL == 0:
+                if time.perf_counter() - start_time > limits.max_time:
+                    running = np.flatnonzero(command_pointers != stopped)
+                    for lane in running:
+                        errors[lane] = limit_error(ErrorTypes.TIME_LIMIT_EXCEEDED, lane,
+                                                   program.positions[command_pointers[lane]])
+                    command_pointers[running] = stopped
+
+        elapsed = time.perf_counter() - start_time
+        results = []
+        for lane, input_ in enumerate(self.inputs):
+            text = prefix_output + output[lane, :output_lengths[lane]].tobytes()
+            error = errors[lane]
+            if isinstance(error, ResourceLimitError):
+                counters = error.counters
+            else:
+                counters = {'instructions': int(counts[lane]), 'time': elapsed, 'cells': width}
+            results.append(RunResult(input_[:input_positions[lane]], text.decode('latin-1'), error, counters))
+        return results
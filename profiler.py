@@ -0,0 +1,207 @@
+"""Profile the loops of a Brainfuck program, and export the profile for flame graph viewers.
+
+Each run of a loop, from when it is entered to when it ends, is a slice, and loops
+run inside it are nested slices. The profile is written as Chrome Trace Event JSON,
+for chrome://tracing and Perfetto, or in the speedscope format.
+
+    python profiler.py program.b --input-file input.txt -o profile.json
+    python profiler.py program.b --format speedscope -o profile.speedscope.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from interpreter import ExecutionHooks, FastBrainfuckInterpreter, InterpreterError, NoInputError, SourceMap
+
+
+class LoopProfiler:
+    """Times the loops of a run through `ExecutionHooks`.
+
+    Make the interpreter with `hooks=profiler.hooks`, then run it with `run`. Every
+    slice is kept for `chrome_trace`, up to `max_slices`, after which only the
+    totals are kept. `speedscope` uses the totals of each stack of loops, so it covers
+    the whole run however long it is.
+
+    Attributes:
+        hooks -- `ExecutionHooks` to give to the interpreter.
+        frames -- List of the names of the loops, and the whole program first.
+        slices -- List of (frame, depth, start, end, instructions) of the finished
+                  slices, with the times in seconds from the start of the run. The
+                  instructions are those run from after the opening bracket up to and
+                  including the closing bracket, as `BFInterpreter` counts them.
+        dropped_slices -- Number of slices that weren't kept because of `max_slices`.
+        stack_times -- Dict mapping each stack of frames to the time spent in it,
+                       not counting the loops inside it."""
+
+    PROGRAM_FRAME = 0
+
+    def __init__(self, code, max_slices=1_000_000):
+        self.code = code
+        self.source_map = SourceMap(code)
+        self.max_slices = max_slices
+        self.hooks = ExecutionHooks()
+        self.hooks.subscribe('loop_enter', self.loop_enter)
+        self.hooks.subscribe('loop_exit', self.loop_exit)
+
+        self.frames = ['Program']
+        self.frame_positions = [(1, 1)]
+        self._command_frames = {}
+        self.slices = []
+        self.dropped_slices = 0
+        self.stack_times = {}
+        self.start_time = None
+        self.end_time = None
+
+        # (frame, start time, start instruction count) of each loop being run
+        self._stack = []
+        self._frames = ()
+        self._last_time = None
+
+    def run(self, interpreter):
+        """Run `interpreter` while timing it, and return its output. Errors from the
+        run are raised after the profile has been finished."""
+        self.start_time = self._last_time = time.perf_counter()
+        self._stack = [(self.PROGRAM_FRAME, self.start_time, 0)]
+        self._frames = (self.PROGRAM_FRAME,)
+        try:
+            return interpreter.run()
+        finally:
+            self.end_time = time.perf_counter()
+            self._add_time(self.end_time)
+            # Loops that the run stopped in end with it
+            while self._stack:
+                self._pop(interpreter, self.end_time)
+
+    def loop_enter(self, interpreter, command):
+        now = time.perf_counter()
+        self._add_time(now)
+        frame = self._command_frames.get(command)
+        if frame is None:
+            frame = self._command_frames[command] = self._new_frame(interpreter.source_index(command))
+        self._stack.append((frame, now, interpreter.executed_count()))
+        self._frames += (frame,)
+
+    def loop_exit(self, interpreter, command):
+        now = time.perf_counter()
+        self._add_time(now)
+        self._pop(interpreter, now)
+
+    def _new_frame(self, index):
+        line, column = self.source_map.line_column(index)
+        self.frames.append(f'Loop at line {line}, column {column}')
+        self.frame_positions.append((line, column))
+        return len(self.frames) - 1
+
+    def _add_time(self, now):
+        """Add the time since the last event to the current stack."""
+        self.stack_times[self._frames] = self.stack_times.get(self._frames, 0) + now - self._last_time
+        self._last_time = now
+
+    def _pop(self, interpreter, now):
+        frame, start, instructions = self._stack.pop()
+        # The slice of the whole program is always kept
+        if len(self.slices) < self.max_slices or not self._stack:
+            self.slices.append((frame, len(self._stack), start - self.start_time, now - self.start_time,
+                                interpreter.executed_count() - instructions))
+        else:
+            self.dropped_slices += 1
+        self._frames = self._frames[:-1]
+
+    def chrome_trace(self):
+        """Return the profile as a Chrome Trace Event JSON object."""
+        events = [
+            {'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'Brainfuck'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'Loops'}},
+        ]
+        # Outer slices first, so that viewers that need it get parents before children
+        for frame, depth, start, end, instructions in sorted(self.slices, key=lambda slice_: (slice_[2], slice_[1])):
+            line, column = self.frame_positions[frame]
+            events.append({
+                'name': self.frames[frame],
+                'cat': 'loop' if frame != self.PROGRAM_FRAME else 'program',
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': 1,
+                'tid': 1,
+                'args': {'line': line, 'column': column, 'instructions': instructions},
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'dropped_slices': self.dropped_slices},
+        }
+
+    def speedscope(self, name='Brainfuck'):
+        """Return the profile as a speedscope JSON object. Each stack of loops is one
+        sample, weighted by the time spent in it."""
+        stacks = [(list(stack), time_ * 1e6) for stack, time_ in self.stack_times.items() if time_ > 0]
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': [{'name': name_, 'line': line, 'col': column}
+                                  for name_, (line, column) in zip(self.frames, self.frame_positions)]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'microseconds',
+                'startValue': 0,
+                'endValue': sum(weight for stack, weight in stacks),
+                'samples': [stack for stack, weight in stacks],
+                'weights': [weight for stack, weight in stacks],
+            }],
+            'name': name,
+            'exporter': 'profiler.py',
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='Brainfuck file to run')
+    parser.add_argument('--input', default='', help='input of the program')
+    parser.add_argument('--input-file', help='file to read the input of the program from')
+    parser.add_argument('--eof', type=int, help='value to read at the end of the input, instead of stopping')
+    parser.add_argument('--format', choices=('chrome', 'speedscope'), default='chrome')
+    parser.add_argument('--max-slices', type=int, default=1_000_000, help='maximum number of slices to keep')
+    parser.add_argument('-o', '--output', required=True, help='file to write the profile to')
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8') as file:
+        code = file.read()
+    input_ = args.input
+    if args.input_file is not None:
+        with open(args.input_file, encoding='utf-8') as file:
+            input_ = file.read()
+    chars = iter(input_)
+
+    def next_input():
+        char = next(chars, None)
+        if char is not None:
+            return char
+        if args.eof is None:
+            raise NoInputError
+        return chr(args.eof)
+
+    profiler = LoopProfiler(code, args.max_slices)
+    error = None
+    try:
+        interpreter = FastBrainfuckInterpreter(code, input_func=next_input, hooks=profiler.hooks)
+        profiler.run(interpreter)
+    except InterpreterError as e:
+        if profiler.start_time is None:
+            sys.exit(f'Error: {e!r}')
+        error = e
+
+    profile = profiler.chrome_trace() if args.format == 'chrome' else profiler.speedscope(args.path)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(profile, file)
+
+    print(f'{profiler.end_time - profiler.start_time:.2f}s, {interpreter.executed_count()} instructions, '
+          f'{len(profiler.slices)} slices ({profiler.dropped_slices} dropped)')
+    if error is not None:
+        print(f'The run ended with {error!r}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import functools
+import hashlib
+import marshal
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from interpreter import CompiledProgram, ProgramSyntaxError
+
+
+class ProgramCache:
+    """LRU cache of compiled Brainfuck programs.
+
+    Programs are keyed by a hash of the command stream of the code, with the comments
+    stripped, together with the compiler and its options. So code that only differs in
+    comments or layout shares an entry. The program is compiled from the command stream,
+    and its source positions are mapped back to the code it was asked for. The mapped
+    programs are kept too, keyed by a hash of the whole code, so that running the exact
+    same code again doesn't even need to strip the comments.
+
+    If `directory` is given, then programs are also marshalled to files in it, so that
+    they are kept between sessions. Can be used from any thread."""
+
+    # Increase whenever `CompiledProgram` changes, so that old files are ignored
+    FORMAT_VERSION = 4
+    FILE_EXTENSION = '.bfc'
+
+    COMMANDS = re.compile(r'[\[\]<>+\-,.]')
+    NOT_COMMANDS = re.compile(r'[^\[\]<>+\-,.]+')
+
+    def __init__(self, max_entries=64, directory=None, max_files=256):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def compile(self, code, compile_func, options=(), brackets=None):
+        """Return the `CompiledProgram` of `code` compiled with `compile_func(code)`,
+        only compiling it if it isn't in the cache. `options` are any other options that
+        change the compiled program. `brackets` is an optional bracket table of `code`,
+        as returned by `BFInterpreter.match_brackets`. It is mapped to the command stream
+        and given to `compile_func` as its second argument, so that the brackets don't
+        have to be matched again."""
+        source_key = self.key(code, compile_func, options)
+        with self._lock:
+            program = self._sources.get(source_key)
+            if program is not None:
+                self._sources.move_to_end(source_key)
+                self.hits += 1
+                return program
+
+        stream = self.NOT_COMMANDS.sub('', code)
+        key = self.key(stream, compile_func, options)
+
+        positions = self._source_positions(code)
+        program = self._get(key)
+        if program is None:
+            try:
+                if brackets is not None:
+                    program = compile_func(stream, self._stream_brackets(brackets, positions))
+                else:
+                    program = compile_func(stream)
+            except ProgramSyntaxError as error:
+                if error.location is not None:
+                    error.location = positions[error.location]
+                raise
+            self._put(key, program)
+
+        positions.append(len(code))
+        # The end of a command is after the last source command in it
+        ends = [positions[end - 1] + 1 if end > start else positions[start]
+                for start, end in zip(program.positions, program.ends)]
+        program = program.replace(positions=[positions[i] for i in program.positions], ends=ends)
+        with self._lock:
+            self._add(self._sources, source_key, program)
+        return program
+
+    def key(self, code, compile_func, options=()):
+        """Return the key of `code` compiled by `compile_func` with `options`.
+        `compile_func` can be a `functools.partial`, whose arguments are part of the key."""
+        hash_ = hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=20)
+        arguments = ()
+        if isinstance(compile_func, functools.partial):
+            arguments = (compile_func.args, sorted(compile_func.keywords.items()))
+            compile_func = compile_func.func
+        hash_.update(repr((compile_func.__module__, compile_func.__qualname__, arguments, tuple(options))).encode())
+        return hash_.hexdigest()
+
+    def clear(self):
+        """Remove all of the programs from memory. Files are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._sources.clear()
+
+    def _source_positions(self, code):
+        """Return the index in `code` of each command."""
+        return [match.start() for match in self.COMMANDS.finditer(code)]
+
+    @staticmethod
+    def _stream_brackets(brackets, positions):
+        """Return the bracket table `brackets` of the code, with the indices changed to
+        indices in the command stream. `positions` is the code index of each command."""
+        indices = {position: index for index, position in enumerate(positions)}
+        return {indices[start]: indices[end] for start, end in brackets.items()}
+
+    def _get(self, key):
+        with self._lock:
+            program = self._entries.get(key)
+            if program is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return program
+
+        program = self._load(key)
+        with self._lock:
+            if program is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._add(self._entries, key, program)
+        return program
+
+    def _put(self, key, program):
+        with self._lock:
+            self._add(self._entries, key, program)
+        self._save(key, program)
+
+    def _add(self, entries, key, program):
+        entries[key] = program
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.FILE_EXTENSION)
+
+    def _load(self, key):
+        """Return the program stored on disk for `key`, or None if there isn't one."""
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                version, *fields = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != self.FORMAT_VERSION:
+            return None
+        try:
+            # Mark the file as recently used
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return CompiledProgram(*fields)
+
+    def _save(self, key, program):
+        """Marshal `program` to disk, then remove the least recently used files if
+        there are more than `self.max_files`."""
+        if self.directory is None:
+            return
+        data = (self.FORMAT_VERSION, *program.fields())
+        path = self._path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                marshal.dump(data, file)
+            os.replace(temp_path, path)
+
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith(self.FILE_EXTENSION)]
+            if len(files) > self.max_files:
+                files.sort(key=os.path.getmtime)
+                for old_path in files[:len(files) - self.max_files]:
+                    os.remove(old_path)
+        except OSError:
+            pass
@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from interpreter import ErrorTypes, ProgramError
+
+
+RunResult = namedtuple('RunResult', [
+    'input',  # The input that the run consumed, decoded
+    'output',
+    'error',  # Error that ended the run, or None if it finished
+    'counters',  # Dict of 'instructions', 'time' and 'cells' at the end of the run
+])
+
+
+class ResultCache:
+    """Size bounded LRU cache of the results of runs, for serving repeated runs of the
+    same program with the same input without running them again. Disabled until
+    `enabled` is set to True.
+
+    Results are keyed by a hash of the program with the engine options, and a hash of
+    the input that the run consumed. A run that only consumed the first part of its
+    input has the same result for any input that starts with the same part, so a result
+    is served whenever the new input starts with the consumed input.
+
+    Runs that were stopped by the time limit aren't deterministic, so aren't stored."""
+
+    def __init__(self, max_entries=64, max_output=10_000_000):
+        self.enabled = False
+        self.max_entries = max_entries
+        # Maximum total length of all the stored outputs
+        self.max_output = max_output
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._output_size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def program_key(code, engine, options=()):
+        """Return the key of running `code` with the interpreter class `engine` and
+        any other `options` that can change the result."""
+        hash_ = hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=20)
+        hash_.update(repr((engine.__module__, engine.__qualname__, tuple(options))).encode())
+        return hash_.hexdigest()
+
+    @staticmethod
+    def input_key(input_):
+        return hashlib.blake2b(input_.encode('utf-8', 'surrogatepass'), digest_size=20).hexdigest()
+
+    def get(self, program_key, read_input):
+        """Return the `RunResult` of the program with `program_key`, or None if there
+        isn't one for the input. `read_input(n)` should return the first `n` characters
+        of the decoded input, or fewer if there aren't that many."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            candidates = [(key, result) for key, result in self._entries.items() if key[0] == program_key]
+
+        for key, result in candidates:
+            input_ = read_input(len(result.input))
+            if key[1] == self.input_key(input_):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, program_key, input_, output, error, counters):
+        """Store the result of a run of the program with `program_key` that consumed
+        `input_`. Does nothing if the result can't be stored."""
+        if not self.enabled or len(output) > self.max_output:
+            return
+        if isinstance(error, ProgramError) and error.error is ErrorTypes.TIME_LIMIT_EXCEEDED:
+            return
+        if error is not None and not isinstance(error, ProgramError):
+            return
+
+        key = (program_key, self.input_key(input_))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._output_size -= len(old.output)
+            self._entries[key] = RunResult(input_, output, error, dict(counters))
+            self._output_size += len(output)
+
+            while len(self._entries) > self.max_entries or self._output_size > self.max_output:
+                key, old = self._entries.popitem(last=False)
+                self._output_size -= len(old.output)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._output_size = 0
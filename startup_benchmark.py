@@ -0,0 +1,92 @@
+"""Measure how long the IDE takes to start.
+
+Each run starts a new Python process under the offscreen Qt platform, so that
+nothing is already imported or cached, and measures the time to import
+`user_interface` and the time until the main window is first painted.
+
+    python startup_benchmark.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Modules that should only be imported once they are used
+DEFERRED_MODULES = ('coderunner', 'visualiser', 'input_text', 'execution_trace', 'program_cache', 'result_cache')
+
+
+def measure():
+    """Start the IDE in this process, and print the times as JSON once the window
+    has been painted."""
+    start = time.perf_counter()
+
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+    import user_interface
+
+    imported = time.perf_counter()
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and self.painted is None:
+                self.painted = time.perf_counter()
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    app = QApplication([])
+    watcher = PaintWatcher()
+    watcher.painted = None
+    ide = user_interface.IDE()
+    ide.installEventFilter(watcher)
+    ide.show()
+    # Give up if the window is never painted
+    QTimer.singleShot(10_000, app.quit)
+    app.exec_()
+
+    print(json.dumps({
+        'import': imported - start,
+        'first_paint': (watcher.painted or float('nan')) - start,
+        'deferred_imported': [name for name in DEFERRED_MODULES if name in sys.modules],
+    }))
+
+
+def run(runs):
+    """Measure `runs` new processes and return the list of their results."""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure'], env=env, cwd=directory,
+                                check=True, capture_output=True, text=True).stdout
+        # The IDE prints some debugging output, so only use the last line
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='number of processes to start')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+
+    results = run(args.runs)
+    for key in ('import', 'first_paint'):
+        times = [result[key] * 1000 for result in results]
+        print(f'{key:>12}: median {statistics.median(times):7.1f} ms, '
+              f'min {min(times):7.1f} ms, max {max(times):7.1f} ms')
+    deferred = sorted({name for result in results for name in result['deferred_imported']})
+    if deferred:
+        print(f'Imported before the first paint: {", ".join(deferred)}')
+
+
+if __name__ == '__main__':
+    main()
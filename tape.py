@@ -0,0 +1,81 @@
+import array
+import enum
+
+
+class LeftEdge(enum.Enum):
+    """What happens when the tape pointer moves left of the first cell."""
+    ERROR = enum.auto()  # Runtime error, INVALID_TAPE_CELL
+    EXTEND = enum.auto()  # The tape extends to the left, into negative cells
+
+
+class PagedTape:
+    """Sparse tape of byte cells, made of `PAGE_SIZE` cell pages that are only allocated
+    when they are first visited. Cells can have any index, including negative ones, and
+    cells on pages that haven't been allocated read as 0. So a program that touches a
+    few cells spread over a huge range only uses a few pages.
+
+    `len` is the number of cells that have been allocated.
+
+    Attributes:
+        pages -- Dict mapping page number to the cells of the page.
+        typecode -- `array` typecode of the pages. 'B' pages are bytearrays, and if it is
+                    None then the pages are lists, for cells of any size."""
+
+    PAGE_BITS = 12
+    PAGE_SIZE = 1 << PAGE_BITS
+    PAGE_MASK = PAGE_SIZE - 1
+
+    def __init__(self, cells=(), typecode='B'):
+        """Start the tape with `cells`, a sequence of cell values from index 0."""
+        self.typecode = typecode
+        self.pages = {}
+        for start in range(0, len(cells), self.PAGE_SIZE):
+            self.pages[start >> self.PAGE_BITS] = self._new_page(cells[start:start + self.PAGE_SIZE])
+
+    def __len__(self):
+        return len(self.pages) * self.PAGE_SIZE
+
+    def __getitem__(self, index):
+        page = self.pages.get(index >> self.PAGE_BITS)
+        return page[index & self.PAGE_MASK] if page is not None else 0
+
+    def __setitem__(self, index, value):
+        try:
+            self.pages[index >> self.PAGE_BITS][index & self.PAGE_MASK] = value
+        except KeyError:
+            self.page(index)[index & self.PAGE_MASK] = value
+
+    def page(self, index):
+        """Return the page with cell `index` on it, allocating it if it doesn't exist."""
+        number = index >> self.PAGE_BITS
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = self._new_page()
+        return page
+
+    def _new_page(self, values=()):
+        """Return a new page starting with `values`, and the rest 0."""
+        padding = self.PAGE_SIZE - len(values)
+        if self.typecode is None:
+            return list(values) + [0] * padding
+        if self.typecode == 'B':
+            return bytearray(values) + bytearray(padding)
+        page = array.array(self.typecode, values)
+        page.frombytes(bytes(padding * page.itemsize))
+        return page
+
+    def has_page(self, index):
+        """Return whether the page with cell `index` on it has been allocated."""
+        return index >> self.PAGE_BITS in self.pages
+
+    def page_range(self, index):
+        """Return the (start, end) indices of the page with cell `index` on it."""
+        start = index & ~self.PAGE_MASK
+        return start, start + self.PAGE_SIZE
+
+    def bounds(self):
+        """Return the (start, end) indices of the allocated part of the tape,
+        or None if no pages have been allocated."""
+        if not self.pages:
+            return None
+        return min(self.pages) << self.PAGE_BITS, (max(self.pages) + 1) << self.PAGE_BITS
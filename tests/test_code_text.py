@@ -0,0 +1,99 @@
+import pytest
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from PyQt5.QtWidgets import QApplication, QPlainTextDocumentLayout, QWidget
+
+from code_text import BracketIndex, CodeText
+from interpreter import BFInterpreter, ProgramSyntaxError
+
+
+@pytest.fixture(autouse=True)
+def use_app(app):
+    pass
+
+
+def make_document(text):
+    """Return a document with `text`, laid out like the editor's, which it needs
+    to report its changes."""
+    document = QTextDocument(text)
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))
+    return document
+
+
+def delete(document, start, end):
+    cursor = QTextCursor(document)
+    cursor.setPosition(start)
+    cursor.setPosition(end, QTextCursor.KeepAnchor)
+    cursor.removeSelectedText()
+
+
+def test_bracket_table_matches_interpreter():
+    document = make_document('[+\n]\n[-]')
+    index = BracketIndex(document)
+    assert index.bracket_table() == BFInterpreter.match_brackets(document.toPlainText())
+
+
+def test_deleting_a_line_with_a_bracket_updates_the_table():
+    document = make_document('[+\n]\n[-]')
+    index = BracketIndex(document)
+    index.bracket_table()
+
+    delete(document, 2, 4)
+    assert document.toPlainText() == '[+\n[-]'
+    with pytest.raises(ProgramSyntaxError):
+        index.bracket_table()
+    brackets, unmatched = index.table()
+    assert brackets == {3: 5, 5: 3}
+    assert [(position, bracket) for _, position, bracket in unmatched] == [(0, '[')]
+
+
+def test_inserting_text_moves_the_brackets():
+    document = make_document('[-]\n[+]')
+    index = BracketIndex(document)
+    index.bracket_table()
+
+    cursor = QTextCursor(document)
+    cursor.insertText('comment\n')
+    assert index.bracket_table() == BFInterpreter.match_brackets(document.toPlainText())
+
+
+class EditorStub(QWidget):
+    """Parent that `CodeText` expects, without the rest of the editor."""
+
+    def __init__(self):
+        super().__init__()
+        self.editor_window = self
+        self.resize(400, 200)
+
+    def editor_focus_in(self):
+        pass
+
+
+@pytest.fixture
+def code_text():
+    parent = EditorStub()
+    text = CodeText(parent)
+    text.set_extension('.b')
+    text.setPlainText('+[->+<]\n' * 500)
+    text.resize(400, 200)
+    # The line numbers aren't needed, and painting them fails on newer Pythons
+    text.line_number_area.hide()
+    parent.show()
+    QApplication.processEvents()
+    yield text
+    parent.deleteLater()
+
+
+def test_heatmap_is_kept_when_scrolling(code_text):
+    counts = [1] * len(code_text.toPlainText())
+    code_text.set_heatmap(counts)
+    code_text.verticalScrollBar().setValue(code_text.verticalScrollBar().maximum())
+    QApplication.processEvents()
+    assert code_text.heatmap_counts is counts
+    assert code_text.overlays['heatmap']
+
+
+def test_heatmap_is_cleared_by_edits(code_text):
+    code_text.set_heatmap([1] * len(code_text.toPlainText()))
+    code_text.textCursor().insertText('+')
+    assert code_text.heatmap_counts is None
+    assert 'heatmap' not in code_text.overlays
@@ -0,0 +1,59 @@
+from execution_trace import TraceWriter
+from input_text import BrainfuckDecoder, InputReader
+from interpreter import BFInterpreter
+
+
+CODE = ',.>,.>,.'
+
+
+def record(interpreter, reader, trace, steps):
+    for _ in range(steps):
+        interpreter.step()
+        trace.record(interpreter, reader.prev_input_indexes[-1])
+
+
+def make_interpreter(input_, output_func=None):
+    reader = InputReader(BrainfuckDecoder, input_)
+    interpreter = BFInterpreter(CODE, input_func=reader.next_, undo_input_func=reader.prev, output_func=output_func)
+    return interpreter, reader
+
+
+def test_truncated_steps_are_recorded_again(tmp_path):
+    interpreter, reader = make_interpreter('abc')
+    trace = TraceWriter(tmp_path / 'a.trace', interpreter, snapshot_interval=2)
+    record(interpreter, reader, trace, 8)
+    trace.truncate(3)
+    assert trace.step_count == 3
+
+    interpreter, reader = make_interpreter('aYZ')
+    record(interpreter, reader, trace, 8)
+    expected = TraceWriter(tmp_path / 'b.trace', make_interpreter('aYZ')[0], snapshot_interval=2)
+    record(*make_interpreter('aYZ'), expected, 8)
+
+    trace_reader, expected_reader = trace.reader(), expected.reader()
+    for step in range(9):
+        assert trace_reader.state_at(step) == expected_reader.state_at(step)
+    trace_reader.close()
+    expected_reader.close()
+    trace.discard()
+    expected.discard()
+
+
+def test_editing_read_input_truncates_the_trace(app):
+    from visualiser import VisualiserWorker
+
+    worker = VisualiserWorker()
+    interpreter, reader = make_interpreter('abc', worker.record_output)
+    worker.start_session(interpreter, reader, TraceWriter.temporary(interpreter), 1)
+    worker.run_job(1, 1, 8, None, 'abc')
+    worker.run_job(2, -1, 5, None, 'abc')
+    assert interpreter.output == 'a'
+
+    # Scrubbing forward again must not show the output of the old input
+    worker.scrub_job(3, 8, 'aYZ')
+    assert worker.trace.step_count == 3
+    worker.run_job(4, 1, 5, None, 'aYZ')
+    worker.scrub_job(5, 5, 'aYZ')
+    worker.scrub_job(6, 8, 'aYZ')
+    assert interpreter.output == 'aYZ'
+    worker.close_trace()
@@ -0,0 +1,48 @@
+import pytest
+
+from interpreter import ErrorTypes, FastBrainfuckInterpreter, ProgramRuntimeError, ResourceLimitError, RunLimits
+
+np = pytest.importorskip('numpy')
+from numpy_interpreter import NumpyBrainfuckInterpreter  # noqa: E402
+
+
+def run(engine, code, **kwargs):
+    # Without a prefix, so that the loops aren't all run ahead when compiling
+    program = FastBrainfuckInterpreter.compile(code, prefix_budget=0)
+    return engine(code, input_func=lambda: chr(0), program=program, **kwargs).run()
+
+
+def test_zero_stride_loop_is_not_a_scan():
+    program = FastBrainfuckInterpreter.compile('+[<>]', prefix_budget=0)
+    assert NumpyBrainfuckInterpreter.find_bulk_loops(program) == {}
+
+
+def test_zero_stride_loop_runs_to_the_limit():
+    program = FastBrainfuckInterpreter.compile('+[<>]', prefix_budget=0)
+    interpreter = NumpyBrainfuckInterpreter('+[<>]', program=program, limits=RunLimits(max_instructions=10_000))
+    with pytest.raises(ResourceLimitError) as info:
+        interpreter.run()
+    assert info.value.error is ErrorTypes.INSTRUCTION_LIMIT_EXCEEDED
+
+
+def test_skipped_zero_stride_loop():
+    assert run(NumpyBrainfuckInterpreter, '[<>]+++.') == chr(3)
+
+
+@pytest.mark.parametrize('code', [
+    '++++[>+++<-]>.',
+    '+>+>+>+<<<[>]<.',
+    '>>>+<<<+[-]>[<+>-]++[>++<-]>.',
+    '+++[->>+-<+<]>.',
+])
+def test_bulk_loops_match_the_fast_engine(code):
+    assert run(NumpyBrainfuckInterpreter, code) == run(FastBrainfuckInterpreter, code)
+
+
+@pytest.mark.parametrize('code', ['+[-<+->]', '>+[-<<+->>]'])
+def test_add_loop_that_moves_left_of_the_tape(code):
+    with pytest.raises(ProgramRuntimeError) as info:
+        run(NumpyBrainfuckInterpreter, code)
+    assert info.value.error is ErrorTypes.INVALID_TAPE_CELL
+    with pytest.raises(ProgramRuntimeError):
+        run(FastBrainfuckInterpreter, code)
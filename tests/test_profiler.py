@@ -0,0 +1,67 @@
+import pytest
+
+from interpreter import BFInterpreter, FastBrainfuckInterpreter, NoInputError
+from profiler import LoopProfiler
+
+
+CODE = '++[>+++[>+<-]<-]\n,[.,]'
+
+
+def profile(code, input_=''):
+    chars = iter(input_)
+    profiler = LoopProfiler(code)
+    interpreter = FastBrainfuckInterpreter(code, input_func=lambda: next(chars, chr(0)), hooks=profiler.hooks)
+    output = profiler.run(interpreter)
+    return profiler, interpreter, output
+
+
+def test_program_slice_counts_every_instruction():
+    profiler, interpreter, output = profile(CODE, 'ab')
+    assert output == 'ab'
+    program = [slice_ for slice_ in profiler.slices if slice_[0] == LoopProfiler.PROGRAM_FRAME]
+    assert len(program) == 1
+    assert program[0][4] == interpreter.instruction_count
+
+
+def slice_counts(interpreter_type, code, input_):
+    """Return the (frame, depth, instructions) of each slice of a run that stops when
+    the input runs out."""
+    chars = iter(input_)
+
+    def next_input():
+        char = next(chars, None)
+        # BFInterpreter raises NoInputError itself when there is no input, undoing the ','
+        if char is None and interpreter_type is FastBrainfuckInterpreter:
+            raise NoInputError
+        return char
+
+    profiler = LoopProfiler(code)
+    interpreter = interpreter_type(code, input_func=next_input, output_func=None, hooks=profiler.hooks)
+    with pytest.raises(NoInputError):
+        profiler.run(interpreter)
+    return [(frame, depth, instructions) for frame, depth, start, end, instructions in profiler.slices]
+
+
+@pytest.mark.parametrize('input_', ['', 'a', 'ab'])
+def test_slices_count_like_bfinterpreter(input_):
+    code = CODE + '>+[>,[-<+>]<.]'
+    assert slice_counts(FastBrainfuckInterpreter, code, input_) == slice_counts(BFInterpreter, code, input_)
+
+
+def test_loops_are_nested_slices():
+    profiler, interpreter, output = profile(CODE, 'ab')
+    assert profiler.frames[1:] == ['Loop at line 1, column 3', 'Loop at line 1, column 8',
+                                   'Loop at line 2, column 2']
+    depths = {profiler.frames[frame]: depth for frame, depth, *rest in profiler.slices}
+    assert depths['Loop at line 1, column 8'] == 2
+    assert depths['Loop at line 2, column 2'] == 1
+
+    trace = profiler.chrome_trace()
+    assert sum(event['ph'] == 'X' for event in trace['traceEvents']) == len(profiler.slices)
+    speedscope = profiler.speedscope()
+    assert len(speedscope['shared']['frames']) == len(profiler.frames)
+
+
+def test_input_is_not_printed(capsys):
+    profile(CODE, 'ab')
+    assert capsys.readouterr().out == ''
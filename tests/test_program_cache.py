@@ -0,0 +1,26 @@
+import functools
+
+from interpreter import BFInterpreter, FastBrainfuckInterpreter
+from program_cache import ProgramCache
+
+
+CODE = 'Loop [\n  copy >+<- [ nested ] ]\n>.'
+
+
+def test_editor_brackets_give_the_same_program():
+    compile_func = functools.partial(FastBrainfuckInterpreter.compile, prefix_budget=0)
+    scanned = ProgramCache().compile(CODE, compile_func)
+    mapped = ProgramCache().compile(CODE, compile_func, brackets=BFInterpreter.match_brackets(CODE))
+    assert mapped.fields() == scanned.fields()
+
+
+def test_brackets_are_mapped_to_the_command_stream():
+    calls = []
+
+    def compile_func(stream, brackets=None):
+        calls.append((stream, brackets))
+        return FastBrainfuckInterpreter.compile(stream, brackets, prefix_budget=0)
+
+    ProgramCache().compile(CODE, compile_func, brackets=BFInterpreter.match_brackets(CODE))
+    stream, brackets = calls[0]
+    assert brackets == BFInterpreter.match_brackets(stream)
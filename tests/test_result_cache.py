@@ -0,0 +1,135 @@
+import time
+
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+from interpreter import BFInterpreter, ErrorTypes, FastBrainfuckInterpreter, ProgramRuntimeError, ResourceLimitError
+from result_cache import ResultCache
+
+
+COUNTERS = {'instructions': 10, 'time': 0.01, 'cells': 1}
+
+
+def make_cache(**kwargs):
+    cache = ResultCache(**kwargs)
+    cache.enabled = True
+    return cache
+
+
+def reader(input_):
+    return lambda count: input_[:count]
+
+
+def test_program_key_depends_on_code_engine_and_options():
+    key = ResultCache.program_key('+.', FastBrainfuckInterpreter, (None, 8))
+    assert key == ResultCache.program_key('+.', FastBrainfuckInterpreter, (None, 8))
+    assert key != ResultCache.program_key('++.', FastBrainfuckInterpreter, (None, 8))
+    assert key != ResultCache.program_key('+.', BFInterpreter, (None, 8))
+    assert key != ResultCache.program_key('+.', FastBrainfuckInterpreter, (None, 16))
+
+
+def test_result_is_keyed_by_the_consumed_input():
+    cache = make_cache()
+    key = ResultCache.program_key(',.', FastBrainfuckInterpreter)
+    cache.put(key, 'a', 'a', None, COUNTERS)
+
+    # Input after the consumed part doesn't change the result
+    assert cache.get(key, reader('abc')).output == 'a'
+    assert cache.get(key, reader('b')) is None
+    assert cache.get(key, reader('')) is None
+    assert cache.get(ResultCache.program_key(',,.', FastBrainfuckInterpreter), reader('abc')) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_least_recently_used_result_is_evicted():
+    cache = make_cache(max_entries=2)
+    keys = [ResultCache.program_key(code, FastBrainfuckInterpreter) for code in ('+.', '++.', '+++.')]
+    cache.put(keys[0], '', 'a', None, COUNTERS)
+    cache.put(keys[1], '', 'b', None, COUNTERS)
+    cache.get(keys[0], reader(''))
+    cache.put(keys[2], '', 'c', None, COUNTERS)
+
+    assert cache.get(keys[0], reader('')) is not None
+    assert cache.get(keys[1], reader('')) is None
+    assert cache.get(keys[2], reader('')) is not None
+
+
+def test_output_size_is_bounded():
+    cache = make_cache(max_output=5)
+    keys = [ResultCache.program_key(code, FastBrainfuckInterpreter) for code in ('+.', '++.')]
+    cache.put(keys[0], '', 'abc', None, COUNTERS)
+    cache.put(keys[1], '', 'def', None, COUNTERS)
+    assert cache.get(keys[0], reader('')) is None
+    assert cache.get(keys[1], reader('')).output == 'def'
+
+
+@pytest.mark.parametrize('error', [
+    ResourceLimitError(ErrorTypes.TIME_LIMIT_EXCEEDED, 0, counters=COUNTERS),
+    KeyboardInterrupt(),
+])
+def test_partial_runs_are_not_stored(error):
+    cache = make_cache()
+    key = ResultCache.program_key('+[.]', FastBrainfuckInterpreter)
+    cache.put(key, '', 'partial', error, COUNTERS)
+    assert cache.get(key, reader('')) is None
+
+
+def test_program_errors_are_stored():
+    cache = make_cache()
+    key = ResultCache.program_key('<', FastBrainfuckInterpreter)
+    cache.put(key, '', '', ProgramRuntimeError(ErrorTypes.INVALID_TAPE_CELL, 0), COUNTERS)
+    assert cache.get(key, reader('')).error.error is ErrorTypes.INVALID_TAPE_CELL
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache()
+    key = ResultCache.program_key('+.', FastBrainfuckInterpreter)
+    cache.put(key, '', 'a', None, COUNTERS)
+    cache.enabled = True
+    assert cache.get(key, reader('')) is None
+
+
+@pytest.fixture
+def runner(app, monkeypatch):
+    from coderunner import CodeRunner
+    monkeypatch.setattr(CodeRunner, 'RESULT_CACHE', make_cache())
+    runner = CodeRunner()
+    runner.set_extension('.b')
+    yield runner
+    runner.stop_run()
+    runner.shutdown()
+    runner.deleteLater()
+
+
+def wait_for(condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < end:
+        QApplication.processEvents()
+        time.sleep(0.005)
+
+
+def test_runner_stores_a_finished_run(runner):
+    runner.run_code('++++++[>++++++++<-]>+.')
+    wait_for(lambda: not runner.buffer_timer.isActive())
+    result = runner.RESULT_CACHE.get(runner.RESULT_CACHE.program_key(
+        '++++++[>++++++++<-]>+.', runner.engine(), runner.result_options()), reader(''))
+    assert result.output == '1'
+
+
+def test_runner_does_not_store_a_stopped_run(runner):
+    runner.run_code('+[.]')
+    wait_for(lambda: runner.interpreter is not None and runner.interpreter.output, timeout=1)
+    runner.stop_run()
+    runner.run_finished()
+    assert runner.RESULT_CACHE.get(runner.RESULT_CACHE.program_key(
+        '+[.]', runner.engine(), runner.result_options()), reader('')) is None
+
+
+def test_runner_does_not_store_after_cleanup(runner):
+    runner.run_code('+++.')
+    runner.thread.wait()
+    runner.cleanup()
+    assert not runner.buffer_timer.isActive()
+    runner.run_finished()
+    assert runner.RESULT_CACHE.get(runner.RESULT_CACHE.program_key(
+        '+++.', runner.engine(), runner.result_options()), reader('')) is None
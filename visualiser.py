@@ -1,679 +1,1341 @@
-
-from collections import OrderedDict
-
-from PyQt5.QtCore import (Qt,
-                          QSize,
-                          QTimer,
-                          )
-from PyQt5.QtGui import (QTextCursor,
-                         QBrush,
-                         QTextCharFormat,
-                         QColor,
-                         )
-from PyQt5.QtWidgets import (QPlainTextEdit,
-                             QWidget,
-                             QVBoxLayout,
-                             QBoxLayout,
-                             QLayout,
-                             QStatusBar,
-                             QTableWidget,
-                             QHBoxLayout,
-                             QPushButton,
-                             QGridLayout,
-                             QTableWidgetItem,
-                             QHeaderView,
-                             QSplitter,
-                             QFrame,
-                             QLineEdit,
-                             QSlider,
-                             QLabel,
-                             QCheckBox,
-                             QScrollBar,
-                             )
-
-from interpreter import (FastBrainfuckInterpreter,
-                         BFInterpreter,
-                         ErrorTypes,
-                         InterpreterError,
-                         ProgramError,
-                         NoInputError,
-                         NoPreviousExecutionError,
-                         ProgramRuntimeError,
-                         ProgramSyntaxError,
-                         ExecutionEndedError,)
-from utility_widgets import ResizingTable
-from input_text import InputTextEdit, HighlighInputText
-
-
-class VisualiserLayoutManager(QHBoxLayout):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-        self.init_widgets()
-
-    def init_widgets(self):
-
-        commands_frame = self._create_commands_frame()
-        texts_frame = self._create_text_frame()
-
-        # Creating the splitter
-        self.splitter = QSplitter(Qt.Horizontal)
-        self.splitter.addWidget(commands_frame)
-        self.splitter.addWidget(texts_frame)
-
-        self.addWidget(self.splitter)
-
-    def _create_commands_frame(self):
-        buttons_frame = self._create_buttons_frame()
-        speed_frame = self._create_speed_frame()
-        jump_frame = self._create_jump_frame()
-
-        commands_layout = QVBoxLayout()
-        commands_layout.addWidget(buttons_frame)
-        commands_layout.addWidget(speed_frame)
-        commands_layout.addWidget(jump_frame)
-
-        commands_frame = QFrame()
-        commands_frame.setLayout(commands_layout)
-        commands_frame.setFrameShape(QFrame.StyledPanel)
-        return commands_frame
-
-    def _create_text_frame(self):
-        # self.input_text = InputTextEdit()
-        self.input_text = HighlighInputText()
-        self.output_text = QPlainTextEdit()
-        self.input_text.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.output_text.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.output_text.setReadOnly(True)
-        self.error_output = QLineEdit()
-
-        texts_layout = QVBoxLayout()
-        texts_layout.addWidget(QLabel('Input:'))
-        texts_layout.addWidget(self.input_text)
-        texts_layout.addWidget(QLabel('Output:'))
-        texts_layout.addWidget(self.output_text)
-        texts_layout.addWidget(self.error_output)
-
-        texts_frame = QFrame()
-        texts_frame.setLayout(texts_layout)
-        texts_frame.setFrameShape(QFrame.StyledPanel)
-        return texts_frame
-
-    def _create_speed_frame(self):
-        speed_label = QLabel('Runspeed:')
-        # QSlider defaults to a range of 0 - 99 inclusive
-        self.speed_slider = QSlider(Qt.Horizontal)
-        self.speed_checkbox = QCheckBox('Faster')
-
-        speed_layout = QVBoxLayout()
-        speed_layout.addWidget(speed_label)
-        speed_layout.addWidget(self.speed_slider)
-        speed_layout.addWidget(self.speed_checkbox)
-
-        speed_frame = QFrame()
-        speed_frame.setLayout(speed_layout)
-        speed_frame.setFrameShape(QFrame.StyledPanel)
-        return speed_frame
-
-    def _create_buttons_frame(self):
-        self.run_button = QPushButton('Run')
-        self.continue_button = QPushButton('Continue')
-        self.step_button = QPushButton('Step')
-        self.pause_button = QPushButton('Pause')
-        self.back_button = QPushButton('Back')
-        self.stop_button = QPushButton('Stop')
-        self.buttons = [self.run_button, self.step_button,
-                        self.pause_button, self.back_button,
-                        self.stop_button, self.continue_button]
-
-        self.button_layout = QGridLayout()
-        self.button_layout.setColumnStretch(0, 1)
-        self.button_layout.setColumnStretch(1, 1)
-
-        buttons_frame = QFrame()
-        buttons_frame.setLayout(self.button_layout)
-        buttons_frame.setFrameShape(QFrame.StyledPanel)
-        return buttons_frame
-
-    def _create_jump_frame(self):
-        jump_label = QLabel('Jump:')
-        self.jump_input = QLineEdit()
-        self.jump_forwards_button = QPushButton('Forward')
-        self.jump_backwards_button = QPushButton('Backwards')
-
-        top_layout = QHBoxLayout()
-        top_layout.addWidget(jump_label)
-        top_layout.addWidget(self.jump_input)
-
-        bottom_layout = QHBoxLayout()
-        bottom_layout.addWidget(self.jump_backwards_button)
-        bottom_layout.addWidget(self.jump_forwards_button)
-
-        jump_layout = QVBoxLayout()
-        jump_layout.addLayout(top_layout)
-        jump_layout.addLayout(bottom_layout)
-
-        jump_frame = QFrame()
-        jump_frame.setLayout(jump_layout)
-        jump_frame.setFrameShape(QFrame.StyledPanel)
-        return jump_frame
-
-    def set_visualiser(self, visualiser):
-        """Display `visualiser` in `self.splitter`."""
-        visualiser_layout = QVBoxLayout()
-        visualiser_layout.addWidget(visualiser)
-        visualiser_frame = QFrame()
-        visualiser_frame.setLayout(visualiser_layout)
-        visualiser_frame.setFrameShape(QFrame.StyledPanel)
-        self.splitter.insertWidget(0, visualiser_frame)
-
-    def display_running(self):
-        """Display the buttons that should appear while running:
-        - stop - pause
-        """
-        self.add_buttons(
-            self.stop_button,
-            self.pause_button
-        )
-
-    def display_stopped(self):
-        """Display the buttons that should appear when stopped:
-        - run - step
-        """
-        self.add_buttons(
-            self.run_button,
-            self.step_button
-        )
-
-    def display_paused(self):
-        """Display the buttons that should appear when paused:
-        - stop - step
-        - back - continue
-        """
-        self.add_buttons(
-            self.stop_button,
-            self.step_button,
-            self.back_button,
-            self.continue_button
-        )
-
-    def add_buttons(self, a, b, c=None, d=None):
-        """Clear all buttons then display the buttons a,b,c,d.
-        Also hide the error text.
-
-        TODO:
-            Display the buttons on the same row. Eg. when only displaying
-            two buttons, display them on the top row, not the middle.
-        """
-        self.clear_buttons()
-        self.hide_error_text()
-        self.button_layout.addWidget(a, 0, 0)
-        a.show()
-        self.button_layout.addWidget(b, 0, 1)
-        b.show()
-        if c is not None:
-            self.button_layout.addWidget(c, 1, 0)
-            c.show()
-        if d is not None:
-            self.button_layout.addWidget(d, 1, 1)
-            d.show()
-
-    def clear_buttons(self):
-        """Remove all buttons."""
-        for button in self.buttons:
-            if button.isVisible():
-                self.button_layout.removeWidget(button)
-                button.hide()
-
-    def display_error_text(self, text):
-        self.error_output.show()
-        self.error_output.setText(text)
-
-    def hide_error_text(self):
-        self.error_output.hide()
-
-
-class BrainfuckVisualiser(QWidget):
-    """Visualise Brainfuck programs"""
-
-    # FIXME:
-    # Doesn't quite scroll to item correctly, especially in set_visuals
-
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.commander = parent
-
-        self.selected_format = QBrush(Qt.red)
-        self.unselected_format = QBrush(Qt.white)
-        self.foreground_format = QBrush(Qt.black)
-
-        self.init_widgets()
-        self.reset_tape()
-
-    def init_widgets(self):
-        self.table = ResizingTable(self, minsize=30, column_counts=(5, 10, 20))
-        self.table.setFocusPolicy(Qt.NoFocus)
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-
-        layout = QVBoxLayout()
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def reset_tape(self):
-        """"Reset the table to the default size of 20 cells."""
-        self.table.reset_cells()
-        for _ in range(20):
-            self._add_table_cell()
-
-        self.last_cell = QTableWidgetItem()
-
-        self.visuals_to_add = OrderedDict()
-
-    def add_visual(self, interpreter):
-        self.visuals_to_add[interpreter.tape_pointer] = interpreter.current_cell
-        self.visuals_to_add.move_to_end(interpreter.tape_pointer)
-
-    def set_visuals(self):
-        if not self.visuals_to_add:
-            return
-
-        for index, value in self.visuals_to_add.items():
-            table_cell = self._get_table_cell_from_index(index)
-            while table_cell is None:
-                self._add_table_cell()
-                table_cell = self._get_table_cell_from_index(index)
-            table_cell.setText(str(value))
-
-        self._highlight_cell(table_cell)
-        self.table.scrollToItem(table_cell)
-
-        self.visuals_to_add = OrderedDict()
-
-    def configure_visual(self, interpreter):
-        """"Configure the value of the current cell.
-        `interpreter` is the current interpreter object.
-        Then also highlight the cell."""
-        table_cell = self._get_current_table_cell(interpreter)
-        if table_cell is None:
-            table_cell = self._add_table_cell()
-        table_cell.setText(str(interpreter.current_cell))
-
-        self._highlight_cell(table_cell)
-        self.table.scrollToItem(table_cell)
-
-    def _highlight_cell(self, table_cell):
-        """Highlight `table_cell` and remove highlighting from the last highlighted cell."""
-        if self.last_cell == table_cell:
-            return
-
-        self.last_cell.setBackground(self.unselected_format)
-        table_cell.setBackground(self.selected_format)
-        self.last_cell = table_cell
-
-    def _get_current_table_cell(self, interpreter):
-        """Return the current cell that `interpreter.tape_pointer` points to."""
-        return self._get_table_cell_from_index(interpreter.tape_pointer)
-
-    def _get_table_cell_from_index(self, index):
-        cell_row, cell_column = divmod(index, self.table.columnCount())
-        return self.table.item(cell_row, cell_column)
-
-    def _add_table_cell(self):
-        """Add a new cell to `self.table`."""
-        table_cell = QTableWidgetItem('0')
-        table_cell.setForeground(self.foreground_format)
-        table_cell.setFlags(Qt.NoItemFlags)
-        self.table.add_item(table_cell)
-        return table_cell
-
-
-class VisualiserController:
-    """Class that handles the logic behind the visualising commands."""
-
-    INTERPRETER_TYPES = {
-        '.b': (BFInterpreter, BrainfuckVisualiser),
-    }
-
-    def __init__(self, master):
-        self.visualiser_master = master
-
-        self.interpreter_type = None
-        self.visualiser = None
-
-        self.interpreter = None
-
-    def set_extension(self, extension):
-        """Set the `self.interpreter_type` and `self.visualiser` to the correct ones defined by
-        `extension`. If new `extension` is different, then delete `self.visualiser` and set it to None.
-        If there is no suitable visualiser / interpreter for `extension`, set them to None."""
-        interpreter_type, visualiser_type = self.INTERPRETER_TYPES.get(extension, (None, None))
-        # if isinstance(self.visualiser, visualiser_type):
-        if type(self.visualiser) is visualiser_type:
-            # The new extension is the same as the old one
-            return
-
-        # Delete the current visualiser
-        if self.visualiser is not None:
-            self.visualiser.deleteLater()
-            self.visualiser = None
-            # self.visualiser_master.delete_visualiser()
-
-        if visualiser_type is None:
-            # There is no suitable visualiser / interpreter for the extension
-            self.interpreter_type = None
-            self.visualiser = None
-        else:
-            self.interpreter_type = interpreter_type
-            self.visualiser = visualiser_type(self.visualiser_master)
-
-            self.visualiser_master.set_visualiser(self.visualiser)
-            self.visualiser_master.layout_manager.input_text.set_extension(extension)
-
-    def step(self, display=True):
-        """Step one instruction. If `display` is True, then also do special display stuff
-        like highlighting the current command being executed. If `self.interpreter` is None,
-        then initialise it. Return True if stepping was successful else False."""
-        if self.interpreter is None:
-            if not self.restart_interpreter():
-                return False
-
-        try:
-            code_pointer = self.interpreter.step()
-        except InterpreterError as error:
-            self.handle_error(error)
-            return False
-
-        self.visualiser.configure_visual(self.interpreter)
-        self.visualiser_master.set_current_code_pointer(code_pointer)
-        if display:
-            self.visualiser_master.highlight_current_code_pointer()
-
-        return True
-
-    def back(self, display=True):
-
-        try:
-            code_pointer = self.interpreter.back()
-        except NoPreviousExecutionError as error:
-            self.handle_error(error)
-            return False
-
-        self.visualiser.configure_visual(self.interpreter)
-        self.visualiser_master.set_current_code_pointer(code_pointer)
-        if display:
-            self.visualiser_master.highlight_current_code_pointer()
-
-        return True
-
-    def jump_forwards(self, steps):
-        self.jump(1, steps)
-
-    def jump_backwards(self, steps):
-        self.jump(-1, steps)
-
-    def jump(self, direction, steps):
-
-        if self.interpreter is None:
-            if not self.restart_interpreter():
-                return
-
-        command = self.interpreter.step if direction == 1 else self.interpreter.back
-
-        error = None
-        changed = False
-        for i in range(steps):
-            try:
-                code_pointer = command()
-            except InterpreterError as e:
-                error = e
-                break
-            changed = True
-            self.visualiser.add_visual(self.interpreter)
-
-        if changed:
-            self.visualiser_master.set_current_code_pointer(code_pointer)
-            self.visualiser_master.highlight_current_code_pointer()
-            self.visualiser.set_visuals()
-
-        if error is not None:
-            self.handle_error(error)
-
-    def stop(self):
-        """Stop the interpreter. self `self.interpreter` to None"""
-        self.interpreter = None
-
-    def restart_interpreter(self):
-        """Initaliser `self.interpreter`. Reset `self.visualiser` and `self.visualiser_master`.
-        Return True if creating an interpreter was successful else False."""
-        self.visualiser.reset_tape()
-        self.visualiser_master.restart()
-
-        try:
-            self.interpreter = self.interpreter_type(self.visualiser_master.get_code_text(),
-                                                     input_func=self.visualiser_master.next_input,
-                                                     undo_input_func=self.visualiser_master.undo_input,
-                                                     output_func=self.visualiser_master.set_output)
-        except ProgramSyntaxError as error:
-            self.handle_error(error)
-            return False
-        return True
-
-    def handle_error(self, error):
-        """Handle any `InterpreterError` raised by `self.interpreter`"""
-        if isinstance(error, ExecutionEndedError):
-            message = 'Execution finished'
-        elif isinstance(error, NoPreviousExecutionError):
-            message = 'No previous execution'
-        elif isinstance(error, NoInputError):
-            message = 'Enter input'
-        elif isinstance(error, ProgramError):
-            error_type = error.error
-            if error_type is ErrorTypes.UNMATCHED_OPEN_PAREN:
-                message = 'Unmatched opening parentheses'
-            elif error_type is ErrorTypes.UNMATCHED_CLOSE_PAREN:
-                message = 'Unmatched closing parentheses'
-            elif error_type is ErrorTypes.INVALID_TAPE_CELL:
-                message = 'Tape pointer out of bounds'
-            else:
-                raise error
-        else:
-            raise error
-
-        self.visualiser_master.pause_command()
-        self.visualiser_master.display_error_text(message)
-        self.visualiser_master.highlight_current_code_pointer()
-
-
-class VisualiserMaster(QWidget):
-
-    def __init__(self, text_editor, code_text):
-        super().__init__(text_editor)
-
-        self.text_editor = text_editor
-        self.code_text = code_text
-        self.text_cursor = code_text.textCursor()
-
-        self.visualiser_controller = VisualiserController(self)
-
-        self.highlight_format = QTextCharFormat()
-        self.highlight_format.setBackground(QColor(Qt.gray))
-
-        self.prev_formats = {}
-
-        self.init_widgets()
-        self.stop_command()
-
-        self.set_runspeed()
-
-    def init_widgets(self):
-
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.run_signal)
-        self.timer.setInterval(10)
-
-        layout = VisualiserLayoutManager()
-        self.setLayout(layout)
-        self.layout_manager = layout
-
-        layout.run_button.clicked.connect(self.run_command)
-        layout.continue_button.clicked.connect(self.run_command)
-        layout.step_button.clicked.connect(self.step_command)
-        layout.pause_button.clicked.connect(self.pause_command)
-        layout.back_button.clicked.connect(self.back_command)
-        layout.stop_button.clicked.connect(self.stop_command)
-
-        layout.jump_forwards_button.clicked.connect(lambda: self.jump_command(1))
-        layout.jump_backwards_button.clicked.connect(lambda: self.jump_command(-1))
-
-        layout.speed_slider.valueChanged.connect(self.set_runspeed)
-        layout.speed_checkbox.stateChanged.connect(self.set_runspeed)
-
-    def set_visualiser(self, visualiser):
-        self.layout_manager.set_visualiser(visualiser)
-
-    def restart(self):
-        """Restart the visualising. <- Not a great description.
-        Disables the code text."""
-        self.set_current_code_pointer(0, length=0)
-        self.layout_manager.input_text.restart()
-        self.code_text.setReadOnly(True)
-        # self.code_text.setExtraSelections([])  # Remove the currenly highlighlied line. For some reason, Focus is not lost or something so it isn't called in the code_text
-
-    def set_extension(self, extension):
-        """Set the current file extension."""
-        self.visualiser_controller.set_extension(extension)
-
-    def visualise(self):
-        """Assert that the current file is valid for visualising."""
-        if self.visualiser_controller.interpreter_type is None:
-            raise Exception('Invalid extension. No visualiser.')
-
-    def get_code_text(self):
-        """Return the current text in `self.code_text`"""
-        return self.code_text.toPlainText()
-
-    def run_command(self):
-        """Called when `self.run_button` pressed.
-        Start the running timer."""
-        self.layout_manager.display_running()
-        self.timer.start()
-        self.run_signal()
-
-    def step_command(self):
-        """Called when `self.step_button` pressed.
-        Step forwards once."""
-        self.layout_manager.display_paused()
-        self.visualiser_controller.step()
-
-    def pause_command(self):
-        """Called when `self.pause_button` pressed.
-        Pause the running timer."""
-        self.layout_manager.display_paused()
-        self.timer.stop()
-
-    def back_command(self):
-        """Called when `self.back_button` pressed.
-        Step backwards once."""
-        self.layout_manager.display_paused()
-        self.visualiser_controller.back()
-
-    def stop_command(self):
-        """Called when `self.stop_button` pressed.
-        Stop execution."""
-        self.layout_manager.display_stopped()
-        self.timer.stop()
-        self.visualiser_controller.stop()
-
-        self.layout_manager.input_text.restart()
-        self.code_text.setReadOnly(False)
-        self.remove_command_highlights()
-
-    def jump_command(self, direction):
-        self.pause_command()
-        try:
-            steps = int(self.layout_manager.jump_input.text())
-        except ValueError:
-            self.display_error_text('Invalid jump steps')
-        else:
-            if direction == 1:
-                self.visualiser_controller.jump_forwards(steps)
-            else:
-                self.visualiser_controller.jump_backwards(steps)
-
-    def set_runspeed(self, *args):
-        """Set the interval of the running timer. Also set the amount of steps the skip
-        displaying if fast_mode is checked."""
-        if self.layout_manager.speed_checkbox.isChecked():
-            runspeed = 10
-            self.steps_skip = self.layout_manager.speed_slider.value() // 5
-        else:
-            value = self.layout_manager.speed_slider.value() + 1
-            runspeed = int(1000 / (value * value * .0098 + 1))
-            self.steps_skip = 0
-        self.timer.setInterval(runspeed)
-
-    def run_signal(self):
-        """Signal emmitted by timer. Step `self.steps_skip` without displaying, then
-        step normally."""
-        self.visualiser_controller.jump_forwards(self.steps_skip + 1)
-
-    def remove_command_highlights(self):
-        """Remove the command highlighting and set each character back to its
-        original format."""
-        for pos, format_ in self.prev_formats.items():
-            self.text_cursor.setPosition(pos)
-            self.text_cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-            self.text_cursor.setCharFormat(format_)
-        self.prev_formats = {}
-
-    def set_current_code_pointer(self, code_pointer, length=1):
-        """Sets start index and length of the current code pointer."""
-        self.current_code_pointer = (code_pointer, length)
-
-    def highlight_current_code_pointer(self):
-        """Remove the previous command highlighting and then add the new highlighting."""
-
-        self.remove_command_highlights()
-
-        code_pointer, length = self.current_code_pointer
-        end = code_pointer + length
-
-        # Can't have a negative index. Should only ever be a negative index if it
-        # is the 0th instruction. If it is negative, set it to 0, but don't change
-        # the end location
-        if code_pointer < 0:
-            code_pointer = 0
-
-        self.text_cursor.setPosition(code_pointer)
-        for pos in range(code_pointer, end):
-            # Release the anchor
-            # self.text_cursor.movePosition(QTextCursor.NoMove, QTextCursor.MoveAnchor)
-            self.text_cursor.setPosition(self.text_cursor.position(), QTextCursor.MoveAnchor)
-            # Move along one char
-            self.text_cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-            # Store format of previous char
-            char_format = self.text_cursor.charFormat()
-            self.prev_formats[pos] = char_format
-            # Merge new format
-            self.text_cursor.mergeCharFormat(self.highlight_format)
-        # self.text_cursor.movePosition(QTextCursor.NoMove, QTextCursor.MoveAnchor)
-        self.text_cursor.setPosition(self.text_cursor.position(), QTextCursor.MoveAnchor)
-
-    def set_output(self, text):
-        """Set the current output to `text`"""
-        self.layout_manager.output_text.setPlainText(text)
-        self.layout_manager.output_text.verticalScrollBar().triggerAction(QScrollBar.SliderToMaximum)
-
-    def next_input(self):
-        """Return the next input from `self.input_text`"""
-        return self.layout_manager.input_text.next_()
-
-    def undo_input(self):
-        """Undo the last input from `self.input_text`."""
-        self.layout_manager.input_text.prev()
-
-    def display_error_text(self, text):
-        self.layout_manager.display_error_text(text)
-
-    def hide_error_text(self):
-        self.layout_manager.hide_error_text()
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+from PyQt5.QtCore import (Qt,
+                          QSize,
+                          QTimer,
+                          QAbstractTableModel,
+                          QModelIndex,
+                          QRectF,
+                          QObject,
+                          QThread,
+                          pyqtSignal,
+                          pyqtSlot,
+                          )
+from PyQt5.QtGui import (QTextCursor,
+                         QBrush,
+                         QTextCharFormat,
+                         QColor,
+                         QImage,
+                         QPainter,
+                         QRegion,
+                         qRgb,
+                         )
+from PyQt5.QtWidgets import (QApplication,
+                             QPlainTextEdit,
+                             QTextEdit,
+                             QWidget,
+                             QVBoxLayout,
+                             QBoxLayout,
+                             QLayout,
+                             QStatusBar,
+                             QTableWidget,
+                             QHBoxLayout,
+                             QPushButton,
+                             QGridLayout,
+                             QTableWidgetItem,
+                             QTableView,
+                             QHeaderView,
+                             QSplitter,
+                             QFrame,
+                             QLineEdit,
+                             QSlider,
+                             QLabel,
+                             QCheckBox,
+                             QScrollBar,
+                             )
+
+from interpreter import (FastBrainfuckInterpreter,
+                         BFInterpreter,
+                         ErrorTypes,
+                         InterpreterError,
+                         ProgramError,
+                         NoInputError,
+                         NoPreviousExecutionError,
+                         ProgramRuntimeError,
+                         ProgramSyntaxError,
+                         ExecutionEndedError,
+                         RunLimits,
+                         SourceMap,)
+from utility_widgets import ResizingTableView
+from input_text import InputTextEdit, HighlighInputText, InputReader
+from execution_trace import TraceWriter
+
+
+class VisualiserLayoutManager(QHBoxLayout):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.init_widgets()
+
+    def init_widgets(self):
+
+        commands_frame = self._create_commands_frame()
+        texts_frame = self._create_text_frame()
+
+        # Creating the splitter
+        self.splitter = QSplitter(Qt.Horizontal)
+        self.splitter.addWidget(commands_frame)
+        self.splitter.addWidget(texts_frame)
+
+        self.addWidget(self.splitter)
+
+    def _create_commands_frame(self):
+        buttons_frame = self._create_buttons_frame()
+        speed_frame = self._create_speed_frame()
+        jump_frame = self._create_jump_frame()
+        trace_frame = self._create_trace_frame()
+
+        commands_layout = QVBoxLayout()
+        commands_layout.addWidget(buttons_frame)
+        commands_layout.addWidget(speed_frame)
+        commands_layout.addWidget(jump_frame)
+        commands_layout.addWidget(trace_frame)
+
+        commands_frame = QFrame()
+        commands_frame.setLayout(commands_layout)
+        commands_frame.setFrameShape(QFrame.StyledPanel)
+        return commands_frame
+
+    def _create_text_frame(self):
+        # self.input_text = InputTextEdit()
+        self.input_text = HighlighInputText()
+        self.output_text = QPlainTextEdit()
+        self.input_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.output_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.output_text.setReadOnly(True)
+        self.error_output = QLineEdit()
+
+        texts_layout = QVBoxLayout()
+        texts_layout.addWidget(QLabel('Input:'))
+        texts_layout.addWidget(self.input_text)
+        texts_layout.addWidget(QLabel('Output:'))
+        texts_layout.addWidget(self.output_text)
+        texts_layout.addWidget(self.error_output)
+
+        texts_frame = QFrame()
+        texts_frame.setLayout(texts_layout)
+        texts_frame.setFrameShape(QFrame.StyledPanel)
+        return texts_frame
+
+    def _create_speed_frame(self):
+        speed_label = QLabel('Runspeed:')
+        # QSlider defaults to a range of 0 - 99 inclusive
+        self.speed_slider = QSlider(Qt.Horizontal)
+        self.speed_checkbox = QCheckBox('Faster')
+
+        speed_layout = QVBoxLayout()
+        speed_layout.addWidget(speed_label)
+        speed_layout.addWidget(self.speed_slider)
+        speed_layout.addWidget(self.speed_checkbox)
+
+        speed_frame = QFrame()
+        speed_frame.setLayout(speed_layout)
+        speed_frame.setFrameShape(QFrame.StyledPanel)
+        return speed_frame
+
+    def _create_buttons_frame(self):
+        self.run_button = QPushButton('Run')
+        self.continue_button = QPushButton('Continue')
+        self.step_button = QPushButton('Step')
+        self.pause_button = QPushButton('Pause')
+        self.back_button = QPushButton('Back')
+        self.stop_button = QPushButton('Stop')
+        self.buttons = [self.run_button, self.step_button,
+                        self.pause_button, self.back_button,
+                        self.stop_button, self.continue_button]
+
+        self.button_layout = QGridLayout()
+        self.button_layout.setColumnStretch(0, 1)
+        self.button_layout.setColumnStretch(1, 1)
+
+        buttons_frame = QFrame()
+        buttons_frame.setLayout(self.button_layout)
+        buttons_frame.setFrameShape(QFrame.StyledPanel)
+        return buttons_frame
+
+    def _create_jump_frame(self):
+        jump_label = QLabel('Jump:')
+        self.jump_input = QLineEdit()
+        self.jump_forwards_button = QPushButton('Forward')
+        self.jump_backwards_button = QPushButton('Backwards')
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(jump_label)
+        top_layout.addWidget(self.jump_input)
+
+        bottom_layout = QHBoxLayout()
+        bottom_layout.addWidget(self.jump_backwards_button)
+        bottom_layout.addWidget(self.jump_forwards_button)
+
+        jump_layout = QVBoxLayout()
+        jump_layout.addLayout(top_layout)
+        jump_layout.addLayout(bottom_layout)
+
+        jump_frame = QFrame()
+        jump_frame.setLayout(jump_layout)
+        jump_frame.setFrameShape(QFrame.StyledPanel)
+        return jump_frame
+
+    def _create_trace_frame(self):
+        self.trace_checkbox = QCheckBox('Record trace')
+        self.trace_label = QLabel()
+        self.trace_slider = QSlider(Qt.Horizontal)
+        self.trace_slider.setEnabled(False)
+
+        trace_layout = QVBoxLayout()
+        trace_layout.addWidget(self.trace_checkbox)
+        trace_layout.addWidget(self.trace_slider)
+        trace_layout.addWidget(self.trace_label)
+
+        trace_frame = QFrame()
+        trace_frame.setLayout(trace_layout)
+        trace_frame.setFrameShape(QFrame.StyledPanel)
+        return trace_frame
+
+    def set_visualiser(self, visualiser):
+        """Display `visualiser` in `self.splitter`."""
+        visualiser_layout = QVBoxLayout()
+        visualiser_layout.addWidget(visualiser)
+        visualiser_frame = QFrame()
+        visualiser_frame.setLayout(visualiser_layout)
+        visualiser_frame.setFrameShape(QFrame.StyledPanel)
+        self.splitter.insertWidget(0, visualiser_frame)
+
+    def display_running(self):
+        """Display the buttons that should appear while running:
+        - stop - pause
+        """
+        self.add_buttons(
+            self.stop_button,
+            self.pause_button
+        )
+
+    def display_stopped(self):
+        """Display the buttons that should appear when stopped:
+        - run - step
+        """
+        self.add_buttons(
+            self.run_button,
+            self.step_button
+        )
+
+    def display_paused(self):
+        """Display the buttons that should appear when paused:
+        - stop - step
+        - back - continue
+        """
+        self.add_buttons(
+            self.stop_button,
+            self.step_button,
+            self.back_button,
+            self.continue_button
+        )
+
+    def add_buttons(self, a, b, c=None, d=None):
+        """Clear all buttons then display the buttons a,b,c,d.
+        Also hide the error text.
+
+        TODO:
+            Display the buttons on the same row. Eg. when only displaying
+            two buttons, display them on the top row, not the middle.
+        """
+        self.clear_buttons()
+        self.hide_error_text()
+        self.button_layout.addWidget(a, 0, 0)
+        a.show()
+        self.button_layout.addWidget(b, 0, 1)
+        b.show()
+        if c is not None:
+            self.button_layout.addWidget(c, 1, 0)
+            c.show()
+        if d is not None:
+            self.button_layout.addWidget(d, 1, 1)
+            d.show()
+
+    def clear_buttons(self):
+        """Remove all buttons."""
+        for button in self.buttons:
+            if button.isVisible():
+                self.button_layout.removeWidget(button)
+                button.hide()
+
+    def display_error_text(self, text):
+        self.error_output.show()
+        self.error_output.setText(text)
+
+    def hide_error_text(self):
+        self.error_output.hide()
+
+
+class TapeModel(QAbstractTableModel):
+    """Table model that reads the cell values straight from an interpreter's tape.
+    Cells are laid out left to right, `self.columns` cells per row.
+
+    Nothing is copied out of the tape. Changed cells are marked with `mark_dirty`
+    and the view is only told about them when `update` is called."""
+
+    # Minimum number of cells to display
+    MIN_CELLS = 20
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.columns = 1
+
+        self.selected_format = QBrush(Qt.red)
+        self.foreground_format = QBrush(Qt.black)
+
+        self.reset_tape()
+
+    def reset_tape(self, tape=None):
+        """Display `tape`. If `tape` is None, then display an empty tape."""
+        self.beginResetModel()
+        self.tape = tape if tape is not None else []
+        self.cell_count = max(len(self.tape), self.MIN_CELLS)
+        self.tape_pointer = 0
+        self.dirty = set()
+        self.endResetModel()
+
+    def set_columns(self, columns):
+        """Lay out the cells with `columns` cells per row."""
+        self.beginResetModel()
+        self.columns = columns
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rows_for(self.cell_count)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.columns
+
+    def data(self, index, role=Qt.DisplayRole):
+        cell = self.cell_index(index)
+        if cell >= self.cell_count:
+            return None
+
+        if role == Qt.DisplayRole:
+            return str(self.tape[cell]) if cell < len(self.tape) else '0'
+        if role == Qt.BackgroundRole and cell == self.tape_pointer:
+            return self.selected_format
+        if role == Qt.ForegroundRole:
+            return self.foreground_format
+        return None
+
+    def flags(self, index):
+        return Qt.NoItemFlags
+
+    def cell_index(self, index):
+        """Return the tape index of the cell at the model index `index`."""
+        return index.row() * self.columns + index.column()
+
+    def model_index(self, cell):
+        """Return the model index of the tape cell `cell`."""
+        row, column = divmod(cell, self.columns)
+        return self.index(row, column)
+
+    def mark_dirty(self, cell):
+        """Mark tape cell `cell` as changed."""
+        self.dirty.add(cell)
+
+    def set_tape_pointer(self, tape_pointer):
+        """Move the highlighted cell to `tape_pointer`."""
+        self.dirty.add(self.tape_pointer)
+        self.tape_pointer = tape_pointer
+        self.dirty.add(tape_pointer)
+
+    def update(self):
+        """Tell the view about any cells added to the tape and any cells marked
+        as dirty since the last update."""
+        cell_count = max(len(self.tape), self.MIN_CELLS)
+        if cell_count > self.cell_count:
+            rows, new_rows = self.rowCount(), self._rows_for(cell_count)
+            if new_rows > rows:
+                self.beginInsertRows(QModelIndex(), rows, new_rows - 1)
+                self.cell_count = cell_count
+                self.endInsertRows()
+            else:
+                self.cell_count = cell_count
+
+        if not self.dirty:
+            return
+
+        # Emit one signal for each run of consecutive dirty rows
+        rows = sorted({cell // self.columns for cell in self.dirty})
+        self.dirty = set()
+        first = last = rows[0]
+        for row in rows[1:] + [None]:
+            if row == last + 1:
+                last = row
+                continue
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columns - 1))
+            if row is not None:
+                first = last = row
+
+    def _rows_for(self, cell_count):
+        """Return the number of rows needed to display `cell_count` cells."""
+        return -(-cell_count // self.columns)
+
+
+class TapeMinimap(QWidget):
+    """Compact overview of the whole tape, drawn from a `QImage` with one pixel
+    column per cell. Cells are coloured by their value, and cells that have
+    recently been written to glow and then fade over the next frames.
+
+    Only the pixels of dirty cells and fading cells are redrawn each frame.
+    Emits `cell_clicked` with the tape index under the mouse when clicked."""
+
+    cell_clicked = pyqtSignal(int)
+
+    # Minimum number of cells to display
+    MIN_CELLS = 20
+    # Written cells fade in `HEAT_LEVELS` steps, one step every `FRAMES_PER_LEVEL` frames
+    HEAT_LEVELS = 4
+    FRAMES_PER_LEVEL = 8
+
+    ACTIVE_COLOUR = QColor(255, 160, 0)
+    POINTER_COLOUR = QColor(Qt.red)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.setFixedHeight(20)
+        self.setCursor(Qt.PointingHandCursor)
+
+        self.reset_tape()
+
+    def reset_tape(self, tape=None):
+        """Display `tape`. If `tape` is None, then display an empty tape."""
+        self.tape = tape if tape is not None else []
+        self.tape_pointer = 0
+        self.dirty = set()
+        self.frame = 0
+        # Frame that each recently written cell was last written in.
+        # Cells are removed once they have cooled down
+        self.written = {}
+        # (frame, cells written in that frame) for each recent frame, oldest first
+        self.recent_writes = deque()
+        self.values = []
+        # Cache of rgb values, keyed by (value, heat)
+        self._colours = {}
+
+        self.image = QImage(max(len(self.tape), self.MIN_CELLS), 1, QImage.Format_RGB32)
+        self.image.fill(self._colour(0, 0))
+        self._draw_cells(range(len(self.tape)))
+        self.update()
+
+    def mark_dirty(self, cell):
+        """Mark tape cell `cell` as possibly changed."""
+        self.dirty.add(cell)
+
+    def update_image(self, tape_pointer):
+        """Redraw the pixels of the dirty and fading cells, move the pointer marker to
+        `tape_pointer`, then repaint only the parts of the widget that changed."""
+        self._grow_image()
+        self.frame += 1
+
+        written_cells = set()
+        for cell in self.dirty:
+            if cell < len(self.tape) and self.tape[cell] != self._value(cell):
+                self.written[cell] = self.frame
+                written_cells.add(cell)
+        self.dirty = set()
+        self.recent_writes.append((self.frame, written_cells))
+
+        # Apart from the new writes, only redraw the cells whose heat has just dropped a level
+        changed = set(written_cells)
+        fade_frames = self.HEAT_LEVELS * self.FRAMES_PER_LEVEL
+        while self.recent_writes and self.frame - self.recent_writes[0][0] >= fade_frames:
+            frame, cells = self.recent_writes.popleft()
+            for cell in cells:
+                if self.written.get(cell) == frame:
+                    del self.written[cell]
+                    changed.add(cell)
+        for frame, cells in self.recent_writes:
+            age = self.frame - frame
+            if age and age % self.FRAMES_PER_LEVEL == 0:
+                changed.update(cell for cell in cells if self.written.get(cell) == frame)
+
+        self._draw_cells(changed)
+
+        changed.add(self.tape_pointer)
+        changed.add(tape_pointer)
+        self.tape_pointer = tape_pointer
+        self.update(self._region_for(changed))
+
+    def cell_count(self):
+        """Return the number of cells currently displayed."""
+        return max(len(self.tape), self.MIN_CELLS)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawImage(QRectF(self.rect()), self.image, QRectF(0, 0, self.cell_count(), 1))
+
+        left, right = self._x_range(self.tape_pointer, self.tape_pointer)
+        painter.fillRect(left, 0, max(1, right - left), self.height(), self.POINTER_COLOUR)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.width() > 0:
+            cell = int(event.x() * self.cell_count() / self.width())
+            self.cell_clicked.emit(min(max(cell, 0), self.cell_count() - 1))
+        else:
+            super().mousePressEvent(event)
+
+    def _grow_image(self):
+        """Make `self.image` wide enough for the whole tape, doubling its width."""
+        width = self.image.width()
+        if len(self.tape) <= width:
+            return
+
+        new_width = max(len(self.tape), width * 2)
+        image = QImage(new_width, 1, QImage.Format_RGB32)
+        image.fill(self._colour(0, 0))
+        painter = QPainter(image)
+        painter.drawImage(0, 0, self.image)
+        painter.end()
+        # New cells are only ever added as 0, so there is nothing else to draw
+        self.image = image
+
+    def _draw_cells(self, cells):
+        """Set the pixel of each of `cells` from its value and heat."""
+        tape, values, colours = self.tape, self.values, self._colours
+        if len(values) < len(tape):
+            values.extend([0] * (len(tape) - len(values)))
+
+        for cell in cells:
+            if cell >= len(tape):
+                continue
+            value = tape[cell]
+            values[cell] = value
+            written = self.written.get(cell)
+            heat = 0 if written is None else self.HEAT_LEVELS - (self.frame - written) // self.FRAMES_PER_LEVEL
+            colour = colours.get((value, heat))
+            if colour is None:
+                colour = colours[value, heat] = self._colour(value, heat)
+            self.image.setPixel(cell, 0, colour)
+
+    def _value(self, cell):
+        """Return the value of `cell` when it was last drawn."""
+        return self.values[cell] if cell < len(self.values) else 0
+
+    def _colour(self, value, heat):
+        """Return the rgb value of a cell with `value` and `heat`."""
+        level = min(max(value, 0), 255)
+        red, green, blue = 0, level // 2, level
+        if heat:
+            mix = heat / self.HEAT_LEVELS
+            active = self.ACTIVE_COLOUR
+            red += int((active.red() - red) * mix)
+            green += int((active.green() - green) * mix)
+            blue += int((active.blue() - blue) * mix)
+        return qRgb(red, green, blue)
+
+    def _x_range(self, first, last):
+        """Return the range of x coordinates covering cells `first` to `last` inclusive."""
+        scale = self.width() / self.cell_count()
+        return int(first * scale), int((last + 1) * scale + 1)
+
+    def _region_for(self, cells):
+        """Return the region of the widget covering `cells`, with one rect for
+        each run of consecutive cells."""
+        region = QRegion()
+        cells = sorted(cells)
+        if not cells:
+            return region
+
+        first = last = cells[0]
+        for cell in cells[1:] + [None]:
+            if cell == last + 1:
+                last = cell
+                continue
+            left, right = self._x_range(first, last)
+            region += QRegion(left, 0, right - left, self.height())
+            if cell is not None:
+                first = last = cell
+        return region
+
+
+class BrainfuckVisualiser(QWidget):
+    """Visualise Brainfuck programs"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.commander = parent
+
+        self.init_widgets()
+        self.reset_tape()
+
+    def init_widgets(self):
+        self.model = TapeModel(self)
+
+        self.table = ResizingTableView(self, minsize=30, column_counts=(5, 10, 20))
+        self.table.setModel(self.model)
+        self.table.setFocusPolicy(Qt.NoFocus)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.columns_changed.connect(self.set_columns)
+
+        self.minimap = TapeMinimap(self)
+        self.minimap.cell_clicked.connect(self.scroll_to_cell)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.minimap)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def reset_tape(self, tape=None):
+        """Reset the table to display `tape`. If `tape` is None, then display
+        the default of 20 empty cells."""
+        self.model.reset_tape(tape)
+        self.minimap.reset_tape(tape)
+
+    def set_columns(self, columns):
+        """Called when the number of columns that fit in the table changes."""
+        self.model.set_columns(columns)
+        self._scroll_to_current()
+
+    def add_visual(self, tape_pointer, cells=()):
+        """Mark `cells` as changed and move the highlighted cell to `tape_pointer`,
+        without displaying them yet."""
+        for cell in cells:
+            self.model.mark_dirty(cell)
+            self.minimap.mark_dirty(cell)
+        self.model.set_tape_pointer(tape_pointer)
+
+    def set_visuals(self):
+        """Display all the changes added with `add_visual`."""
+        self.model.update()
+        self.minimap.update_image(self.model.tape_pointer)
+        self._scroll_to_current()
+
+    def scroll_to_cell(self, cell):
+        """Scroll the table to show tape cell `cell`."""
+        self.table.scrollTo(self.model.model_index(cell), QTableView.PositionAtCenter)
+
+    def _scroll_to_current(self):
+        """Scroll the table to the highlighted cell."""
+        self.table.scrollTo(self.model.model_index(self.model.tape_pointer))
+
+
+Snapshot = namedtuple('Snapshot', [
+    'generation',  # Generation of the interpreter that the snapshot is from
+    'finished_job',  # Id of the last job that has finished
+    'code_pointer',  # Last executed code pointer, or None if it hasn't changed
+    'tape_pointer',
+    'tape_length',
+    'cells',  # Dict of the cells that have changed, mapping index to value
+    'output_start',  # Index that the output has changed from
+    'output',  # The output from `output_start` onwards
+    'input_range',  # (start, end) of the last consumed input
+    'instruction_count',
+    'recorded_steps',  # Number of steps in the execution trace, or None if there isn't one
+    'error',  # Error that ended the last job, or None
+])
+
+
+class VisualiserWorker(QObject):
+    """Runs the visualiser's interpreter on its own thread.
+
+    Jobs are requested with `job_requested` and are run one at a time. While a job
+    is running, the state of the interpreter is published as a `Snapshot` at
+    display rate. Snapshots that the GUI hasn't taken yet are merged, so the GUI
+    only ever has to display the latest one, which it polls for with `take_snapshot`.
+
+    If the session has a `TraceWriter`, then every new step is recorded to it, and
+    `scrub_requested` can jump to any step that has been recorded."""
+
+    # Minimum time between publishing snapshots, in seconds
+    PUBLISH_INTERVAL = 1 / 60
+    # Length of a frame while running with a frame budget, in seconds
+    FRAME_INTERVAL = 0.016
+    # Number of steps between each check for cancellation and the clock
+    CHECK_INTERVAL = 64
+
+    session_requested = pyqtSignal(object, object, object, int)
+    job_requested = pyqtSignal(int, int, object, object, str)
+    scrub_requested = pyqtSignal(int, int, str)
+
+    def __init__(self):
+        super().__init__()
+
+        # All jobs with an id up to and including this are cancelled.
+        # Only ever written to by the GUI thread.
+        self.cancelled_job = 0
+        self.finished_job = 0
+
+        self._lock = threading.Lock()
+        self._pending = None
+
+        self.trace = None
+        self.trace_reader = None
+        self.start_session(None, None, None, 0)
+
+        self.session_requested.connect(self.start_session)
+        self.job_requested.connect(self.run_job)
+        self.scrub_requested.connect(self.scrub_job)
+
+    @pyqtSlot(object, object, object, int)
+    def start_session(self, interpreter, reader, trace, generation):
+        """Run all the following jobs with `interpreter`, reading input from `reader`.
+        If `trace` is not None, then record the execution to it. The previous trace is deleted."""
+        self.close_trace()
+        self.interpreter = interpreter
+        self.reader = reader
+        self.trace = trace
+        self.generation = generation
+
+        self.code_pointer = None
+        self.dirty = set()
+        self.output = ''
+        self.output_start = 0
+
+    def record_output(self, text):
+        """Output function of the interpreter. Called from the worker thread."""
+        self.output_start = min(self.output_start, len(text), len(self.output))
+        self.output = text
+
+    @pyqtSlot(int, int, object, object, str)
+    def run_job(self, job_id, direction, steps, budget, input_text):
+        """Step `steps` times in `direction`. If `budget` is not None, then only run for
+        `budget` seconds of every frame. `input_text` is the current text of the input."""
+        interpreter = self.interpreter
+        error = None
+
+        if interpreter is not None and job_id > self.cancelled_job:
+            self.set_input(input_text)
+            command = interpreter.step if direction == 1 else interpreter.back
+            trace = self.trace if direction == 1 else None
+            dirty = self.dirty
+            check_interval = self.CHECK_INTERVAL
+            last_publish = frame_start = time.perf_counter()
+            try:
+                for i in range(steps):
+                    self.code_pointer = command()
+                    dirty.add(interpreter.tape_pointer)
+                    if trace is not None:
+                        trace.record(interpreter, self.reader.prev_input_indexes[-1])
+                    if i % check_interval:
+                        continue
+
+                    if job_id <= self.cancelled_job:
+                        break
+                    now = time.perf_counter()
+                    if budget is not None and now - frame_start >= budget:
+                        self.publish()
+                        time.sleep(max(0, self.FRAME_INTERVAL - (now - frame_start)))
+                        last_publish = frame_start = time.perf_counter()
+                    elif now - last_publish >= self.PUBLISH_INTERVAL:
+                        self.publish()
+                        last_publish = now
+            except NoPreviousExecutionError as e:
+                # The history before a scrub is gone, but it can still be found in the trace
+                target = interpreter.instruction_count - (steps - i)
+                if self.trace is not None and interpreter.instruction_count > 0:
+                    self.restore_from_trace(max(0, target))
+                if self.trace is None or target < 0:
+                    error = e
+            except InterpreterError as e:
+                error = e
+
+        self.finished_job = job_id
+        self.publish(error)
+
+    @pyqtSlot(int, int, str)
+    def scrub_job(self, job_id, instruction_count, input_text):
+        """Jump to the recorded state after `instruction_count` steps."""
+        if self.interpreter is not None and self.trace is not None and job_id > self.cancelled_job:
+            self.set_input(input_text)
+            self.restore_from_trace(instruction_count)
+
+        self.finished_job = job_id
+        self.publish()
+
+    def set_input(self, input_text):
+        """Read the input from `input_text`. Only the input after the consumed input can
+        have changed, but the steps after the current one in the trace may have read
+        the old input, so the trace is truncated at the current step if they did."""
+        old_text = self.reader.text
+        if input_text == old_text:
+            return
+        edit = next((i for i, (old, new) in enumerate(zip(old_text, input_text)) if old != new),
+                    min(len(old_text), len(input_text)))
+        if self.trace is not None and edit < self.trace.input_range[1]:
+            # The reader's memory map can't outlive the end of the file
+            if self.trace_reader is not None:
+                self.trace_reader.close()
+                self.trace_reader = None
+            self.trace.truncate(self.interpreter.instruction_count)
+        self.reader.text = input_text
+
+    def restore_from_trace(self, instruction_count):
+        """Restore the interpreter to the recorded state after `instruction_count` steps.
+        The instruction count is clamped to the steps that have been recorded."""
+        interpreter = self.interpreter
+        if self.trace_reader is None or self.trace_reader.step_count != self.trace.step_count:
+            if self.trace_reader is not None:
+                self.trace_reader.close()
+            self.trace_reader = self.trace.reader()
+        state = self.trace_reader.state_at(max(0, min(instruction_count, self.trace_reader.step_count)))
+
+        # The tape never shrinks, so that the cells past the end of the old one are still shown
+        old_tape = interpreter.tape
+        tape = list(state.tape)
+        if len(tape) < len(old_tape):
+            tape.extend([0] * (len(old_tape) - len(tape)))
+        self.dirty.update(cell for cell, (old, new) in enumerate(zip(old_tape, tape)) if old != new)
+        self.dirty.update(range(len(old_tape), len(tape)))
+        self.dirty.add(state.tape_pointer)
+
+        interpreter.restore(state.code_pointer, state.tape_pointer, tape, state.output,
+                            state.instruction_count)
+        self.reader.prev_input_indexes = list(state.input_range)
+        self.code_pointer = state.code_pointer
+
+    def close_trace(self):
+        """Delete the trace of the current session, if there is one."""
+        if self.trace_reader is not None:
+            self.trace_reader.close()
+            self.trace_reader = None
+        if self.trace is not None:
+            self.trace.discard()
+            self.trace = None
+
+    def publish(self, error=None):
+        """Publish a snapshot of the current state, merging it with the pending
+        snapshot if the GUI hasn't taken it yet."""
+        interpreter = self.interpreter
+        if interpreter is None:
+            snapshot = Snapshot(self.generation, self.finished_job, None, 0, 0, {}, 0, '', (0, 0), 0, None, error)
+        else:
+            tape = interpreter.tape
+            snapshot = Snapshot(
+                generation=self.generation,
+                finished_job=self.finished_job,
+                code_pointer=self.code_pointer,
+                tape_pointer=interpreter.tape_pointer,
+                tape_length=len(tape),
+                cells={cell: tape[cell] for cell in self.dirty},
+                output_start=self.output_start,
+                output=self.output[self.output_start:],
+                input_range=self.reader.consumed_range(),
+                instruction_count=interpreter.instruction_count,
+                recorded_steps=None if self.trace is None else self.trace.step_count,
+                error=error,
+            )
+        self.code_pointer = None
+        self.dirty.clear()
+        self.output_start = len(self.output)
+
+        with self._lock:
+            pending = self._pending
+            if pending is not None and pending.generation == snapshot.generation:
+                output_start = min(pending.output_start, snapshot.output_start)
+                snapshot = snapshot._replace(
+                    code_pointer=pending.code_pointer if snapshot.code_pointer is None else snapshot.code_pointer,
+                    cells={**pending.cells, **snapshot.cells},
+                    output_start=output_start,
+                    output=self.output[output_start:],
+                    error=pending.error if snapshot.error is None else snapshot.error,
+                )
+            self._pending = snapshot
+
+    def take_snapshot(self):
+        """Return the latest snapshot and clear it. Return None if there isn't one.
+        Called from the GUI thread."""
+        with self._lock:
+            snapshot = self._pending
+            self._pending = None
+        return snapshot
+
+
+class VisualiserController:
+    """Class that handles the logic behind the visualising commands.
+
+    The interpreter runs on a `VisualiserWorker` thread, so the GUI thread never
+    touches it after it has been created. Commands are sent to the worker as jobs,
+    and the results are displayed from the snapshots that it publishes."""
+
+    INTERPRETER_TYPES = {
+        '.b': (BFInterpreter, BrainfuckVisualiser),
+    }
+
+    # Stop runaway programs before they use up all of the memory
+    RUN_LIMITS = RunLimits(max_cells=1_000_000)
+    # Interval between checking for new snapshots, in milliseconds
+    DISPLAY_INTERVAL = 16
+
+    def __init__(self, master):
+        self.visualiser_master = master
+
+        self.interpreter_type = None
+        self.visualiser = None
+
+        self.interpreter = None
+        # Increased each time the interpreter changes, so stale snapshots can be ignored
+        self.generation = 0
+        self.last_job = 0
+        self.finished_job = 0
+        # Copy of the interpreter's tape, only changed by the GUI thread
+        self.tape = [0]
+
+        self.display_timer = QTimer(master)
+        self.display_timer.setInterval(self.DISPLAY_INTERVAL)
+        self.display_timer.timeout.connect(self.show_snapshot)
+
+        self.worker = VisualiserWorker()
+        self.thread = QThread()
+        self.worker.moveToThread(self.thread)
+        self.thread.start()
+
+    def set_extension(self, extension):
+        """Set the `self.interpreter_type` and `self.visualiser` to the correct ones defined by
+        `extension`. If new `extension` is different, then delete `self.visualiser` and set it to None.
+        If there is no suitable visualiser / interpreter for `extension`, set them to None."""
+        interpreter_type, visualiser_type = self.INTERPRETER_TYPES.get(extension, (None, None))
+        # if isinstance(self.visualiser, visualiser_type):
+        if type(self.visualiser) is visualiser_type:
+            # The new extension is the same as the old one
+            return
+
+        # Delete the current visualiser
+        if self.visualiser is not None:
+            self.visualiser.deleteLater()
+            self.visualiser = None
+            # self.visualiser_master.delete_visualiser()
+
+        if visualiser_type is None:
+            # There is no suitable visualiser / interpreter for the extension
+            self.interpreter_type = None
+            self.visualiser = None
+        else:
+            self.interpreter_type = interpreter_type
+            self.visualiser = visualiser_type(self.visualiser_master)
+
+            self.visualiser_master.set_visualiser(self.visualiser)
+            self.visualiser_master.layout_manager.input_text.set_extension(extension)
+
+    def step(self):
+        """Step one instruction. If `self.interpreter` is None, then initialise it."""
+        self.jump(1, 1)
+
+    def back(self):
+        """Step back one instruction."""
+        self.jump(-1, 1)
+
+    def jump_forwards(self, steps):
+        self.jump(1, steps)
+
+    def jump_backwards(self, steps):
+        self.jump(-1, steps)
+
+    def run_for(self, budget):
+        """Keep stepping forwards, only running for `budget` seconds of each frame,
+        until interrupted or an error occurs."""
+        self.jump(1, sys.maxsize, budget)
+
+    def jump(self, direction, steps, budget=None):
+        """Interrupt any running job, then request a job to step `steps` times in `direction`.
+        The result is displayed once the worker publishes it."""
+        if self.interpreter is None:
+            if not self.restart_interpreter():
+                return
+
+        self.interrupt()
+        self.last_job += 1
+        self.worker.job_requested.emit(self.last_job, direction, steps, budget,
+                                       self.visualiser_master.get_input_text())
+        self.display_timer.start()
+
+    def scrub_to(self, instruction_count):
+        """Interrupt any running job, then jump to the state after `instruction_count`
+        steps using the execution trace."""
+        if self.interpreter is None:
+            return
+
+        self.interrupt()
+        self.last_job += 1
+        self.worker.scrub_requested.emit(self.last_job, instruction_count,
+                                         self.visualiser_master.get_input_text())
+        self.display_timer.start()
+
+    def is_busy(self):
+        """Return whether the worker is still running a requested job."""
+        return self.finished_job < self.last_job
+
+    def interrupt(self):
+        """Cancel all the jobs that have been requested so far, including a running one."""
+        self.worker.cancelled_job = self.last_job
+
+    def stop(self):
+        """Stop the interpreter. self `self.interpreter` to None"""
+        self.interrupt()
+        self.interpreter = None
+        self.generation += 1
+        self.finished_job = self.last_job
+        self.worker.session_requested.emit(None, None, None, self.generation)
+
+    def shutdown(self):
+        """Stop the worker thread. Called when the visualiser is destroyed."""
+        if self.thread is None:
+            return
+        self.interrupt()
+        self.thread.quit()
+        self.thread.wait()
+        self.thread = None
+        # The thread has finished, so the worker can be used from this thread
+        self.worker.close_trace()
+
+    def restart_interpreter(self):
+        """Initaliser `self.interpreter`. Reset `self.visualiser` and `self.visualiser_master`.
+        Return True if creating an interpreter was successful else False."""
+        self.stop()
+        self.visualiser.reset_tape()
+        self.visualiser_master.restart()
+
+        reader = InputReader(self.visualiser_master.get_input_decoder())
+        try:
+            self.interpreter = self.interpreter_type(self.visualiser_master.get_code_text(),
+                                                     input_func=reader.next_,
+                                                     undo_input_func=reader.prev,
+                                                     output_func=self.worker.record_output,
+                                                     limits=self.RUN_LIMITS,
+                                                     brackets=self.visualiser_master.get_bracket_table())
+        except ProgramSyntaxError as error:
+            self.handle_error(error)
+            return False
+
+        trace = None
+        if self.visualiser_master.trace_enabled():
+            trace = TraceWriter.temporary(self.interpreter, reader.consumed_range())
+
+        self.tape = list(self.interpreter.tape)
+        self.visualiser.reset_tape(self.tape)
+        self.worker.session_requested.emit(self.interpreter, reader, trace, self.generation)
+        self.visualiser_master.set_trace_position(0, None if trace is None else 0)
+        return True
+
+    def show_snapshot(self):
+        """Called by `self.display_timer`. Display the latest snapshot published by
+        the worker, and stop the timer once there are no jobs left."""
+        snapshot = self.worker.take_snapshot()
+        if snapshot is not None and snapshot.generation == self.generation:
+            self.finished_job = max(self.finished_job, snapshot.finished_job)
+            self.display_snapshot(snapshot)
+        if not self.is_busy():
+            self.display_timer.stop()
+
+    def display_snapshot(self, snapshot):
+        """Update the visualiser, code highlighting, output and input from `snapshot`."""
+        tape = self.tape
+        if snapshot.tape_length > len(tape):
+            tape.extend([0] * (snapshot.tape_length - len(tape)))
+        for cell, value in snapshot.cells.items():
+            tape[cell] = value
+        self.visualiser.add_visual(snapshot.tape_pointer, snapshot.cells)
+        self.visualiser.set_visuals()
+
+        if snapshot.code_pointer is not None:
+            self.visualiser_master.set_current_code_pointer(snapshot.code_pointer)
+            self.visualiser_master.highlight_current_code_pointer()
+        self.visualiser_master.set_output(snapshot.output_start, snapshot.output)
+        self.visualiser_master.display_output()
+        self.visualiser_master.set_consumed_input(*snapshot.input_range)
+        self.visualiser_master.set_trace_position(snapshot.instruction_count, snapshot.recorded_steps)
+
+        if snapshot.error is not None:
+            self.handle_error(snapshot.error)
+
+    def handle_error(self, error):
+        """Handle any `InterpreterError` raised by `self.interpreter`"""
+        if isinstance(error, ExecutionEndedError):
+            message = 'Execution finished'
+        elif isinstance(error, NoPreviousExecutionError):
+            message = 'No previous execution'
+        elif isinstance(error, NoInputError):
+            message = 'Enter input'
+        elif isinstance(error, ProgramError):
+            error_type = error.error
+            if error_type is ErrorTypes.UNMATCHED_OPEN_PAREN:
+                message = 'Unmatched opening parentheses'
+            elif error_type is ErrorTypes.UNMATCHED_CLOSE_PAREN:
+                message = 'Unmatched closing parentheses'
+            elif error_type is ErrorTypes.INVALID_TAPE_CELL:
+                message = 'Tape pointer out of bounds'
+            elif error_type is ErrorTypes.INSTRUCTION_LIMIT_EXCEEDED:
+                message = 'Instruction limit exceeded'
+            elif error_type is ErrorTypes.TIME_LIMIT_EXCEEDED:
+                message = 'Time limit exceeded'
+            elif error_type is ErrorTypes.MEMORY_LIMIT_EXCEEDED:
+                message = 'Memory limit exceeded'
+            else:
+                raise error
+            if error.location is not None:
+                source_map = SourceMap(self.visualiser_master.get_code_text())
+                message += f' at {source_map.describe(error.location)}'
+        else:
+            raise error
+
+        self.visualiser_master.pause_command()
+        self.visualiser_master.display_error_text(message)
+        self.visualiser_master.highlight_current_code_pointer()
+
+
+class VisualiserMaster(QWidget):
+
+    # Interval of the running timer in fast mode, in milliseconds
+    FRAME_INTERVAL = 16
+    # Maximum time spent running the interpreter in each frame, in seconds
+    FRAME_BUDGET = 0.012
+
+    def __init__(self, text_editor, code_text):
+        super().__init__(text_editor)
+
+        self.text_editor = text_editor
+        self.code_text = code_text
+        self.text_cursor = code_text.textCursor()
+
+        self.visualiser_controller = VisualiserController(self)
+
+        self.highlight_format = QTextCharFormat()
+        self.highlight_format.setBackground(QColor(Qt.gray))
+
+        self.output = ''
+        self.displayed_output = ''
+
+        self.init_widgets()
+        self.stop_command()
+
+        self.set_runspeed()
+
+        self.destroyed.connect(self.visualiser_controller.shutdown)
+        QApplication.instance().aboutToQuit.connect(self.visualiser_controller.shutdown)
+
+    def init_widgets(self):
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.run_signal)
+        self.timer.setInterval(10)
+
+        layout = VisualiserLayoutManager()
+        self.setLayout(layout)
+        self.layout_manager = layout
+
+        layout.run_button.clicked.connect(self.run_command)
+        layout.continue_button.clicked.connect(self.run_command)
+        layout.step_button.clicked.connect(self.step_command)
+        layout.pause_button.clicked.connect(self.pause_command)
+        layout.back_button.clicked.connect(self.back_command)
+        layout.stop_button.clicked.connect(self.stop_command)
+
+        layout.jump_forwards_button.clicked.connect(lambda: self.jump_command(1))
+        layout.jump_backwards_button.clicked.connect(lambda: self.jump_command(-1))
+
+        layout.speed_slider.valueChanged.connect(self.set_runspeed)
+        layout.speed_checkbox.stateChanged.connect(self.set_runspeed)
+
+        layout.trace_slider.valueChanged.connect(self.scrub_command)
+
+    def set_visualiser(self, visualiser):
+        self.layout_manager.set_visualiser(visualiser)
+
+    def restart(self):
+        """Restart the visualising. <- Not a great description.
+        Disables the code text."""
+        self.set_current_code_pointer(0, length=0)
+        self.layout_manager.input_text.restart()
+        self.set_output(0, '')
+        self.display_output()
+        self.code_text.setReadOnly(True)
+        # self.code_text.setExtraSelections([])  # Remove the currenly highlighlied line. For some reason, Focus is not lost or something so it isn't called in the code_text
+
+    def set_extension(self, extension):
+        """Set the current file extension."""
+        self.visualiser_controller.set_extension(extension)
+
+    def visualise(self):
+        """Assert that the current file is valid for visualising."""
+        if self.visualiser_controller.interpreter_type is None:
+            raise Exception('Invalid extension. No visualiser.')
+
+    def get_code_text(self):
+        """Return the current text in `self.code_text`"""
+        return self.code_text.toPlainText()
+
+    def get_bracket_table(self):
+        """Return the bracket table of the current code."""
+        return self.text_editor.get_bracket_table()
+
+    def run_command(self):
+        """Called when `self.run_button` pressed.
+        Start the running timer."""
+        self.layout_manager.display_running()
+        self.timer.start()
+        self.run_signal()
+
+    def step_command(self):
+        """Called when `self.step_button` pressed.
+        Step forwards once."""
+        self.layout_manager.display_paused()
+        self.visualiser_controller.step()
+
+    def pause_command(self):
+        """Called when `self.pause_button` pressed.
+        Pause the running timer and interrupt any running job."""
+        self.layout_manager.display_paused()
+        self.timer.stop()
+        self.visualiser_controller.interrupt()
+
+    def back_command(self):
+        """Called when `self.back_button` pressed.
+        Step backwards once."""
+        self.layout_manager.display_paused()
+        self.visualiser_controller.back()
+
+    def stop_command(self):
+        """Called when `self.stop_button` pressed.
+        Stop execution."""
+        self.layout_manager.display_stopped()
+        self.timer.stop()
+        self.visualiser_controller.stop()
+
+        self.layout_manager.input_text.restart()
+        self.code_text.setReadOnly(False)
+        self.remove_command_highlights()
+        self.set_trace_position(0, None)
+
+    def jump_command(self, direction):
+        self.pause_command()
+        try:
+            steps = int(self.layout_manager.jump_input.text())
+        except ValueError:
+            self.display_error_text('Invalid jump steps')
+        else:
+            if direction == 1:
+                self.visualiser_controller.jump_forwards(steps)
+            else:
+                self.visualiser_controller.jump_backwards(steps)
+
+    def scrub_command(self, instruction_count):
+        """Called when `self.trace_slider` is moved by the user.
+        Jump to the state after `instruction_count` steps."""
+        self.layout_manager.display_paused()
+        self.timer.stop()
+        self.visualiser_controller.scrub_to(instruction_count)
+
+    def set_runspeed(self, *args):
+        """Set the interval of the running timer. If fast mode is checked, then each
+        frame runs for as long as the slider allows, up to `FRAME_BUDGET` seconds,
+        and only the final state is displayed."""
+        value = self.layout_manager.speed_slider.value() + 1
+        if self.layout_manager.speed_checkbox.isChecked():
+            runspeed = self.FRAME_INTERVAL
+            self.frame_budget = self.FRAME_BUDGET * value / 100
+        else:
+            runspeed = int(1000 / (value * value * .0098 + 1))
+            self.frame_budget = None
+        self.timer.setInterval(runspeed)
+
+    def run_signal(self):
+        """Signal emmitted by timer. Step once, or in fast mode, keep running
+        with `self.frame_budget` of each frame. Does nothing if the last job
+        hasn't finished yet."""
+        if self.visualiser_controller.is_busy():
+            return
+        if self.frame_budget is None:
+            self.visualiser_controller.jump_forwards(1)
+        else:
+            self.visualiser_controller.run_for(self.frame_budget)
+
+    def remove_command_highlights(self):
+        """Remove the command highlighting."""
+        self.code_text.set_overlay('code_pointer', [])
+
+    def set_current_code_pointer(self, code_pointer, length=1):
+        """Sets start index and length of the current code pointer."""
+        self.current_code_pointer = (code_pointer, length)
+
+    def highlight_current_code_pointer(self):
+        """Highlight the current command with an extra selection. The document
+        itself is not changed."""
+        code_pointer, length = self.current_code_pointer
+        end = code_pointer + length
+
+        # Can't have a negative index. Should only ever be a negative index if it
+        # is the 0th instruction. If it is negative, set it to 0, but don't change
+        # the end location
+        if code_pointer < 0:
+            code_pointer = 0
+
+        self.text_cursor.setPosition(code_pointer)
+        self.text_cursor.setPosition(end, QTextCursor.KeepAnchor)
+
+        selection = QTextEdit.ExtraSelection()
+        selection.cursor = self.text_cursor
+        selection.format = self.highlight_format
+        self.code_text.set_overlay('code_pointer', [selection])
+
+    def set_output(self, start, text):
+        """Replace the output from index `start` onwards with `text`.
+        It isn't shown until `display_output` is called."""
+        self.output = self.output[:start] + text
+
+    def display_output(self):
+        """Show the output set by `set_output`, if it has changed. If text has only
+        been added to the end, then only the new text is inserted."""
+        if self.output == self.displayed_output:
+            return
+
+        output_text = self.layout_manager.output_text
+        if self.displayed_output and self.output.startswith(self.displayed_output):
+            output_text.moveCursor(QTextCursor.End)
+            output_text.insertPlainText(self.output[len(self.displayed_output):])
+        else:
+            output_text.setPlainText(self.output)
+        output_text.verticalScrollBar().triggerAction(QScrollBar.SliderToMaximum)
+        self.displayed_output = self.output
+
+    def get_input_text(self):
+        """Return the current text in `self.input_text`"""
+        return self.layout_manager.input_text.toPlainText()
+
+    def get_input_decoder(self):
+        """Return the decoder used to read the input."""
+        return self.layout_manager.input_text.decoder
+
+    def set_consumed_input(self, start, end):
+        """Highlight the input between `start` and `end` as the last consumed input."""
+        self.layout_manager.input_text.set_consumed(start, end)
+
+    def trace_enabled(self):
+        """Return whether the execution should be recorded to a trace."""
+        return self.layout_manager.trace_checkbox.isChecked()
+
+    def set_trace_position(self, instruction_count, recorded_steps):
+        """Show `instruction_count` on the trace slider, which can scrub through the
+        `recorded_steps` steps of the trace. If `recorded_steps` is None, then there
+        isn't a trace and the slider is disabled."""
+        slider = self.layout_manager.trace_slider
+        label = self.layout_manager.trace_label
+        slider.blockSignals(True)
+        if recorded_steps is None:
+            slider.setEnabled(False)
+            slider.setRange(0, 0)
+            label.clear()
+        else:
+            # QSlider only takes 32 bit ints
+            slider.setEnabled(True)
+            slider.setRange(0, min(recorded_steps, 2**31 - 1))
+            slider.setValue(min(instruction_count, 2**31 - 1))
+            label.setText(f'Step {instruction_count:,} of {recorded_steps:,}')
+        slider.blockSignals(False)
+
+    def display_error_text(self, text):
+        self.layout_manager.display_error_text(text)
+
+    def hide_error_text(self):
+        self.layout_manager.hide_error_text()